@@ -0,0 +1,101 @@
+"""
+Concurrency benchmark for the /chat/ endpoint.
+
+Fires `--requests` chat calls with `--concurrency` in flight at once, while a
+side thread keeps probing /sessions. With a blocking chat handler the probe
+latency climbs to the LLM latency; with the async handler it stays flat.
+
+    uvicorn main:app --workers 1
+    python benchmarks/chat_concurrency.py --url http://127.0.0.1:8000 --concurrency 16 --requests 64
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+
+def timed_call(url: str, method: str = "GET", timeout: float = 300):
+    st = time.perf_counter()
+    ok = True
+    try:
+        with urlopen(Request(url, method=method), timeout=timeout) as resp:
+            resp.read()
+            ok = resp.status < 400
+    except Exception:
+        ok = False
+    return time.perf_counter() - st, ok
+
+
+def percentiles(samples):
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+    return {
+        "n": len(ordered),
+        "p50_ms": round(cuts[49] * 1000, 1),
+        "p99_ms": round(cuts[98] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--query", default="What is the leave policy?")
+    parser.add_argument("--sources", default="Document Source")
+    parser.add_argument("--model", default="openai")
+    args = parser.parse_args()
+
+    def chat(_):
+        params = urlencode({
+            "user_query": args.query,
+            "thread_id": f"bench-{uuid.uuid4().hex}",
+            "sources": args.sources,
+            "model": args.model,
+        })
+        return timed_call(f"{args.url}/chat/?{params}", method="POST")
+
+    probe_latencies = []
+    stop = threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            elapsed, ok = timed_call(f"{args.url}/sessions?limit=1")
+            if ok:
+                probe_latencies.append(elapsed)
+            time.sleep(0.2)
+
+    prober = threading.Thread(target=probe, daemon=True)
+    prober.start()
+
+    st = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(chat, range(args.requests)))
+    wall = time.perf_counter() - st
+
+    stop.set()
+    prober.join()
+
+    chat_latencies = [elapsed for elapsed, ok in results if ok]
+    report = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": sum(1 for _, ok in results if not ok),
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(chat_latencies) / wall, 2) if wall else 0,
+        "chat": percentiles(chat_latencies),
+        "sessions_probe": percentiles(probe_latencies),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Local stand-in for the Azure OpenAI embeddings endpoint.
+
+Returns deterministic vectors, with optional latency and a requests-per-second
+limit that answers 429 + retry-after-ms, so the embedding client's packing,
+concurrency and backoff can be exercised without Azure.
+
+    python benchmarks/stub_embedding_server.py --port 8089 --latency-ms 150 --rps 5
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 python benchmarks/stub_embedding_server.py --bench 5000
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dim: int):
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((seed[i % len(seed)] + i) % 255) / 255.0 for i in range(dim)]
+
+
+def make_handler(args):
+    lock = threading.Lock()
+    window = {"start": time.monotonic(), "count": 0}
+    counters = {"requests": 0, "inputs": 0, "throttled": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *_):
+            pass
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._send(200, counters)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+
+            with lock:
+                now = time.monotonic()
+                if now - window["start"] >= 1.0:
+                    window["start"], window["count"] = now, 0
+                window["count"] += 1
+                over = args.rps and window["count"] > args.rps
+                retry_ms = int((1.0 - (now - window["start"])) * 1000)
+                counters["requests"] += 1
+
+            if over:
+                counters["throttled"] += 1
+                return self._send(429, {"error": {"code": "429", "message": "Rate limit"}},
+                                  {"retry-after-ms": str(max(retry_ms, 1))})
+
+            if len(inputs) > args.max_inputs:
+                return self._send(400, {"error": {"message": f"Too many inputs: {len(inputs)}"}})
+
+            time.sleep(args.latency_ms / 1000)
+            counters["inputs"] += len(inputs)
+            tokens = sum(len(text) // 4 + 1 for text in inputs)
+            self._send(200, {
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text, args.dim)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            }, {"x-ratelimit-remaining-requests": str(max(0, (args.rps or 1000) - window["count"]))})
+
+    return Handler
+
+
+def bench(n: int):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from custom_utils.embedding_client import get_embedding_client
+
+    client = get_embedding_client()
+    texts = [f"chunk {i} " + "lorem ipsum dolor sit amet " * 40 for i in range(n)]
+    st = time.perf_counter()
+    embeddings = client.embed(texts)
+    elapsed = time.perf_counter() - st
+    assert len(embeddings) == n and all(embeddings)
+    print(f"{n} chunks in {elapsed:.2f}s")
+    print(json.dumps(client.stats(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--rps", type=int, default=0, help="requests per second before 429 (0 = unlimited)")
+    parser.add_argument("--max-inputs", type=int, default=2048)
+    parser.add_argument("--bench", type=int, default=0, help="embed N chunks via AZURE_OPENAI_ENDPOINT instead of serving")
+    args = parser.parse_args()
+
+    if args.bench:
+        return bench(args.bench)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"Stub embedding server on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
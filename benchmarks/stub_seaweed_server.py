@@ -0,0 +1,186 @@
+"""
+Local stand-in for the SeaweedFS filer.
+
+Accepts multipart POST uploads, sized or chunked (stored in memory), GET/DELETE of stored files
+and the filer's paged JSON directory listing (Accept: application/json,
+limit/lastFileName), with optional latency and injected 503s, so utils.seaweed's pooling, streaming and retries can be exercised
+without Railway.
+
+    python benchmarks/stub_seaweed_server.py --port 8888 --latency-ms 50 --fail-every 5
+    SEAWEED_URL=http://127.0.0.1:8888 python benchmarks/stub_seaweed_server.py --bench 20 --size-mb 5
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+def make_handler(args):
+    lock = threading.Lock()
+    files = {}
+    mtimes = {}
+    counters = {"uploads": 0, "bytes": 0, "connections": 0, "failed": 0, "requests": 0, "listings": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_):
+            pass
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counters["connections"] += 1
+
+        def _send(self, status, body: bytes, content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _path(self):
+            return unquote(urlsplit(self.path).path)
+
+        def do_GET(self):
+            if self.path == "/_stats":
+                return self._send(200, json.dumps(counters).encode("utf-8"))
+            path = self._path()
+            if path.endswith("/") and "application/json" in self.headers.get("Accept", ""):
+                return self._list(path)
+            if path not in files:
+                return self._send(404, b'{"error":"not found"}')
+            self._send(200, files[path], "application/octet-stream")
+
+        def _list(self, folder):
+            query = parse_qs(urlsplit(self.path).query)
+            limit = int(query.get("limit", ["100"])[0])
+            last = query.get("lastFileName", [""])[0]
+            with lock:
+                counters["listings"] += 1
+                names = sorted(
+                    path[len(folder):] for path in files
+                    if path.startswith(folder) and "/" not in path[len(folder):]
+                )
+            names = [name for name in names if name > last]
+            page = names[:limit]
+            entries = [{
+                "FullPath": folder + name,
+                "Mtime": mtimes[folder + name],
+                "Mode": 432,
+                "FileSize": len(files[folder + name]),
+                "Md5": hashlib.md5(files[folder + name]).hexdigest(),
+            } for name in page]
+            self._send(200, json.dumps({
+                "Path": folder.rstrip("/"),
+                "Entries": entries or None,
+                "Limit": limit,
+                "LastFileName": page[-1] if page else "",
+                "ShouldDisplayLoadMore": len(names) > limit,
+            }).encode("utf-8"))
+
+        def do_DELETE(self):
+            files.pop(self._path(), None)
+            self._send(202, b"{}")
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            with lock:
+                counters["requests"] += 1
+                fail = args.fail_every and counters["requests"] % args.fail_every == 0
+
+            # Drain the body in blocks; only the file part is kept
+            boundary = self.headers.get("Content-Type", "").split("boundary=")[-1].encode("utf-8")
+            body = bytearray()
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                # Streamed uploads (utils.seaweed.BlobStream)
+                while True:
+                    size = int(self.rfile.readline().split(b";")[0], 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    body += self.rfile.read(size)
+                    self.rfile.readline()
+            while length:
+                block = self.rfile.read(min(length, 1024 * 1024))
+                if not block:
+                    break
+                body += block
+                length -= len(block)
+
+            if fail:
+                with lock:
+                    counters["failed"] += 1
+                return self._send(503, b'{"error":"injected failure"}')
+
+            time.sleep(args.latency_ms / 1000)
+            start = body.find(b"\r\n\r\n") + 4
+            end = body.rfind(b"\r\n--" + boundary)
+            data = bytes(body[start:end])
+            with lock:
+                files[self._path()] = data
+                mtimes[self._path()] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                counters["uploads"] += 1
+                counters["bytes"] += len(data)
+            self._send(201, json.dumps({
+                "name": os.path.basename(self._path()),
+                "size": len(data),
+                "eTag": hashlib.md5(data).hexdigest(),
+            }).encode("utf-8"))
+
+    return Handler
+
+
+def bench(n: int, size_mb: float):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import requests
+    from utils.seaweed import get_seaweed_client
+
+    client = get_seaweed_client()
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n):
+            path = os.path.join(tmp, f"bench-{i}.bin")
+            with open(path, "wb") as f:
+                f.write(os.urandom(int(size_mb * 1024 * 1024)))
+            paths.append(path)
+
+        st = time.perf_counter()
+        for path in paths:
+            with open(path, "rb") as f:
+                requests.post(client.url_for(path), files={"file": (os.path.basename(path), f)}).raise_for_status()
+        print(f"requests.post, one by one: {n} files in {time.perf_counter() - st:.2f}s")
+
+        st = time.perf_counter()
+        for future in [client.upload_async(path) for path in paths]:
+            future.result()
+        print(f"pooled streaming client:   {n} files in {time.perf_counter() - st:.2f}s")
+    print(json.dumps(client.stats(), indent=2))
+    print(json.dumps(client.session.get(f"{client.base_url}/_stats").json(), indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth upload with 503 (0 = never)")
+    parser.add_argument("--bench", type=int, default=0, help="upload N files via SEAWEED_URL instead of serving")
+    parser.add_argument("--size-mb", type=float, default=1.0, help="file size for --bench")
+    args = parser.parse_args()
+
+    if args.bench:
+        return bench(args.bench, args.size_mb)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args))
+    print(f"Stub SeaweedFS filer on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
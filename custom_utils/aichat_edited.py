@@ -1,6 +1,8 @@
 import os
 import uuid
 import json
+import hashlib
+from typing import Optional
 from pathlib import Path
 # from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.checkpoint.memory import InMemorySaver, MemorySaver
@@ -16,12 +18,16 @@ from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from langchain.agents import create_agent
+from langchain.chat_models import init_chat_model
 from langchain.tools import tool
+from langchain_core.tools import StructuredTool
+from langchain_core.runnables import RunnableLambda
 
 from psycopg_pool import ConnectionPool
 
 from custom_utils.pgsql_checkpointer import PostgresCheckpointSaver
-from custom_utils.vector import retrive
+from custom_utils.vector import search, asearch
+from utils.lru import LRUCache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -145,8 +151,18 @@ web_prompt = """You are a **Friendly, Witty, and Knowledgeable AI Companion**. Y
 """
 
 
-@tool
-def data_retriever(user_request: str):
+def _retrieval_result(existing_content):
+    try:
+        print(existing_content[0])
+        print(existing_content[0][1])
+        score = 1 - existing_content[0][1]
+        print(score)
+    except:
+        score = None
+    return existing_content, score
+
+
+def _data_retriever(user_request: str):
     """
     Retrieves existing content from vector DB based on user request.
 
@@ -161,19 +177,31 @@ def data_retriever(user_request: str):
     print("user_request:\n", user_request)
     print()
     try:
-        existing_content = retrive(user_request)
-        try:
-            print(existing_content[0])
-            print(existing_content[0][1])
-            score = 1 - existing_content[0][1]
-            print(score)
-        except:
-            score = None
-        return existing_content, score
+        return _retrieval_result(search(user_request))
+
+    except:
+        return "❌ Error retrieving content"
+
+
+async def _adata_retriever(user_request: str):
+    print("data_retriever (async)\n")
+    print("user_request:\n", user_request)
+    try:
+        return _retrieval_result(await asearch(user_request))
 
     except:
         return "❌ Error retrieving content"
 
+
+# Sync + async implementations: agent.ainvoke awaits the coroutine
+# instead of parking a thread-pool worker on the sync version
+data_retriever = StructuredTool.from_function(
+    func=_data_retriever,
+    coroutine=_adata_retriever,
+    name="data_retriever",
+    description=_data_retriever.__doc__,
+)
+
 DB_URL = os.getenv("PG_VECTOR")
 _checkpointer = PostgresCheckpointSaver(postgres_url=DB_URL)
 
@@ -186,20 +214,69 @@ openai_model = AzureChatOpenAI(
 )
 
 
-def get_graph(source: bool, model: int):
+# --- Graph / LLM cache ---
+# Compiled graphs are keyed by (source, model, prompt version), so building
+# the agent drops out of the per-request path and switching models still
+# gets the right graph. Bump by editing the prompt text (the version is its hash).
 
-    print("use Document Source" if source else "use Web Source")
-    tool, prompt = ([data_retriever], doc_prompt) if source else (
-        [], web_prompt)
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "8"))
 
-    llm = {
+PROMPT_VERSIONS = {
+    True: hashlib.sha1(doc_prompt.encode("utf-8")).hexdigest()[:12],
+    False: hashlib.sha1(web_prompt.encode("utf-8")).hexdigest()[:12],
+}
+
+_graph_cache = LRUCache(maxsize=GRAPH_CACHE_SIZE)
+_llm_cache = LRUCache(maxsize=GRAPH_CACHE_SIZE)
+
+
+def _get_llm(model: int):
+    """Chat model client for the UI model index, created once and reused."""
+    spec = {
         0: "google_genai:gemini-2.5-flash",
         1: "groq:openai/gpt-oss-120b",
         2: openai_model,
         3: "ollama:glm-4.6:cloud"
     }.get(model, "ollama:glm-4.6:cloud")
 
-    print(llm, DB_URL[-20:])
+    if not isinstance(spec, str):
+        return spec
+    return _llm_cache.get_or_set(spec, lambda: init_chat_model(spec))
+
+
+def invalidate_graphs(source: Optional[bool] = None, model: Optional[int] = None) -> int:
+    """
+    Drops cached graphs matching source/model (None = any). Returns the count.
+    """
+    dropped = _graph_cache.invalidate(
+        lambda key: (source is None or key[0] == source)
+        and (model is None or key[1] == model)
+    )
+    if source is None and model is None:
+        _llm_cache.invalidate()
+    print(f"♻️ Invalidated {dropped} cached graph(s)")
+    return dropped
+
+
+def graph_cache_stats():
+    return {"graphs": _graph_cache.stats(), "llms": _llm_cache.stats()}
+
+
+def get_graph(source: bool, model: int):
+
+    print("use Document Source" if source else "use Web Source")
+    key = (bool(source), model, PROMPT_VERSIONS[bool(source)])
+    return _graph_cache.get_or_set(key, lambda: _build_graph(bool(source), model))
+
+
+def _build_graph(source: bool, model: int):
+
+    tool, prompt = ([data_retriever], doc_prompt) if source else (
+        [], web_prompt)
+
+    llm = _get_llm(model)
+
+    print("🔧 building graph:", llm, DB_URL[-20:])
 
     agent = create_agent(
         name="agent",
@@ -229,9 +306,20 @@ def get_graph(source: bool, model: int):
 
         return {"messages": response["messages"]}
 
+    async def acall_rag_agent(state: MessagesState):
+        """Async twin of call_rag_agent, used by graph.astream / ainvoke."""
+        messages = state.get("messages", [])
+
+        if not messages:
+            return {"messages": []}
+
+        response = await agent.ainvoke({"messages": messages})
+
+        return {"messages": response["messages"]}
+
     # Build graph
     builder = StateGraph(MessagesState)
-    builder.add_node("call_rag_agent", call_rag_agent)
+    builder.add_node("call_rag_agent", RunnableLambda(call_rag_agent, afunc=acall_rag_agent))
     builder.add_edge(START, "call_rag_agent")
 
     _graph = builder.compile(checkpointer=_checkpointer)
@@ -263,3 +351,30 @@ def RAG_agent(user_message: str, thread_id: str, source: bool, model: int, user_
         result_text = msg.content
 
     return result_text
+
+
+async def aRAG_agent(user_message: str, thread_id: str, source: bool, model: int, user_id="1"):
+    """
+    Async RAG_agent: LLM, retriever and checkpointer I/O are awaited, so one
+    slow conversation doesn't stall the other requests on the worker.
+    """
+    graph = get_graph(source, model)
+
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "user_id": user_id,
+        }
+    }
+    print("config:\n", config)
+    result_text = ""
+    async for chunk in graph.astream(
+        {"messages": [HumanMessage(content=user_message)]},
+        config,
+        stream_mode="values"
+    ):
+        msg = chunk["messages"][-1]
+        print("msge out\n"*3, f"{msg.content[:100]}...")
+        result_text = msg.content
+
+    return result_text
@@ -0,0 +1,223 @@
+import io
+import os
+import json
+from typing import Optional, List, Dict, Any
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Bulk writer for the 'documents' table ---
+#
+# Streams chunk rows into 'documents' with COPY instead of one ORM INSERT per
+# chunk. Each batch is its own transaction, and a document's rows are always
+# written in chunk order, so after a failure the number of rows already
+# stored for that document_id is exactly how many chunks to skip on retry.
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# auto | copy_binary | copy_text | executemany
+BULK_WRITE_METHOD = os.getenv("BULK_WRITE_METHOD", "auto")
+
+COLUMNS = ("document_id", "document_name", "chunk_index", "chunk_text", "embedding", "metadata")
+COPY_SQL = f"COPY documents ({', '.join(COLUMNS)}) FROM STDIN"
+
+
+def stored_chunk_count(engine: Engine, document_id: str) -> int:
+    """Rows already committed for `document_id`, i.e. chunks to skip when resuming."""
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT count(*) FROM documents WHERE document_id = :document_id"),
+            {"document_id": document_id}
+        ).scalar() or 0
+
+
+def _copy_text_value(value) -> str:
+    if value is None:
+        return r"\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _vector_literal(embedding) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+
+def copy_text_payload(rows: List[tuple]) -> str:
+    """Rows rendered in COPY text format (tab-separated, backslash-escaped)."""
+    lines = []
+    for document_id, document_name, chunk_index, chunk_text, embedding, metadata in rows:
+        lines.append("\t".join((
+            _copy_text_value(document_id),
+            _copy_text_value(document_name),
+            _copy_text_value(chunk_index),
+            _copy_text_value(chunk_text),
+            _copy_text_value(None if embedding is None else _vector_literal(embedding)),
+            _copy_text_value(None if metadata is None else json.dumps(metadata, default=str)),
+        )))
+    return "\n".join(lines) + "\n"
+
+
+def _pick_method(engine: Engine, method: str) -> str:
+    if method != "auto":
+        return method
+
+    driver = engine.dialect.driver
+    if driver == "psycopg":
+        try:
+            import pgvector.psycopg  # noqa: F401
+            return "copy_binary"
+        except ImportError:
+            return "copy_text"
+    if driver == "psycopg2":
+        return "copy_text"
+    return "executemany"
+
+
+class DocumentBulkWriter:
+    """
+    Buffers chunk rows for one document and writes them BULK_BATCH_SIZE at a
+    time, committing after every batch.
+
+        with DocumentBulkWriter(engine, document_id, file_name) as writer:
+            for index, (chunk, embedding, metadata) in enumerate(chunks):
+                if index < writer.resume_from:
+                    continue
+                writer.add(index, chunk, embedding, metadata)
+
+    resume_from: rows this document already has; skip that many chunks
+                 (before embedding them) when re-running a failed upload.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        document_id: str,
+        document_name: str,
+        batch_size: int = BULK_BATCH_SIZE,
+        method: str = BULK_WRITE_METHOD
+    ):
+        self.engine = engine
+        self.document_id = document_id
+        self.document_name = document_name
+        self.batch_size = batch_size
+        self.method = _pick_method(engine, method)
+
+        self.resume_from = stored_chunk_count(engine, document_id)
+        self.written = 0
+        self.batches = 0
+        self._rows: List[tuple] = []
+        self._raw = None
+
+    # --- buffering ---
+
+    def add(self, chunk_index: int, chunk_text: str, embedding, metadata: Optional[Dict[str, Any]] = None):
+        self._rows.append((self.document_id, self.document_name, chunk_index, chunk_text, embedding, metadata))
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Writes and commits the buffered rows. Returns how many were written."""
+        if not self._rows:
+            return 0
+
+        rows = self._rows
+        if self.method == "executemany":
+            self._write_executemany(rows)
+        else:
+            self._write_copy(rows)
+
+        self.written += len(rows)
+        self.batches += 1
+        self._rows = []
+        return len(rows)
+
+    # --- writers ---
+
+    def _connection(self):
+        if self._raw is None:
+            self._raw = self.engine.raw_connection()
+            if self.method == "copy_binary":
+                from pgvector.psycopg import register_vector
+                register_vector(self._raw.driver_connection)
+        return self._raw
+
+    def _write_copy(self, rows: List[tuple]):
+        raw = self._connection()
+        cursor = raw.cursor()
+        try:
+            if self.method == "copy_binary":
+                from psycopg.types.json import Jsonb
+
+                with cursor.copy(f"{COPY_SQL} WITH (FORMAT BINARY)") as copy:
+                    copy.set_types(["text", "text", "int4", "text", "vector", "jsonb"])
+                    for document_id, document_name, chunk_index, chunk_text, embedding, metadata in rows:
+                        copy.write_row((
+                            document_id,
+                            document_name,
+                            chunk_index,
+                            chunk_text,
+                            None if embedding is None else np.asarray(embedding, dtype=np.float32),
+                            None if metadata is None else Jsonb(metadata),
+                        ))
+
+            elif self.engine.dialect.driver == "psycopg":
+                with cursor.copy(COPY_SQL) as copy:
+                    copy.write(copy_text_payload(rows))
+
+            else:
+                cursor.copy_expert(COPY_SQL, io.StringIO(copy_text_payload(rows)))
+
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def _write_executemany(self, rows: List[tuple]):
+        # Plain executemany; psycopg 3 pipelines it, other drivers may loop
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO documents (document_id, document_name, chunk_index, chunk_text, embedding, metadata) "
+                    "VALUES (:document_id, :document_name, :chunk_index, :chunk_text, "
+                    "CAST(:embedding AS vector), CAST(:metadata AS jsonb))"
+                ),
+                [
+                    {
+                        "document_id": document_id,
+                        "document_name": document_name,
+                        "chunk_index": chunk_index,
+                        "chunk_text": chunk_text,
+                        "embedding": None if embedding is None else _vector_literal(embedding),
+                        "metadata": None if metadata is None else json.dumps(metadata, default=str),
+                    }
+                    for document_id, document_name, chunk_index, chunk_text, embedding, metadata in rows
+                ]
+            )
+
+    # --- lifecycle ---
+
+    def close(self):
+        if self._raw is not None:
+            self._raw.close()
+            self._raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            self.close()
+        return False
@@ -0,0 +1,281 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Azure OpenAI embedding client ---
+#
+# One long-lived client for the whole process: a pooled HTTP session, chunks
+# packed into as few requests as the deployment allows, a bounded number of
+# requests in flight, and a shared cooldown when Azure answers 429.
+# Point AZURE_OPENAI_ENDPOINT at benchmarks/stub_embedding_server.py to run
+# it offline.
+
+AZURE_EMBEDDING_DEPLOYMENT = os.getenv("AZURE_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
+AZURE_EMBEDDING_API_VERSION = os.getenv("AZURE_EMBEDDING_API_VERSION", "2024-02-15-preview")
+
+# Provider limits: inputs per request and total tokens per request
+EMBED_MAX_INPUTS = int(os.getenv("EMBED_MAX_INPUTS", "2048"))
+EMBED_MAX_REQUEST_TOKENS = int(os.getenv("EMBED_MAX_REQUEST_TOKENS", "100000"))
+
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_TIMEOUT = float(os.getenv("EMBED_TIMEOUT", "60"))
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(text: str) -> int:
+        return len(_encoding.encode(text, disallowed_special=()))
+
+except Exception:
+    def count_tokens(text: str) -> int:
+        # ~4 characters per token for English; errs on the high side
+        return len(text) // 3 + 1
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+def pack_requests(
+    token_counts: List[int],
+    max_inputs: int = EMBED_MAX_INPUTS,
+    max_tokens: int = EMBED_MAX_REQUEST_TOKENS
+) -> List[List[int]]:
+    """
+    Groups input positions into requests that respect both the input-count
+    and the total-token limit. Order is preserved; an input larger than
+    max_tokens gets a request of its own.
+    """
+    groups, current, current_tokens = [], [], 0
+    for position, tokens in enumerate(token_counts):
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(position)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds to wait, from Azure's retry-after-ms / retry-after headers."""
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+
+class AzureEmbeddingClient:
+    def __init__(
+        self,
+        endpoint: Optional[str] = None,
+        api_key: Optional[str] = None,
+        deployment: str = AZURE_EMBEDDING_DEPLOYMENT,
+        api_version: str = AZURE_EMBEDDING_API_VERSION,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_inputs: int = EMBED_MAX_INPUTS,
+        max_request_tokens: int = EMBED_MAX_REQUEST_TOKENS,
+        max_retries: int = EMBED_MAX_RETRIES,
+        timeout: float = EMBED_TIMEOUT
+    ):
+        endpoint = endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
+        if not endpoint:
+            raise ValueError("AZURE_OPENAI_ENDPOINT environment variable is not set.")
+
+        self.url = f"{endpoint.rstrip('/')}/openai/deployments/{deployment}/embeddings"
+        self.params = {"api-version": api_version}
+        self.concurrency = max(1, concurrency)
+        self.max_inputs = max_inputs
+        self.max_request_tokens = max_request_tokens
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "api-key": api_key or os.getenv("AZURE_OPENAI_API_KEY") or "",
+            "Content-Type": "application/json",
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        # Shared cooldown: one 429 pauses every worker, not just the one that hit it
+        self._paused_until = 0.0
+        self._backoff = 0.0
+
+        self.metrics = {
+            "requests": 0,
+            "inputs": 0,
+            "tokens": 0,
+            "retries": 0,
+            "throttled": 0,
+            "errors": 0,
+            "request_seconds": 0.0,
+            "embed_seconds": 0.0,
+            "throttle_seconds": 0.0,
+            "last_remaining_requests": None,
+            "last_remaining_tokens": None,
+        }
+
+    # --- rate limiting ---
+
+    def _wait_for_cooldown(self):
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            with self._lock:
+                self.metrics["throttle_seconds"] += delay
+            time.sleep(delay)
+
+    def _throttled(self, response: Optional[requests.Response]):
+        with self._lock:
+            # Grow the backoff on consecutive 429s, but prefer the server's hint
+            self._backoff = min(60.0, max(1.0, self._backoff * 2))
+            delay = _retry_after(response) if response is not None else None
+            if delay is None:
+                delay = self._backoff
+            delay += random.uniform(0, 0.25 * delay)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self.metrics["throttled"] += 1
+
+    def _succeeded(self, response: requests.Response):
+        with self._lock:
+            self._backoff = self._backoff / 2 if self._backoff > 1.0 else 0.0
+            remaining = response.headers.get("x-ratelimit-remaining-requests")
+            if remaining is not None:
+                self.metrics["last_remaining_requests"] = remaining
+            remaining = response.headers.get("x-ratelimit-remaining-tokens")
+            if remaining is not None:
+                self.metrics["last_remaining_tokens"] = remaining
+
+    # --- requests ---
+
+    def _post(self, inputs: List[str]) -> List[List[float]]:
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    self.metrics["retries"] += 1
+            self._wait_for_cooldown()
+
+            st = time.perf_counter()
+            response = None
+            try:
+                response = self.session.post(
+                    self.url, params=self.params, json={"input": inputs}, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                last_error = e
+            finally:
+                with self._lock:
+                    self.metrics["requests"] += 1
+                    self.metrics["request_seconds"] += time.perf_counter() - st
+
+            if response is None:
+                self._throttled(None)
+                continue
+
+            if response.status_code == 429 or response.status_code >= 500:
+                last_error = EmbeddingError(f"HTTP {response.status_code}: {response.text[:200]}")
+                self._throttled(response)
+                continue
+
+            if response.status_code >= 400:
+                with self._lock:
+                    self.metrics["errors"] += 1
+                raise EmbeddingError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+            self._succeeded(response)
+            body = response.json()
+            data = sorted(body["data"], key=lambda item: item["index"])
+            with self._lock:
+                self.metrics["inputs"] += len(inputs)
+                self.metrics["tokens"] += (body.get("usage") or {}).get("prompt_tokens", 0)
+            return [item["embedding"] for item in data]
+
+        with self._lock:
+            self.metrics["errors"] += 1
+        raise EmbeddingError(f"Embedding request failed after {self.max_retries} retries: {last_error}")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeddings for `texts`, in order. Inputs are packed into as few
+        requests as the limits allow and sent up to `concurrency` at a time.
+        Raises EmbeddingError if any request ultimately fails.
+        """
+        if not texts:
+            return []
+
+        # Azure rejects empty strings
+        texts = [text if text else " " for text in texts]
+        groups = pack_requests(
+            [count_tokens(text) for text in texts],
+            max_inputs=self.max_inputs,
+            max_tokens=self.max_request_tokens
+        )
+
+        st = time.perf_counter()
+        futures = [
+            self._executor.submit(self._post, [texts[position] for position in group])
+            for group in groups
+        ]
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for group, future in zip(groups, futures):
+            for position, embedding in zip(group, future.result()):
+                embeddings[position] = embedding
+
+        with self._lock:
+            self.metrics["embed_seconds"] += time.perf_counter() - st
+        return embeddings
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.metrics)
+        wall = stats["embed_seconds"]
+        stats["concurrency"] = self.concurrency
+        stats["inputs_per_request"] = round(stats["inputs"] / stats["requests"], 2) if stats["requests"] else 0.0
+        stats["inputs_per_second"] = round(stats["inputs"] / wall, 2) if wall else 0.0
+        stats["tokens_per_second"] = round(stats["tokens"] / wall, 2) if wall else 0.0
+        stats["request_seconds"] = round(stats["request_seconds"], 3)
+        stats["embed_seconds"] = round(wall, 3)
+        stats["throttle_seconds"] = round(stats["throttle_seconds"], 3)
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client: Optional[AzureEmbeddingClient] = None
+_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> AzureEmbeddingClient:
+    """Process-wide embedding client configured from AZURE_* / EMBED_* env vars."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AzureEmbeddingClient()
+    return _client
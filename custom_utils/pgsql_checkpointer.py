@@ -1,13 +1,19 @@
 import json
 import uuid
-from typing import Optional, Dict, Any, Iterator, List, Set
+import asyncio
+import hashlib
+import threading
+import os
+from typing import Optional, Dict, Any, Iterator, AsyncIterator, List, Set, Callable
 from datetime import datetime
 
 # SQLAlchemy Imports
-from sqlalchemy import create_engine, Column, String, Text, Integer, ForeignKey, DateTime
+from sqlalchemy import create_engine, Column, String, Text, Integer, ForeignKey, DateTime, Index, insert, select, update, text, desc
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from sqlalchemy.sql import func
 
+from utils.db_pool import get_engine, maintenance_connection, index_is_valid, drop_invalid_index
+
 # LangChain/LangGraph Imports
 from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointTuple
 from langchain_core.runnables import RunnableConfig
@@ -35,6 +41,11 @@ class LanggraphCheckpoint(Base):
     # Store minimal checkpoint data to resume state
     checkpoint_blob = Column(Text, nullable=False) 
     metadata_blob = Column(Text, default="{}")
+
+    # Rolling summary of messages that fell out of the loaded window
+    # (history_policy="summary_tail"); covers message_number <= summary_upto
+    summary = Column(Text, nullable=True)
+    summary_upto = Column(Integer, nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
@@ -68,6 +79,9 @@ class LanggraphMessage(Base):
     
     # Content
     content = Column(Text, nullable=False)
+
+    # sha256 of "type:content" -- dedup lookups hit an index instead of comparing full text
+    content_hash = Column(String(64), nullable=True)
     
     # Additional knowledge (JSON)
     additional_kwargs = Column(Text, default="{}")
@@ -76,6 +90,99 @@ class LanggraphMessage(Base):
     
     session = relationship("LanggraphCheckpoint", back_populates="messages")
 
+    __table_args__ = (
+        Index("ix_langgraph_messages_thread_hash", "thread_id", "content_hash"),
+        Index("ix_langgraph_messages_thread_number", "thread_id", "message_number"),
+    )
+
+
+def message_hash(m_type: str, content: str) -> str:
+    """Dedup signature stored in LanggraphMessage.content_hash."""
+    return hashlib.sha256(f"{m_type}:{content}".encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(content: str) -> int:
+    """Rough token count (~4 chars/token) used by the token_budget policy."""
+    return len(content or "") // 4 + 4
+
+
+def extractive_summary(previous: Optional[str], messages: List[BaseMessage], max_chars: int = 2000) -> str:
+    """
+    Default summarizer for history_policy="summary_tail": keeps a running list
+    of what the user asked. Swap in an LLM-backed callable for richer summaries.
+    """
+    lines = previous.splitlines() if previous else []
+    for msg in messages:
+        if msg.type == "human" and isinstance(msg.content, str) and msg.content.strip():
+            question = " ".join(msg.content.split())
+            lines.append(f"- User asked: {question[:160]}")
+
+    summary = "\n".join(lines)
+    # Oldest lines go first once the summary outgrows its budget
+    while len(summary) > max_chars and "\n" in summary:
+        summary = summary.split("\n", 1)[1]
+    return summary
+
+
+HISTORY_POLICIES = ("all", "last_n", "token_budget", "summary_tail")
+
+
+# --- Schema migration ---
+#
+# Columns and indexes added after langgraph_messages already held data.
+# Run once per deployment, off the request path:
+#     python -m custom_utils.pgsql_checkpointer
+# The saver only checks that it has been applied.
+
+MIGRATION_BATCH_SIZE = int(os.getenv("CHECKPOINT_MIGRATION_BATCH", "5000"))
+
+MIGRATION_COLUMNS = {
+    "langgraph_messages": (("content_hash", "VARCHAR(64)"),),
+    "langgraph_checkpoints": (("summary", "TEXT"), ("summary_upto", "INTEGER")),
+}
+MIGRATION_INDEXES = {
+    "ix_langgraph_messages_thread_hash": "langgraph_messages (thread_id, content_hash)",
+    "ix_langgraph_messages_thread_number": "langgraph_messages (thread_id, message_number)",
+}
+
+
+def migrate_schema(engine, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Brings existing checkpoint tables up to date and backfills content_hash
+    for rows written before it existed. Indexes are built CONCURRENTLY and
+    the backfill commits every `batch_size` rows, so chats keep writing
+    meanwhile; no statement_timeout applies. Returns rows backfilled.
+    """
+    with maintenance_connection(engine) as conn:
+        Base.metadata.create_all(conn)
+
+        # Nullable, no default: catalog-only, the lock is held for an instant
+        for table, columns in MIGRATION_COLUMNS.items():
+            for column, column_type in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+
+        for name, target in MIGRATION_INDEXES.items():
+            drop_invalid_index(conn, name)
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+
+        # Walk the primary key in bounded batches, one short transaction each
+        filled, last_id = 0, ""
+        while True:
+            ids = conn.execute(text(
+                "SELECT id FROM langgraph_messages WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ), {"last_id": last_id, "limit": batch_size}).scalars().all()
+            if not ids:
+                break
+            filled += conn.execute(text(
+                "UPDATE langgraph_messages "
+                "SET content_hash = encode(sha256(convert_to(type || ':' || content, 'UTF8')), 'hex') "
+                "WHERE id = ANY(:ids) AND content_hash IS NULL"
+            ), {"ids": list(ids)}).rowcount
+            last_id = ids[-1]
+
+    print(f"✅ Checkpoint schema migrated, {filled} message hashes backfilled")
+    return filled
+
 
 # --- Custom Checkpoint Saver ---
 
@@ -86,12 +193,86 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
     1. Robust Deduplication: Prevents saving identical messages.
     2. Session/Message Split: Uses two tables as requested.
     3. Auto-Session Naming: Uses first human message as session name.
+    4. Incremental Writes: only the new tail of the message list is
+       inspected and appended, so put() cost stays flat as threads grow.
+       Pass incremental=False for the old full-history comparison.
+    5. Windowed Loading: get_tuple() loads only part of the history,
+       paging backwards over (thread_id, message_number):
+         - "all":          every message (old behaviour)
+         - "last_n":       the newest `history_limit` messages
+         - "token_budget": newest messages until `token_budget` is spent
+         - "summary_tail": last_n plus a rolling summary of older messages
     """
     
-    def __init__(self, postgres_url: str):
-        self.engine = create_engine(postgres_url)
-        Base.metadata.create_all(self.engine)
+    def __init__(
+        self,
+        postgres_url: str,
+        incremental: bool = True,
+        history_policy: Optional[str] = None,
+        history_limit: Optional[int] = None,
+        token_budget: Optional[int] = None,
+        page_size: int = 50,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        summarizer: Callable[[Optional[str], List[BaseMessage]], str] = extractive_summary,
+    ):
+        # Shared pool: the session API and vector store use the same engine
+        self.engine = get_engine(postgres_url)
+        # DDL on a maintenance connection: no query timeout on schema work
+        with maintenance_connection(self.engine) as conn:
+            Base.metadata.create_all(conn)
         self.Session = sessionmaker(bind=self.engine)
+        self.incremental = incremental
+
+        self.history_policy = history_policy or os.getenv("CHECKPOINT_HISTORY_POLICY", "all")
+        if self.history_policy not in HISTORY_POLICIES:
+            raise ValueError(f"history_policy must be one of {HISTORY_POLICIES}, got {self.history_policy!r}")
+        self.history_limit = history_limit or int(os.getenv("CHECKPOINT_HISTORY_LIMIT", "40"))
+        self.token_budget = token_budget or int(os.getenv("CHECKPOINT_TOKEN_BUDGET", "6000"))
+        self.page_size = page_size
+        self.token_counter = token_counter
+        self.summarizer = summarizer
+
+        # thread_id -> {"seen": messages of the state already handled,
+        #               "last_number": highest message_number in the DB}
+        self._cursors: Dict[str, Dict[str, int]] = {}
+        self._cursor_lock = threading.Lock()
+
+        self._check_schema()
+
+    def _check_schema(self):
+        """
+        Only checks that migrate_schema() has been applied; the live tables are
+        never altered at import time. create_all() above gives a new database
+        the full schema, so this only trips on databases from before the
+        columns existed.
+        """
+        with self.engine.connect() as conn:
+            present = set(conn.execute(text(
+                "SELECT table_name || '.' || column_name FROM information_schema.columns "
+                "WHERE table_name IN ('langgraph_messages', 'langgraph_checkpoints')"
+            )).scalars())
+            missing = [
+                f"{table}.{column}"
+                for table, columns in MIGRATION_COLUMNS.items() for column, _ in columns
+                if f"{table}.{column}" not in present
+            ]
+            if missing:
+                raise RuntimeError(
+                    f"Checkpoint tables are missing {', '.join(missing)}; "
+                    f"run `python -m custom_utils.pgsql_checkpointer` to migrate them"
+                )
+            for name in MIGRATION_INDEXES:
+                if not index_is_valid(conn, name):
+                    print(f"⚠️ Index {name} missing or invalid; run `python -m custom_utils.pgsql_checkpointer`")
+
+    def _get_cursor(self, thread_id: str) -> Optional[Dict[str, int]]:
+        with self._cursor_lock:
+            cursor = self._cursors.get(thread_id)
+            return dict(cursor) if cursor else None
+
+    def _set_cursor(self, thread_id: str, seen: int, last_number: int):
+        with self._cursor_lock:
+            self._cursors[thread_id] = {"seen": seen, "last_number": last_number}
 
     def _serialize_message(self, msg: Any) -> Optional[Dict]:
         """Convert message object to JSON-serializable dict."""
@@ -140,6 +321,92 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
         except Exception:
             return None
 
+    # --- Windowed history ---
+
+    def _iter_newest_first(self, session, thread_id: str, before: Optional[int] = None, after: Optional[int] = None) -> Iterator[LanggraphMessage]:
+        """
+        Keyset pagination over (thread_id, message_number), newest first.
+        Each page is an index range scan; nothing older than needed is read.
+        """
+        while True:
+            query = select(LanggraphMessage).where(LanggraphMessage.thread_id == thread_id)
+            if before is not None:
+                query = query.where(LanggraphMessage.message_number < before)
+            if after is not None:
+                query = query.where(LanggraphMessage.message_number > after)
+            query = query.order_by(desc(LanggraphMessage.message_number)).limit(self.page_size)
+
+            rows = session.execute(query).scalars().all()
+            yield from rows
+
+            if len(rows) < self.page_size:
+                return
+            before = rows[-1].message_number
+
+    def _load_window(self, session, thread_id: str) -> List[LanggraphMessage]:
+        """Rows to load for this turn, oldest first."""
+        if self.history_policy == "all":
+            return session.query(LanggraphMessage)\
+                .filter_by(thread_id=thread_id)\
+                .order_by(LanggraphMessage.message_number)\
+                .all()
+
+        window = []
+        spent = 0
+        for row in self._iter_newest_first(session, thread_id):
+            if self.history_policy == "token_budget":
+                cost = self.token_counter(row.content)
+                # Always keep the newest message, even if it alone is over budget
+                if window and spent + cost > self.token_budget:
+                    break
+                spent += cost
+            elif len(window) >= self.history_limit:
+                break
+            window.append(row)
+
+        window.reverse()
+        return window
+
+    def _refresh_summary(self, session, db_session: LanggraphCheckpoint, window: List[LanggraphMessage]) -> Optional[str]:
+        """
+        Folds messages that slid out of the window since the last turn into
+        the session summary. Only the newly dropped range is read.
+        """
+        if not window:
+            return db_session.summary
+
+        first_loaded = window[0].message_number
+        upto = db_session.summary_upto or 0
+        if upto >= first_loaded - 1:
+            return db_session.summary
+
+        dropped_rows = list(self._iter_newest_first(
+            session, db_session.id, before=first_loaded, after=upto
+        ))
+        dropped_rows.reverse()
+
+        dropped = [
+            msg for msg in (
+                self._deserialize_message({"type": row.type, "content": row.content})
+                for row in dropped_rows
+            ) if msg
+        ]
+
+        summary = self.summarizer(db_session.summary, dropped)
+        try:
+            # Written on its own connection: committing the read session
+            # would expire the rows get_tuple is about to deserialize
+            with self.engine.begin() as conn:
+                conn.execute(
+                    update(LanggraphCheckpoint)
+                    .where(LanggraphCheckpoint.id == db_session.id)
+                    .values(summary=summary, summary_upto=first_loaded - 1)
+                )
+        except Exception as e:
+            print(f"⚠️ Could not update session summary: {e}")
+
+        return summary
+
     def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
         """Load session and messages."""
         thread_id = config["configurable"]["thread_id"]
@@ -155,13 +422,15 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
             checkpoint = json.loads(db_session.checkpoint_blob)
             metadata = json.loads(db_session.metadata_blob)
             
-            # 3. Fetch Messages
-            db_messages = session.query(LanggraphMessage)\
-                .filter_by(thread_id=thread_id)\
-                .order_by(LanggraphMessage.message_number)\
-                .all()
+            # 3. Fetch Messages (windowed by history_policy)
+            db_messages = self._load_window(session, thread_id)
 
             messages = []
+            if self.history_policy == "summary_tail":
+                summary = self._refresh_summary(session, db_session, db_messages)
+                if summary:
+                    messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+
             for db_msg in db_messages:
                 msg_data = {
                     "type": db_msg.type,
@@ -173,6 +442,11 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
                     messages.append(msg_obj)
 
             checkpoint["channel_values"]["messages"] = messages
+
+            # The graph appends to exactly this list, so the next put()
+            # only has to look at what comes after it
+            last_number = db_messages[-1].message_number if db_messages else 0
+            self._set_cursor(thread_id, len(messages), last_number)
             
             return CheckpointTuple(
                 config=config,
@@ -234,74 +508,163 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
                 if not db_session.session_name and session_name:
                     db_session.session_name = session_name
 
-            # --- 2. ROBUST MESSAGE DEDUPLICATION ---
-            
-            # Step A: Get signatures of existing DB messages to prevent re-saving
-            existing_msgs = session.query(LanggraphMessage.type, LanggraphMessage.content)\
-                .filter_by(thread_id=thread_id).all()
+            # --- 2. SAVE NEW MESSAGES ---
+            if self.incremental:
+                last_number = self._append_new_messages(session, thread_id, user_id, current_messages)
+            else:
+                last_number = self._save_messages_full(session, thread_id, user_id, current_messages)
+
+            session.commit()
+            self._set_cursor(thread_id, len(current_messages), last_number)
             
-            # Create a set of (type, content) tuples for O(1) lookups
-            existing_signatures = set((m.type, m.content) for m in existing_msgs)
+        except Exception as e:
+            session.rollback()
+            # Forget the cursor so the next put() re-checks the whole state
+            with self._cursor_lock:
+                self._cursors.pop(thread_id, None)
+            print(f"❌ Error saving: {e}")
+        finally:
+            session.close()
             
-            # Step B: Filter incoming messages
-            messages_to_save = []
-            seen_in_batch = set() # To handle duplicates within the incoming batch itself
-
-            for msg in current_messages:
-                serialized = self._serialize_message(msg)
-                if not serialized: continue
-                
-                m_type = serialized.get('type')
-                m_content = serialized.get('content')
+        return config
 
-                # Filter 1: Empty Content
-                if not m_content or not m_content.strip():
-                    continue
+    def _save_messages_full(self, session, thread_id: str, user_id: str, current_messages: list) -> int:
+        """Legacy path: compares the whole state against every stored message."""
+        # --- ROBUST MESSAGE DEDUPLICATION ---
+        
+        # Step A: Get signatures of existing DB messages to prevent re-saving
+        existing_msgs = session.query(LanggraphMessage.type, LanggraphMessage.content)\
+            .filter_by(thread_id=thread_id).all()
+        
+        # Create a set of (type, content) tuples for O(1) lookups
+        existing_signatures = set((m.type, m.content) for m in existing_msgs)
+        
+        # Step B: Filter incoming messages
+        messages_to_save = []
+        seen_in_batch = set() # To handle duplicates within the incoming batch itself
 
-                # Filter 2: Only Human/AI
-                if m_type not in ['human', 'ai']:
-                    continue
+        for msg in current_messages:
+            serialized = self._serialize_message(msg)
+            if not serialized: continue
+            
+            m_type = serialized.get('type')
+            m_content = serialized.get('content')
 
-                signature = (m_type, m_content)
+            # Filter 1: Empty Content
+            if not m_content or not m_content.strip():
+                continue
 
-                # Filter 3: Already in DB?
-                if signature in existing_signatures:
-                    continue
-                
-                # Filter 4: Already seen in this current batch?
-                if signature in seen_in_batch:
-                    continue
+            # Filter 2: Only Human/AI
+            if m_type not in ['human', 'ai']:
+                continue
 
-                seen_in_batch.add(signature)
-                messages_to_save.append(serialized)
+            signature = (m_type, m_content)
 
-            # --- 3. SAVE NEW MESSAGES ---
+            # Filter 3: Already in DB?
+            if signature in existing_signatures:
+                continue
             
-            if messages_to_save:
-                # Get current highest message number
-                max_num = session.query(func.max(LanggraphMessage.message_number))\
-                    .filter_by(thread_id=thread_id).scalar() or 0
-                
-                for i, msg_data in enumerate(messages_to_save):
-                    new_msg = LanggraphMessage(
-                        thread_id=thread_id,
-                        user_id=user_id,
-                        message_number=max_num + 1 + i,
-                        type=msg_data['type'],
-                        content=msg_data['content'],
-                        additional_kwargs=json.dumps(msg_data['additional_kwargs'])
-                    )
-                    session.add(new_msg)
+            # Filter 4: Already seen in this current batch?
+            if signature in seen_in_batch:
+                continue
 
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            print(f"❌ Error saving: {e}")
-        finally:
-            session.close()
+            seen_in_batch.add(signature)
+            messages_to_save.append(serialized)
+
+        # --- SAVE NEW MESSAGES ---
+        
+        if messages_to_save:
+            # Get current highest message number
+            max_num = session.query(func.max(LanggraphMessage.message_number))\
+                .filter_by(thread_id=thread_id).scalar() or 0
             
-        return config
+            for i, msg_data in enumerate(messages_to_save):
+                new_msg = LanggraphMessage(
+                    thread_id=thread_id,
+                    user_id=user_id,
+                    message_number=max_num + 1 + i,
+                    type=msg_data['type'],
+                    content=msg_data['content'],
+                    content_hash=message_hash(msg_data['type'], msg_data['content']),
+                    additional_kwargs=json.dumps(msg_data['additional_kwargs'])
+                )
+                session.add(new_msg)
+            return max_num + len(messages_to_save)
+
+        return session.query(func.max(LanggraphMessage.message_number))\
+            .filter_by(thread_id=thread_id).scalar() or 0
+
+    def _append_new_messages(self, session, thread_id: str, user_id: str, current_messages: list) -> int:
+        """
+        Incremental path: only looks at messages after the thread's cursor,
+        checks their hashes against the (thread_id, content_hash) index and
+        appends the survivors in one multi-row INSERT. Returns the highest
+        message_number now stored for the thread.
+        """
+        cursor = self._get_cursor(thread_id)
+        if cursor and cursor["seen"] <= len(current_messages):
+            tail = current_messages[cursor["seen"]:]
+        else:
+            # First write for this thread in this process (or state was reset)
+            cursor = None
+            tail = current_messages
+
+        candidates = []
+        seen_in_batch = set()
+        for msg in tail:
+            serialized = self._serialize_message(msg)
+            if not serialized:
+                continue
+
+            m_type = serialized.get('type')
+            m_content = serialized.get('content')
+
+            if not isinstance(m_content, str) or not m_content.strip():
+                continue
+            if m_type not in ['human', 'ai']:
+                continue
+
+            digest = message_hash(m_type, m_content)
+            if digest in seen_in_batch:
+                continue
+            seen_in_batch.add(digest)
+            candidates.append((digest, serialized))
+
+        if cursor:
+            last_number = cursor["last_number"]
+        else:
+            last_number = session.query(func.max(LanggraphMessage.message_number))\
+                .filter_by(thread_id=thread_id).scalar() or 0
+
+        if not candidates:
+            return last_number
+
+        existing = set(session.execute(
+            select(LanggraphMessage.content_hash).where(
+                LanggraphMessage.thread_id == thread_id,
+                LanggraphMessage.content_hash.in_([digest for digest, _ in candidates])
+            )
+        ).scalars())
+
+        rows = []
+        for digest, msg_data in candidates:
+            if digest in existing:
+                continue
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "thread_id": thread_id,
+                "user_id": user_id,
+                "message_number": last_number + 1 + len(rows),
+                "type": msg_data['type'],
+                "content": msg_data['content'],
+                "content_hash": digest,
+                "additional_kwargs": json.dumps(msg_data['additional_kwargs'], default=str),
+            })
+
+        if rows:
+            session.execute(insert(LanggraphMessage), rows)
+
+        return last_number + len(rows)
 
     def put_writes(self, config: RunnableConfig, writes: list, task_id: str) -> None:
         pass
@@ -309,3 +672,25 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
     def list(self, config: RunnableConfig, *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
         return iter([])
 
+    # --- Async API ---
+    # Used by graph.astream / ainvoke. The SQLAlchemy work runs in a worker
+    # thread so a slow query never blocks the event loop.
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: dict, new_versions: dict) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: list, task_id: str) -> None:
+        return None
+
+    async def alist(self, config: RunnableConfig, *, filter: Optional[Dict[str, Any]] = None, before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    migrate_schema(get_engine(os.environ["PG_VECTOR"]))
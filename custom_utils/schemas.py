@@ -7,6 +7,7 @@ from typing import Optional
 from dotenv import load_dotenv
 
 from custom_utils.aichat_edited import DB_URL
+from utils.db_pool import get_engine, get_sessionmaker
 
 load_dotenv()
 
@@ -14,8 +15,9 @@ load_dotenv()
 if not DB_URL:
     raise ValueError("PG_VECTOR environment variable is not set.")
 
-engine = create_engine(DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Same pooled engine as the checkpointer (one pool per database URL)
+engine = get_engine(DB_URL)
+SessionLocal = get_sessionmaker(DB_URL)
 
 
 def get_db():
@@ -1,23 +1,39 @@
 import os
+import asyncio
 import requests
-from typing import Optional, List, Tuple, Any, Union
+from typing import Optional, List, Dict, Tuple, Any, Union, Callable
 import pandas as pd
 from uuid import uuid4
 from datetime import datetime
 
 # SQLAlchemy & PGVector Imports
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, BigInteger, ARRAY, func
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, BigInteger, ARRAY, func, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.dialects.postgresql import JSONB
 from pgvector.sqlalchemy import Vector
 
 # OpenAI Imports
-from langchain_openai import AzureOpenAIEmbeddings
 from langchain_core.documents import Document as LCDocument
 
+from utils.excel_text import iter_excel_chunks
+from custom_utils.embedding_client import get_embedding_client
+from custom_utils.bulk_writer import DocumentBulkWriter, stored_chunk_count
+from utils.manifest import chunk_hash, load_manifest, add_entries, remove_entries, ManifestDiff
+from utils.db_pool import get_engine, get_sessionmaker
+from utils.embedding_cache import get_query_cache
+from utils.retrieval_cache import get_retrieval_cache, bump_collection_version
+from utils.rerank import RERANK_ENABLED, RERANK_CANDIDATES, RERANK_TOP_N, rerank
+from utils.hybrid import RETRIEVAL_MODE, HYBRID_CANDIDATES, HYBRID_KEYWORD_WEIGHT, rrf_fuse, create_fts_index_background, fts_index_ready, keyword_search
+
 from dotenv import load_dotenv
 load_dotenv()
 
+# Chunks per embedding request / ORM flush during Excel ingest
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Workbooks at least this large are read row by row instead of via pandas
+EXCEL_STREAMING_BYTES = int(float(os.getenv("EXCEL_STREAMING_MB", "25")) * 1024 * 1024)
+
 # --- Database Setup ---
 
 VECTOR_DB_URL = os.environ.get("CUSTOMV_DB")
@@ -25,10 +41,13 @@ print("custome vector db:", VECTOR_DB_URL[-20:])
 if not VECTOR_DB_URL:
     raise ValueError("CUSTOMV_DB environment variable is not set.")
 
-engine = create_engine(VECTOR_DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = get_engine(VECTOR_DB_URL)
+SessionLocal = get_sessionmaker(VECTOR_DB_URL)
 Base = declarative_base()
 
+# Every upload lands in the one 'documents' table; this is its retrieval-cache key
+DOCUMENTS_COLLECTION = "documents"
+
 # --- Models ---
 
 
@@ -79,26 +98,25 @@ class DocumentModel(Base):
 
 # --- Embedding Helper ---
 
+# Cache namespace for query vectors; change it when the deployment changes
+EMBEDDING_CACHE_MODEL = "azure:text-embedding-ada-002"
+
 
 def data_embedding(data: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
     """
-    Generates text embeddings using Azure OpenAI 'text-embedding-3-small'.
+    Generates text embeddings using Azure OpenAI 'text-embedding-ada-002'.
+
+    Goes through the shared embedding client, so lists are packed into as few
+    requests as the deployment allows instead of one client per call.
     """
     try:
-        # Initialize Azure OpenAI Embeddings
-        # Make sure these ENV variables are set in your .env file
-        embeddings_model = AzureOpenAIEmbeddings(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-15-preview",
-            azure_deployment="text-embedding-ada-002",
-        )
+        client = get_embedding_client()
 
         # Handle both single string and list of strings
         if isinstance(data, list):
-            return embeddings_model.embed_documents(data)
+            return client.embed(data)
         else:
-            embedding = embeddings_model.embed_query(data)
+            embedding = client.embed_one(data)
             # print("📝 Generated text embedding.")
             return embedding
 
@@ -139,6 +157,7 @@ def vector_upload(
 
         session.add(new_doc)
         session.commit()
+        bump_collection_version(DOCUMENTS_COLLECTION)
         # print("✅ upload completed to 'documents' table")
 
         return {"context": data, "collection_id": collection_name, "metadata": metadata}
@@ -151,111 +170,343 @@ def vector_upload(
         session.close()
 
 
+def _sync_manifest(document_key: str):
+    """Upserts the manifest from the rows the document actually has."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT id, metadata->>'content_hash' FROM documents "
+            "WHERE document_id = :document_id AND metadata->>'content_hash' IS NOT NULL"
+        ), {"document_id": document_key}).all()
+    add_entries(engine, DOCUMENTS_COLLECTION, document_key, rows)
+
+
+def _delete_vanished(document_key: str, diff: ManifestDiff) -> int:
+    vanished = diff.vanished()
+    if vanished:
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM documents WHERE id = ANY(:ids)"),
+                {"ids": [int(chunk_id) for chunk_id in vanished]}
+            )
+        remove_entries(engine, DOCUMENTS_COLLECTION, document_key, vanished)
+    return len(vanished)
+
+
+class DocumentsSink:
+    """
+    utils.batch_ingest sink for the 'documents' table (file name = document_id).
+
+    One bulk writer per document for the whole ingest, and the manifest is
+    synced once when the document finishes, not after every batch.
+    """
+
+    def __init__(self):
+        self._writers: Dict[str, DocumentBulkWriter] = {}
+
+    def load_manifest(self, document_key: str):
+        return load_manifest(engine, DOCUMENTS_COLLECTION, document_key)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        embeddings = data_embedding(texts)
+        if embeddings is None:
+            raise RuntimeError(f"Embedding failed for {len(texts)} chunks")
+        return embeddings
+
+    def write(self, items: List[dict], embeddings: List[List[float]]):
+        by_document = {}
+        for item, embedding in zip(items, embeddings):
+            by_document.setdefault(item["document_key"], []).append((item, embedding))
+
+        for document_key, rows in by_document.items():
+            writer = self._writers.get(document_key)
+            if writer is None:
+                writer = self._writers[document_key] = DocumentBulkWriter(engine, document_key, document_key)
+            try:
+                for item, embedding in rows:
+                    metadata = {**item["metadata"], "document_id": document_key}
+                    writer.add(metadata.get("chunk", 0), item["text"], embedding, metadata)
+                # Committed per embedding batch, like the other upload paths
+                writer.flush()
+            except Exception:
+                # Its buffer still holds the failed rows; the next batch starts clean
+                self._writers.pop(document_key).close()
+                raise
+        bump_collection_version(DOCUMENTS_COLLECTION)
+
+    def finish(self, document_key: str):
+        writer = self._writers.pop(document_key, None)
+        if writer is not None:
+            writer.close()
+            _sync_manifest(document_key)
+
+    def close(self):
+        for document_key in list(self._writers):
+            self.finish(document_key)
+
+    def delete(self, document_key: str, chunk_ids: List[str]):
+        with engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM documents WHERE id = ANY(:ids)"),
+                {"ids": [int(chunk_id) for chunk_id in chunk_ids]}
+            )
+        remove_entries(engine, DOCUMENTS_COLLECTION, document_key, chunk_ids)
+        bump_collection_version(DOCUMENTS_COLLECTION)
+
+
+def vector_upload_batch(
+    texts: List[str],
+    metadatas: List[dict],
+    collection_name: str,
+    document_id: Optional[str] = None,
+    document_name: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    document_key: Optional[str] = None
+):
+    """
+    Batched counterpart of vector_upload: embeds EMBED_BATCH_SIZE chunks per
+    request and COPYs them into 'documents', committing per batch.
+
+    document_id: pass the id of a failed run to resume it; chunks already
+                 stored for it are skipped without being re-embedded.
+    on_progress: called as on_progress(done, total) after every batch.
+    document_key: stable name of the source document, used as its
+                  document_id. Re-uploads then only embed new/changed chunks
+                  (by content hash) and delete vanished ones.
+    """
+    if len(texts) != len(metadatas):
+        raise ValueError("texts and metadatas must have the same length")
+
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    document_id = document_key or document_id or (metadatas[0].get("document_id") if metadatas else None) or str(uuid4())
+    document_name = document_name or (metadatas[0].get("title") if metadatas else None) or document_key or "Untitled"
+    total = len(texts)
+    hashes = [chunk_hash(chunk) for chunk in texts]
+
+    pending = list(range(total))
+    diff = None
+    if document_key:
+        diff = ManifestDiff(load_manifest(engine, DOCUMENTS_COLLECTION, document_key))
+        pending = [position for position in pending if diff.keep(hashes[position]) is None]
+        print(f"♻️ {document_key}: {diff.kept} chunks unchanged, {len(pending)} to embed")
+
+    try:
+        with DocumentBulkWriter(engine, document_id, document_name) as writer:
+            # With a manifest the diff already skips stored chunks
+            skip = 0 if diff is not None else writer.resume_from
+            if skip:
+                print(f"↪️ Resuming {document_name}: {skip}/{total} chunks already stored")
+
+            for start in range(skip, len(pending), batch_size):
+                positions = pending[start:start + batch_size]
+                embeddings = data_embedding([texts[position] for position in positions])
+                if embeddings is None:
+                    raise RuntimeError(f"Embedding failed for chunks {positions[0]}-{positions[-1]}")
+
+                for position, embedding in zip(positions, embeddings):
+                    metadata = {**metadatas[position], "document_id": document_id, "content_hash": hashes[position]}
+                    writer.add(metadata.get("chunk", position), texts[position], embedding, metadata)
+
+                if on_progress:
+                    on_progress(total - len(pending) + start + len(positions), total)
+
+        deleted = _delete_vanished(document_key, diff) if diff is not None else 0
+        stored = len(pending) if diff is not None else writer.resume_from + writer.written
+        print(f"✅ batch upload completed → {stored}/{total} chunks stored, {deleted} removed")
+        return {
+            "collection_id": collection_name,
+            "document_id": document_id,
+            "stored": stored,
+            "total": total,
+            "unchanged": diff.kept if diff else 0,
+            "deleted": deleted,
+            "failed": []
+        }
+
+    except Exception as e:
+        stored = stored_chunk_count(engine, document_id)
+        print(f"❌ Batch upload failed after {stored}/{total} chunks: {e}")
+        return {
+            "collection_id": collection_name,
+            "document_id": document_id,
+            "stored": stored,
+            "total": total,
+            "failed": [{"start": stored, "size": total - stored, "error": str(e)}]
+        }
+
+    finally:
+        if diff is not None:
+            _sync_manifest(document_key)
+        bump_collection_version(DOCUMENTS_COLLECTION)
+
+
 def excel_upload(
     excel_path: str,
     collection_name: str,
     document_link: str,
     chunk_size: int = 1000,
-    chunk_overlap: int = 70
+    chunk_overlap: int = 70,
+    streaming: Optional[bool] = None,
+    document_id: Optional[str] = None,
+    document_key: Optional[str] = None
 ):
     """
     Reads Excel -> Chunks -> Inserts into 'documents' table.
+
+    streaming: read rows incrementally (openpyxl read-only) and embed/flush
+               chunks in EMBED_BATCH_SIZE batches as they arrive.
+               None = stream workbooks >= EXCEL_STREAMING_MB.
+    document_id: pass the document_id of a failed run to resume it; chunks
+                 already stored are skipped without being re-embedded.
+    document_key: stable name of the workbook, used as its document_id.
+                  Re-uploads then only embed new/changed chunks and delete
+                  vanished ones.
     """
     excel_path = os.path.abspath(os.path.expanduser(excel_path))
     if not os.path.exists(excel_path):
         raise FileNotFoundError(f"Excel file not found: {excel_path}")
 
-    xls = pd.ExcelFile(excel_path, engine="openpyxl")
-    results = []
+    if streaming is None:
+        streaming = os.path.getsize(excel_path) >= EXCEL_STREAMING_BYTES
 
-    session = SessionLocal()
-    file_doc_id = str(uuid4())
+    results = []
+    batch = []
+
+    file_doc_id = document_key or document_id or str(uuid4())
+    file_name = os.path.basename(excel_path)
+    diff = ManifestDiff(load_manifest(engine, DOCUMENTS_COLLECTION, document_key)) if document_key else None
+
+    def flush():
+        embeddings = data_embedding([chunk for _, _, _, chunk in batch])
+        if embeddings is None:
+            # Stop here: everything before this batch is committed, so the
+            # upload can be resumed with the same document_id
+            raise RuntimeError(f"Embedding failed for {len(batch)} chunks")
+
+        for (page_index, sheet_name, chunk_idx, chunk_text), embedding in zip(batch, embeddings):
+            metadata = {
+                "document_link": document_link,
+                "sheet_name": sheet_name,
+                "page": page_index,
+                "chunk": chunk_idx,
+                "original_file": file_name,
+                "document_id": file_doc_id,
+                "content_hash": chunk_hash(chunk_text)
+            }
+            writer.add(chunk_idx, chunk_text, embedding, metadata)
+            results.append(
+                {"status": "success", "sheet": sheet_name, "chunk": chunk_idx})
+        batch.clear()
 
     try:
-        print(f"📄 Excel sheets detected: {xls.sheet_names}")
-
-        for page_index, sheet_name in enumerate(xls.sheet_names):
-            df = xls.parse(sheet_name, header=None)
-
-            text_blocks = []
-            for _, row in df.iterrows():
-                row_text = " | ".join([str(v) for v in row if pd.notna(v)])
-                if row_text.strip():
-                    text_blocks.append(row_text)
-            full_text = "\n".join(text_blocks)
-
-            if not full_text.strip():
-                continue
-
-            start = 0
-            length = len(full_text)
-            chunk_idx = 0
-
-            while start < length:
-                end = start + chunk_size
-                chunk_text = full_text[start:end]
-                start = end - chunk_overlap
-
-                embedding = data_embedding(chunk_text)
-                if embedding:
-                    metadata = {
-                        "document_link": document_link,
-                        "sheet_name": sheet_name,
-                        "page": page_index,
-                        "chunk": chunk_idx,
-                        "original_file": os.path.basename(excel_path),
-                        "document_id": file_doc_id
-                    }
-
-                    db_doc = DocumentModel(
-                        document_id=file_doc_id,
-                        document_name=os.path.basename(excel_path),
-                        chunk_index=chunk_idx,
-                        chunk_text=chunk_text,
-                        embedding=embedding,
-                        metadata_=metadata
-                    )
-                    session.add(db_doc)
-                    results.append(
-                        {"status": "success", "sheet": sheet_name, "chunk": chunk_idx})
-
-                chunk_idx += 1
-
-        session.commit()
+        with DocumentBulkWriter(engine, file_doc_id, file_name) as writer:
+            # With a manifest the diff already skips stored chunks
+            skip = 0 if diff is not None else writer.resume_from
+            if skip:
+                print(f"↪️ Resuming {file_name}: skipping {skip} stored chunks")
+
+            for position, (page_index, sheet_name, _title, chunk_idx, chunk_text) in enumerate(iter_excel_chunks(
+                excel_path, chunk_size, chunk_overlap,
+                detect_header=False, streaming=streaming
+            )):
+                if position < skip:
+                    continue
+                if diff is not None and diff.keep(chunk_hash(chunk_text)) is not None:
+                    results.append({"status": "unchanged", "sheet": sheet_name, "chunk": chunk_idx})
+                    continue
+                batch.append((page_index, sheet_name, chunk_idx, chunk_text))
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    flush()
+
+            if batch:
+                flush()
+
+        if diff is not None:
+            deleted = _delete_vanished(document_key, diff)
+            print(f"♻️ {document_key}: {diff.kept} chunks unchanged, {diff.new} embedded, {deleted} removed")
         print(f"✅ Excel upload completed → {len(results)} chunks stored.")
         return results
 
     except Exception as e:
-        session.rollback()
         print(f"❌ Excel upload failed: {e}")
-        return [{"status": "failed", "error": str(e)}]
+        return [{"status": "failed", "error": str(e), "document_id": file_doc_id}]
+
     finally:
-        session.close()
+        if diff is not None:
+            _sync_manifest(document_key)
+        bump_collection_version(DOCUMENTS_COLLECTION)
 
 # --- Retrieval Function ---
 
 
+# ANN search knobs (see custom_utils/vector_index.py). Higher = better recall, slower.
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", "0")) or None
+ANN_PROBES = int(os.getenv("ANN_PROBES", "0")) or None
+
+
+def apply_search_params(session, ef_search: Optional[int] = None, probes: Optional[int] = None):
+    """
+    Sets hnsw.ef_search / ivfflat.probes for the current transaction only,
+    so pooled connections don't keep another query's settings.
+    """
+    if ef_search:
+        session.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if probes:
+        session.execute(text(f"SET LOCAL ivfflat.probes = {int(probes)}"))
+
+
 def retrive(
     user_query: str,
-    k: int = 5
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
 ) -> List[Tuple[LCDocument, float]]:
     """
     Generates embedding for query and searches 'documents' table via Cosine Similarity.
+
+    ef_search / probes: per-query ANN settings (default ANN_EF_SEARCH / ANN_PROBES).
     """
     session = SessionLocal()
     try:
-        query_embedding = data_embedding(user_query)
+        # Repeated / retried queries skip the Azure embedding call entirely
+        query_embedding = get_query_cache().get_or_embed(
+            EMBEDDING_CACHE_MODEL, user_query, data_embedding
+        )
         if query_embedding is None:
             return []
 
-        # Cosine Distance (<=>)
-        results = session.query(
-            DocumentModel,
-            DocumentModel.embedding.cosine_distance(
-                query_embedding).label("distance")
-        ).order_by(
-            DocumentModel.embedding.cosine_distance(query_embedding)
-        ).limit(k).all()
+        ef_search = ef_search or ANN_EF_SEARCH
+        probes = probes or ANN_PROBES
+
+        # Same query + same corpus version → reload the cached top-k by id
+        cache = get_retrieval_cache()
+        hits = cache.get(DOCUMENTS_COLLECTION, query_embedding, k, extra=(ef_search, probes))
+        results = None
+        if hits is not None:
+            rows = {
+                row.id: row for row in
+                session.query(DocumentModel).filter(DocumentModel.id.in_([row_id for row_id, _ in hits])).all()
+            }
+            if len(rows) == len(hits):
+                results = [(rows[row_id], distance) for row_id, distance in hits]
+
+        if results is None:
+            apply_search_params(session, ef_search=ef_search, probes=probes)
+
+            # Cosine Distance (<=>)
+            results = session.query(
+                DocumentModel,
+                DocumentModel.embedding.cosine_distance(
+                    query_embedding).label("distance")
+            ).order_by(
+                DocumentModel.embedding.cosine_distance(query_embedding)
+            ).limit(k).all()
+
+            cache.set(
+                DOCUMENTS_COLLECTION, query_embedding, k,
+                [(doc_row.id, float(distance)) for doc_row, distance in results],
+                extra=(ef_search, probes)
+            )
 
         formatted_results = []
         for doc_row, distance in results:
@@ -279,3 +530,112 @@ def retrive(
         return []
     finally:
         session.close()
+
+
+async def aretrive(
+    user_query: str,
+    k: int = 5
+) -> List[Tuple[LCDocument, float]]:
+    """
+    Async retrive(): embedding call and vector query run off the event loop.
+    """
+    return await asyncio.to_thread(retrive, user_query, k)
+
+
+FTS_INDEX = "ix_documents_chunk_text_fts"
+
+
+def build_hybrid_index():
+    """
+    Starts the full-text index build for hybrid_retrive in the background.
+    Called at startup; retrieval only checks that the index is ready.
+    """
+    create_fts_index_background(engine, "documents", "chunk_text", FTS_INDEX)
+
+
+def hybrid_retrive(
+    user_query: str,
+    k: int = 5,
+    candidates: int = HYBRID_CANDIDATES
+) -> List[Tuple[LCDocument, float]]:
+    """
+    retrive() fused with full-text search over documents.chunk_text
+    (reciprocal rank fusion, see utils.hybrid). Same return shape: (doc,
+    cosine distance) pairs, best first.
+    """
+    try:
+        query_embedding = get_query_cache().get_or_embed(
+            EMBEDDING_CACHE_MODEL, user_query, data_embedding
+        )
+        if query_embedding is None:
+            return []
+
+        vector_hits = retrive(user_query, k=candidates)
+    except Exception as e:
+        print(f"❌ Hybrid retrieval failed: {e}")
+        return []
+
+    # A keyword or fusion failure still leaves the vector ranking
+    try:
+        if not fts_index_ready(engine, FTS_INDEX):
+            return vector_hits[:k]
+
+        keyword_hits = keyword_search(
+            engine, "documents", "id", "chunk_text", user_query,
+            limit=candidates,
+            embedding=query_embedding
+        )
+
+        fused = rrf_fuse(
+            [[doc.metadata["id"] for doc, _ in vector_hits], [hit["id"] for hit in keyword_hits]],
+            weights=[1.0, HYBRID_KEYWORD_WEIGHT]
+        )[:k]
+
+        docs = {doc.metadata["id"]: (doc, distance) for doc, distance in vector_hits}
+        missing = [row_id for row_id, _ in fused if row_id not in docs]
+        if missing:
+            distances = {hit["id"]: hit["distance"] for hit in keyword_hits}
+            session = SessionLocal()
+            try:
+                for doc_row in session.query(DocumentModel).filter(DocumentModel.id.in_(missing)).all():
+                    lc_doc = LCDocument(
+                        page_content=doc_row.chunk_text,
+                        metadata=doc_row.metadata_ or {}
+                    )
+                    lc_doc.metadata["document_id"] = doc_row.document_id
+                    lc_doc.metadata["id"] = doc_row.id
+                    docs[doc_row.id] = (lc_doc, distances[doc_row.id])
+            finally:
+                session.close()
+
+        return [docs[row_id] for row_id, _ in fused if row_id in docs]
+
+    except Exception as e:
+        print(f"⚠️ Keyword search failed, using vector hits only: {e}")
+        return vector_hits[:k]
+
+
+async def ahybrid_retrive(
+    user_query: str,
+    k: int = 5
+) -> List[Tuple[LCDocument, float]]:
+    return await asyncio.to_thread(hybrid_retrive, user_query, k)
+
+
+def search(user_query: str, k: Optional[int] = None) -> List[Tuple[LCDocument, float]]:
+    """
+    What the data_retriever tool calls: retrive() or hybrid_retrive() per
+    RETRIEVAL_MODE, re-ranked when RERANK is on. k defaults to the
+    retriever's own k, or RERANK_TOP_N when re-ranking.
+    """
+    # RETRIEVAL_MODE=hybrid adds full-text matches (exact IDs, acronyms)
+    retrieve = hybrid_retrive if RETRIEVAL_MODE == "hybrid" else retrive
+    if RERANK_ENABLED:
+        # Over-fetch, then keep the few chunks the cross-encoder rates best
+        return rerank(user_query, retrieve(user_query, k=RERANK_CANDIDATES), top_n=k or RERANK_TOP_N)
+    return retrieve(user_query) if k is None else retrieve(user_query, k=k)
+
+
+async def asearch(user_query: str, k: Optional[int] = None) -> List[Tuple[LCDocument, float]]:
+    """Async search(): retrieval and re-ranking run off the event loop."""
+    return await asyncio.to_thread(search, user_query, k)
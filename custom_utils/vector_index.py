@@ -0,0 +1,184 @@
+import time
+from typing import Optional, Dict, Any
+
+from sqlalchemy import text, func
+
+from custom_utils.vector import engine, SessionLocal, DocumentModel, apply_search_params
+from utils.db_pool import maintenance_connection, index_is_valid, drop_invalid_index
+
+# --- ANN index management for documents.embedding ---
+#
+# retrive() orders by cosine distance, so the index uses vector_cosine_ops.
+# Without it every query is a sequential scan over all 1536-dim vectors.
+
+INDEX_NAME = "ix_documents_embedding_ann"
+INDEX_KINDS = ("hnsw", "ivfflat")
+
+
+def _autocommit():
+    # CREATE/REINDEX ... CONCURRENTLY can't run inside a transaction block,
+    # and a real-sized build outlasts the pool's statement_timeout
+    return maintenance_connection(engine)
+
+
+def index_info() -> Optional[Dict[str, Any]]:
+    """Definition and on-disk size of the ANN index, or None if it doesn't exist."""
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT indexdef, pg_relation_size(CAST(:name AS regclass)) AS size_bytes "
+            "FROM pg_indexes WHERE indexname = :name"
+        ), {"name": INDEX_NAME}).mappings().first()
+        if not row:
+            return None
+        return {**dict(row), "valid": index_is_valid(conn, INDEX_NAME)}
+
+
+def _default_lists() -> int:
+    # pgvector guidance: rows / 1000 up to 1M rows, sqrt(rows) above that
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT count(*) FROM documents")).scalar() or 0
+    if rows > 1_000_000:
+        return max(1, int(rows ** 0.5))
+    return max(1, rows // 1000)
+
+
+def create_index(
+    kind: str = "hnsw",
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: Optional[int] = None,
+    concurrently: bool = True,
+    replace: bool = False
+) -> Dict[str, Any]:
+    """
+    Creates the ANN index on documents.embedding.
+
+    kind: "hnsw" (m, ef_construction) or "ivfflat" (lists; defaults from row count).
+    replace: drop an existing index first, e.g. to switch kind or parameters.
+    """
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"kind must be one of {INDEX_KINDS}, got {kind!r}")
+
+    if replace:
+        drop_index(concurrently=concurrently)
+
+    if kind == "hnsw":
+        options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    else:
+        options = f"lists = {int(lists or _default_lists())}"
+
+    st = time.perf_counter()
+    with _autocommit() as conn:
+        # A cancelled concurrent build leaves an INVALID index behind
+        drop_invalid_index(conn, INDEX_NAME)
+        conn.execute(text(
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {INDEX_NAME} "
+            f"ON documents USING {kind} (embedding vector_cosine_ops) WITH ({options})"
+        ))
+    elapsed = time.perf_counter() - st
+
+    print(f"✅ {kind} index ready on documents.embedding in {elapsed:.1f}s ({options})")
+    return {"index": INDEX_NAME, "kind": kind, "options": options, "seconds": round(elapsed, 2)}
+
+
+def drop_index(concurrently: bool = True):
+    with _autocommit() as conn:
+        conn.execute(text(
+            f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {INDEX_NAME}"
+        ))
+    print(f"🗑️ Dropped {INDEX_NAME}")
+
+
+def rebuild_index(concurrently: bool = True) -> Dict[str, Any]:
+    """
+    Rebuilds the index in place. IVFFlat centroids are fixed at build time, so
+    rebuild after large ingests; HNSW mostly needs it after heavy deletes.
+    """
+    st = time.perf_counter()
+    with _autocommit() as conn:
+        # Leftover of a cancelled REINDEX CONCURRENTLY
+        drop_invalid_index(conn, f"{INDEX_NAME}_ccnew")
+        if index_is_valid(conn, INDEX_NAME) is False:
+            # Recreate an INVALID index from its own definition
+            indexdef = conn.execute(text(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = :name"
+            ), {"name": INDEX_NAME}).scalar()
+            drop_invalid_index(conn, INDEX_NAME)
+            if concurrently:
+                indexdef = indexdef.replace("CREATE INDEX ", "CREATE INDEX CONCURRENTLY ", 1)
+            conn.execute(text(indexdef))
+        else:
+            conn.execute(text(
+                f"REINDEX INDEX {'CONCURRENTLY ' if concurrently else ''}{INDEX_NAME}"
+            ))
+    elapsed = time.perf_counter() - st
+    print(f"♻️ Rebuilt {INDEX_NAME} in {elapsed:.1f}s")
+    return {"index": INDEX_NAME, "seconds": round(elapsed, 2)}
+
+
+def _top_ids(session, query_embedding, k: int, exclude_id: Optional[int] = None):
+    distance = DocumentModel.embedding.cosine_distance(query_embedding)
+    query = session.query(DocumentModel.id)
+    if exclude_id is not None:
+        query = query.filter(DocumentModel.id != exclude_id)
+    return [row_id for (row_id,) in query.order_by(distance).limit(k).all()]
+
+
+def measure_recall(
+    sample_size: int = 50,
+    k: int = 10,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Recall@k of the ANN index against exact search.
+
+    Uses `sample_size` stored embeddings as queries, with the query's own row
+    left out of both result sets (it would always be its own exact top-1 and
+    inflate recall). The exact top-k is taken with index scans disabled, so
+    it is a true sequential scan.
+    """
+    session = SessionLocal()
+    try:
+        samples = session.query(DocumentModel.id, DocumentModel.embedding)\
+            .filter(DocumentModel.embedding.isnot(None))\
+            .order_by(func.random())\
+            .limit(sample_size).all()
+
+        recalls = []
+        ann_seconds = 0.0
+        exact_seconds = 0.0
+
+        for row_id, embedding in samples:
+            apply_search_params(session, ef_search=ef_search, probes=probes)
+            st = time.perf_counter()
+            ann = _top_ids(session, embedding, k, exclude_id=row_id)
+            ann_seconds += time.perf_counter() - st
+            session.commit()
+
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            session.execute(text("SET LOCAL enable_bitmapscan = off"))
+            st = time.perf_counter()
+            exact = _top_ids(session, embedding, k, exclude_id=row_id)
+            exact_seconds += time.perf_counter() - st
+            session.commit()
+
+            if exact:
+                recalls.append(len(set(ann) & set(exact)) / len(exact))
+
+        n = len(recalls)
+        report = {
+            "index": index_info(),
+            "queries": n,
+            "k": k,
+            "ef_search": ef_search,
+            "probes": probes,
+            "recall": round(sum(recalls) / n, 4) if n else None,
+            "ann_ms_avg": round(ann_seconds / n * 1000, 2) if n else None,
+            "exact_ms_avg": round(exact_seconds / n * 1000, 2) if n else None,
+        }
+        print(f"📏 recall@{k} = {report['recall']} over {n} queries")
+        return report
+
+    finally:
+        session.close()
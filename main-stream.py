@@ -1,17 +1,46 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import os
 import shutil
+import asyncio
 from pathlib import Path
 from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List
+from uuid import uuid4
 
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessageChunk
 from utils.document_process import document_upload_vector
 from utils.aichat import collection_name #, RAG_agent
-from utils.aistream import graph
+from utils.aistream import open_async_graph, close_async_graph
+from utils.model_registry import warm_up, model_stats
+from utils.rerank import RERANK_ENABLED, get_reranker
+from utils.db_pool import pool_stats
+from utils.embedding_cache import get_query_cache
+from utils.retrieval_cache import get_retrieval_cache
+from utils.jobs import get_job_manager, JobQueueFull
+from utils.batch_ingest import ingest_files, save_batch, UploadTooLarge, PGVectorSink
+from utils.upload_tee import tee_upload
+from utils.hybrid import RETRIEVAL_MODE
+from utils.vector import build_hybrid_index
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load embedding weights once, before the first upload or retrieval
+    warm_up()
+    if RERANK_ENABLED:
+        get_reranker()
+    # Full-text index is built here, in the background, never on a query
+    if RETRIEVAL_MODE == "hybrid":
+        build_hybrid_index()
+    await open_async_graph()
+    yield
+    await close_async_graph()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,50 +61,150 @@ print(collection_name)
 @app.post("/uploadfile/")
 async def upload_file(file: UploadFile = File(...)):
     """
-    Handles file upload, saves the file locally, and returns a success response.
+    Saves the file locally and queues its ingestion; returns a job id at once.
+    Poll /jobs/{job_id} for progress.
     """
     file_location = UPLOAD_DIRECTORY / file.filename
-    st = datetime.now()
-    
+
     try:
-        with file_location.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Only the local copy (+ sha256) is on the request path; the job
+        # uploads the saved file to SeaweedFS, and skips unsupported files
+        saved = await asyncio.to_thread(tee_upload, file.file, file_location)
 
-        x = document_upload_vector(
-            doc_location=file_location,
-            doc_name = file.filename,
-            collection_name=collection_name
+        job = get_job_manager().submit(
+            document_upload_vector,
+            doc_location=saved["path"],
+            doc_name=file.filename,
+            collection_name=collection_name,
+            name=file.filename,
+            bytes_total=saved["size"]
         )
-        if type(x) == str:
-            return JSONResponse(content={
-                "status": "failed",
-                "message": x,
-                "filename": file.filename,
-                "size": file.size 
-            })
+
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Ingestion queue is full: {e}")
 
     except Exception as e:
-        await file.close() 
         print(f"Error saving file: {e}")
-        raise HTTPException(status_code=500, detail=f"Could not save file{e}")
+        raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
 
     finally:
-        pass
-
-    print(datetime.now() - st)
+        await file.close()
 
-    return JSONResponse(content={
+    return JSONResponse(status_code=202, content={
         "status": "success",
-        "message": "Upload successful",
+        "message": "Upload queued",
+        "job_id": job.id,
         "filename": file.filename,
-        "size": file.size 
+        "size": saved["size"],
+        "sha256": saved["sha256"]
+    })
+
+
+@app.post("/uploadfiles/")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """
+    Batch upload: many files and/or .zip archives, ingested as one background
+    job (parallel parsing, shared embedding batches). Poll /jobs/{job_id};
+    per-file status is under "details".
+    """
+    batch_dir = UPLOAD_DIRECTORY / f"batch-{uuid4().hex[:12]}"
+    job = None
+
+    def prepare():
+        # Disk copy, zip expansion and sink setup all block; keep them off the loop
+        paths, total_bytes = save_batch([(file.filename, file.file) for file in files], str(batch_dir))
+        return paths, total_bytes, PGVectorSink(collection_name)
+
+    try:
+        paths, total_bytes, sink = await asyncio.to_thread(prepare)
+
+        statuses = {}
+        job = get_job_manager().submit(
+            ingest_files,
+            paths,
+            sink,
+            statuses=statuses,
+            name=f"{len(paths)} files",
+            bytes_total=total_bytes
+        )
+        job.details = statuses
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Archive too large: {e}")
+
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Ingestion queue is full: {e}")
+
+    except Exception as e:
+        print(f"Error saving files: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not save files: {e}")
+
+    finally:
+        for file in files:
+            await file.close()
+        if job is None:
+            # Nothing will ingest a half-written batch
+            await asyncio.to_thread(shutil.rmtree, batch_dir, True)
+
+    return JSONResponse(status_code=202, content={
+        "status": "success",
+        "message": "Upload queued",
+        "job_id": job.id,
+        "files": [os.path.basename(path) for path in paths],
+        "size": total_bytes
     })
 
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Ingestion progress: status, chunks done/total, bytes and rate.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/metrics/jobs")
+def get_job_stats():
+    """
+    Ingestion worker pool and queue depth.
+    """
+    return get_job_manager().stats()
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "FastAPI File Uploader is running! Go to */uploadfile/* for file upload."}
 
+
+@app.get("/metrics/models")
+def get_model_stats():
+    """
+    Embedding and re-ranking model load time and reuse counters.
+    """
+    return model_stats()
+
+
+@app.get("/metrics/db")
+def get_db_pool_stats():
+    """
+    Connection pool usage per database (checked out, overflow, peak, ...).
+    """
+    return pool_stats()
+
+
+@app.get("/metrics/cache")
+def get_cache_stats():
+    """
+    Query embedding and retrieval result cache hit/miss counters.
+    """
+    return {
+        "query_embeddings": get_query_cache().stats(),
+        "retrieval_results": get_retrieval_cache().stats(),
+    }
+
 # @app.post("/chat/")
 # async def ai_chat_endpoint(user_query: str, thread_id: str ):
 #     # try:
@@ -96,41 +225,111 @@ def read_root():
 #     #     })
 
 
+HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+
+def sse_event(data: str, event: str = None) -> str:
+    """
+    Frames one SSE event. Multi-line payloads become several `data:` lines,
+    which EventSource joins back with "\n", so tokens keep their newlines.
+    """
+    lines = [f"event: {event}"] if event else []
+    lines += [f"data: {line}" for line in str(data).split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+def token_text(chunk) -> str:
+    """Text of an AIMessageChunk; some providers send a list of content parts."""
+    content = chunk.content
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for part in content
+        )
+    return content or ""
+
+
 @app.get("/chat/stream")
-async def chat_stream(query: str, thread_id: str, user_id: str = "1"):
+async def chat_stream(request: Request, query: str, thread_id: str, user_id: str = "1"):
 
-    async def event_stream():
-        config = {
-            "configurable": {
-                "thread_id": thread_id,
-                "user_id": user_id
-            }
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "user_id": user_id
         }
+    }
+    graph = await open_async_graph()
+
+    async def event_stream():
+        queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            # --- STREAMING START ---
+            try:
+                async for chunk, meta in graph.astream(
+                    {"messages": [HumanMessage(content=query)]},
+                    config,
+                    stream_mode="messages"
+                ):
+                    # Only LLM tokens; skip tool results and tool-call deltas
+                    if not isinstance(chunk, AIMessageChunk):
+                        continue
+                    text = token_text(chunk)
+                    if text:
+                        await queue.put(text)
+            except Exception as e:
+                print("An unexpected error occurred while streaming:", e)
+                await queue.put(e)
+            finally:
+                await queue.put(done)
+
+        producer = asyncio.create_task(produce())
+        tokens = []  # collect full response
+        finished = False
+
+        try:
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # SSE comment: keeps proxies from closing an idle stream
+                    yield ": ping\n\n"
+                    continue
 
-        final_output = ""  # collect full response
+                if item is done:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    yield sse_event("error on processing", event="error_message")
+                    continue
 
-        # --- STREAMING START ---
-        for chunk in graph.stream(
-            {"messages": [HumanMessage(content=query)]},
-            config,
-            stream_mode="values"
-        ):
-            msg = chunk["messages"][-1].content
-            final_output += msg  # append to final message
+                tokens.append(item)
+                yield sse_event(item)
 
-            # send chunk to client
-            yield f"data: {msg}\n\n"
+            if finished:
+                # --- AFTER STREAM FINISHES ---
+                print("\n" + "=" * 60)
+                print("🟦 FULL AI RESPONSE (DEV LOG):")
+                print("=" * 60)
+                print("".join(tokens))
+                print("=" * 60 + "\n")
 
-        # --- AFTER STREAM FINISHES ---
-        print("\n" + "=" * 60)
-        print("🟦 FULL AI RESPONSE (DEV LOG):")
-        print("=" * 60)
-        print(final_output)
-        print("=" * 60 + "\n")
+                # notify SSE end
+                yield sse_event("[DONE]")
 
-        # notify SSE end
-        yield "data: [DONE]\n\n"
+        finally:
+            # Client went away (or we bailed out): stop the LLM run too
+            if not finished and not producer.done():
+                producer.cancel()
+                print(f"🛑 Stream cancelled for thread {thread_id}")
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # uvicorn main-stream:app --reload
\ No newline at end of file
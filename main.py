@@ -3,20 +3,45 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import os
+import asyncio
 from pathlib import Path
 from datetime import datetime
+from contextlib import asynccontextmanager
 from typing import List, Optional
+from uuid import uuid4
 
 from sqlalchemy import desc, asc
 from sqlalchemy.orm import Session
 
 from custom_utils.schemas import ChatMessageResponse, SessionListResponse, get_db
 from custom_utils.document_process import document_upload_vector
-from custom_utils.aichat_edited import RAG_agent, collection_name
+from custom_utils.aichat_edited import RAG_agent, aRAG_agent, collection_name
 from custom_utils.pgsql_checkpointer import LanggraphCheckpoint, LanggraphMessage
-
-
-app = FastAPI()
+from utils.db_pool import pool_stats
+from utils.embedding_cache import get_query_cache
+from utils.retrieval_cache import get_retrieval_cache
+from utils.jobs import get_job_manager, JobQueueFull
+from utils.batch_ingest import ingest_files, save_batch, UploadTooLarge
+from utils.upload_tee import tee_upload
+from custom_utils.vector import DocumentsSink, build_hybrid_index
+from custom_utils.embedding_client import get_embedding_client
+from utils.hybrid import RETRIEVAL_MODE
+from utils.model_registry import model_stats
+from utils.rerank import RERANK_ENABLED, get_reranker
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cross-encoder loads once, before the first retrieval
+    if RERANK_ENABLED:
+        get_reranker()
+    # Full-text index is built here, in the background, never on a query
+    if RETRIEVAL_MODE == "hybrid":
+        build_hybrid_index()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -107,51 +132,158 @@ print(f"Collection Name: {collection_name}")
 @app.post("/uploadfile/")
 async def upload_file(file: UploadFile = File(...)):
     """
-    Handles file upload, saves the file locally, and returns a success response.
+    Saves the file locally and queues its ingestion; returns a job id at once.
+    Poll /jobs/{job_id} for progress.
     """
     file_location = UPLOAD_DIRECTORY / file.filename
-    st = datetime.now()
 
     try:
-        with file_location.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Saved and hashed in one pass; the job uploads the blob while it parses
+        saved = await asyncio.to_thread(tee_upload, file.file, file_location)
 
-        # Call the vector database logic
-        x = document_upload_vector(
-            doc_location=file_location,
+        job = get_job_manager().submit(
+            document_upload_vector,
+            doc_location=saved["path"],
             doc_name=file.filename,
-            collection_name=collection_name
+            collection_name=collection_name,
+            name=file.filename,
+            bytes_total=saved["size"]
         )
 
-        if isinstance(x, str) and "fail" in x.lower():
-            return JSONResponse(content={
-                "status": "failed",
-                "message": x,
-                "filename": file.filename,
-                "size": file.size
-            })
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Ingestion queue is full: {e}")
 
     except Exception as e:
-        await file.close()
         print(f"Error saving file: {e}")
-        raise HTTPException(
-            status_code=500, detail=f"Could not save file: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
 
-    print(f"Processing time: {datetime.now() - st}")
+    finally:
+        await file.close()
 
-    return JSONResponse(content={
+    return JSONResponse(status_code=202, content={
         "status": "success",
-        "message": "Upload successful",
+        "message": "Upload queued",
+        "job_id": job.id,
         "filename": file.filename,
-        "size": file.size
+        "size": saved["size"],
+        "sha256": saved["sha256"]
+    })
+
+
+@app.post("/uploadfiles/")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """
+    Batch upload: many files and/or .zip archives, ingested as one background
+    job (parallel parsing, shared embedding batches). Poll /jobs/{job_id};
+    per-file status is under "details".
+    """
+    batch_dir = UPLOAD_DIRECTORY / f"batch-{uuid4().hex[:12]}"
+    job = None
+
+    def prepare():
+        # Disk copy, zip expansion and sink setup all block; keep them off the loop
+        paths, total_bytes = save_batch([(file.filename, file.file) for file in files], str(batch_dir))
+        return paths, total_bytes, DocumentsSink()
+
+    try:
+        paths, total_bytes, sink = await asyncio.to_thread(prepare)
+
+        statuses = {}
+        job = get_job_manager().submit(
+            ingest_files,
+            paths,
+            sink,
+            statuses=statuses,
+            name=f"{len(paths)} files",
+            bytes_total=total_bytes
+        )
+        job.details = statuses
+
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"Archive too large: {e}")
+
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Ingestion queue is full: {e}")
+
+    except Exception as e:
+        print(f"Error saving files: {e}")
+        raise HTTPException(status_code=500, detail=f"Could not save files: {e}")
+
+    finally:
+        for file in files:
+            await file.close()
+        if job is None:
+            # Nothing will ingest a half-written batch
+            await asyncio.to_thread(shutil.rmtree, batch_dir, True)
+
+    return JSONResponse(status_code=202, content={
+        "status": "success",
+        "message": "Upload queued",
+        "job_id": job.id,
+        "files": [os.path.basename(path) for path in paths],
+        "size": total_bytes
     })
 
 
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Ingestion progress: status, chunks done/total, bytes and rate.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/metrics/jobs")
+def get_job_stats():
+    """
+    Ingestion worker pool and queue depth.
+    """
+    return get_job_manager().stats()
+
+
 @app.get("/")
 def read_root():
     return {"Hello": "FastAPI File Uploader is running! Go to */uploadfile/* for file upload."}
 
 
+@app.get("/metrics/db")
+def get_db_pool_stats():
+    """
+    Connection pool usage per database (checked out, overflow, peak, ...).
+    """
+    return pool_stats()
+
+
+@app.get("/metrics/cache")
+def get_cache_stats():
+    """
+    Query embedding and retrieval result cache hit/miss counters.
+    """
+    return {
+        "query_embeddings": get_query_cache().stats(),
+        "retrieval_results": get_retrieval_cache().stats(),
+    }
+
+
+@app.get("/metrics/models")
+def get_model_stats():
+    """
+    Re-ranking model load time and reuse counters.
+    """
+    return model_stats()
+
+
+@app.get("/metrics/embeddings")
+def get_embedding_stats():
+    """
+    Azure embedding client throughput, retries and rate-limit state.
+    """
+    return get_embedding_client().stats()
+
+
 @app.post("/chat/")
 async def ai_chat_endpoint(user_query: str, thread_id: str, sources: str, model: str):
     print(f"user_query: '{type(user_query)}', '{user_query}'")
@@ -169,8 +301,8 @@ async def ai_chat_endpoint(user_query: str, thread_id: str, sources: str, model:
 
         print("Outs:", sources, model)
 
-        # Call the RAG Agent
-        ai_respons = RAG_agent(
+        # Call the RAG Agent (async: doesn't block the event loop)
+        ai_respons = await aRAG_agent(
             user_message=user_query, 
             thread_id=thread_id,
             model = model,
@@ -0,0 +1,69 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from utils.excel_text import format_cell, iter_excel_chunks, rows_to_text, _row_text
+
+
+ROWS = [
+    [1, 5, 1.5, "alpha"],
+    [2, None, 2.0, "beta"],
+    [3, 7, None, None],
+    [4, 8, 2.5, "delta"],
+    [5, None, None, datetime.datetime(2024, 1, 2, 3, 4)],
+]
+
+
+def _workbook(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sheet"
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_both_readers_give_the_same_chunks(tmp_path):
+    # An all-number column with gaps is read as float64 by pandas only
+    path = _workbook(tmp_path / "mixed.xlsx", ROWS)
+
+    streamed = list(iter_excel_chunks(path, chunk_size=40, chunk_overlap=5, streaming=True))
+    parsed = list(iter_excel_chunks(path, chunk_size=40, chunk_overlap=5, streaming=False))
+
+    assert streamed == parsed
+    assert not any(".0 " in chunk or chunk.endswith(".0") for *_, chunk in streamed)
+
+
+def test_rows_to_text_matches_row_text():
+    df = pd.DataFrame({
+        "id": [1, 2, 3],
+        "count": [5, np.nan, 7],
+        "rate": [1.5, 2.0, np.nan],
+    })
+    rows = [tuple(None if pd.isna(v) else v for v in row) for row in df.itertuples(index=False)]
+
+    assert rows_to_text(df) == [_row_text(row) for row in rows]
+    assert rows_to_text(df) == ["1 | 5 | 1.5", "2 | 2", "3 | 7"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    (np.nan, None),
+    (pd.NaT, None),
+    (5, "5"),
+    (5.0, "5"),
+    (np.float64(7.0), "7"),
+    (np.int64(7), "7"),
+    (2.5, "2.5"),
+    (True, "True"),
+    (np.bool_(False), "False"),
+    (datetime.datetime(2024, 1, 2), "2024-01-02 00:00:00"),
+    (np.datetime64("2024-01-02"), "2024-01-02 00:00:00"),
+    ("5.0", "5.0"),
+])
+def test_format_cell(value, expected):
+    assert format_cell(value) == expected
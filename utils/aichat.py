@@ -1,4 +1,5 @@
-import os, uuid, json
+import os, uuid, json, hashlib
+from typing import Optional
 from pathlib import Path
 # from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.checkpoint.memory import InMemorySaver, MemorySaver
@@ -14,13 +15,15 @@ from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from langchain.agents import create_agent
+from langchain.chat_models import init_chat_model
 from langchain.tools import tool
 
 from psycopg_pool import ConnectionPool
 
 from utils.json_checkpointer import JSONCheckpointSaver
 from utils.pgsql_checkpointer import PostgresCheckpointSaver
-from utils.vector import retrive
+from utils.vector import search
+from utils.lru import LRUCache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -159,7 +162,7 @@ def data_retriever(user_request: str):
     print("user_request:\n", user_request)
     print()
     try:
-        existing_content = retrive(user_request, collection_name=collection_name)
+        existing_content = search(user_request, collection_name=collection_name)
         try:
             print(existing_content[0])
             print(existing_content[0][1])
@@ -178,7 +181,6 @@ DB_URL = os.getenv("PG_VECTOR")
 # _connection_pool = None
 # _store = None
 _checkpointer = None
-_graph = None
 
 
 openai_model = AzureChatOpenAI(
@@ -189,36 +191,84 @@ openai_model = AzureChatOpenAI(
     temperature=0,
 )
 
+# --- Graph / LLM cache ---
+# One compiled graph per (source, model, prompt version), bounded LRU.
+# The old single `_graph` silently kept whatever model was picked first.
 
-def get_graph(source: bool, model: int):
+GRAPH_CACHE_SIZE = int(os.getenv("GRAPH_CACHE_SIZE", "8"))
 
-    print("use Document Source" if source else "use Web Source")
-    tool, prompt = ([data_retriever], doc_prompt) if source else ([], web_prompt)
+PROMPT_VERSIONS = {
+    True: hashlib.sha1(doc_prompt.encode("utf-8")).hexdigest()[:12],
+    False: hashlib.sha1(web_prompt.encode("utf-8")).hexdigest()[:12],
+}
+
+_graph_cache = LRUCache(maxsize=GRAPH_CACHE_SIZE)
+_llm_cache = LRUCache(maxsize=GRAPH_CACHE_SIZE)
 
-    llm = {
+
+def _get_llm(model: int):
+    """Chat model client for the UI model index, created once and reused."""
+    spec = {
         0: "google_genai:gemini-2.5-flash",
         1: "groq:openai/gpt-oss-120b",
         2: openai_model,
         3: "ollama:glm-4.6:cloud"
     }.get(model, "ollama:glm-4.6:cloud")
 
+    if not isinstance(spec, str):
+        return spec
+    return _llm_cache.get_or_set(spec, lambda: init_chat_model(spec))
+
+
+def _get_checkpointer():
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = PostgresCheckpointSaver(postgres_url=DB_URL)
+        # _checkpointer = JSONCheckpointSaver(sessions_folder="sessions")
+    return _checkpointer
+
+
+def invalidate_graphs(source: Optional[bool] = None, model: Optional[int] = None) -> int:
+    """
+    Drops cached graphs matching source/model (None = any). Returns the count.
+    """
+    dropped = _graph_cache.invalidate(
+        lambda key: (source is None or key[0] == source)
+        and (model is None or key[1] == model)
+    )
+    if source is None and model is None:
+        _llm_cache.invalidate()
+    print(f"♻️ Invalidated {dropped} cached graph(s)")
+    return dropped
+
+
+def graph_cache_stats():
+    return {"graphs": _graph_cache.stats(), "llms": _llm_cache.stats()}
+
+
+def get_graph(source: bool, model: int):
+
+    print("use Document Source" if source else "use Web Source")
+    key = (bool(source), model, PROMPT_VERSIONS[bool(source)])
+    return _graph_cache.get_or_set(key, lambda: _build_graph(bool(source), model))
+
+
+def _build_graph(source: bool, model: int):
+
+    tool, prompt = ([data_retriever], doc_prompt) if source else ([], web_prompt)
+
+    llm = _get_llm(model)
+
     # llm = os.getenv("MODEL")
-    print(llm, DB_URL[-20:])
+    print("🔧 building graph:", llm, DB_URL[-20:])
     print(prompt[:50])
-    # rag_agent = create_agent(
-    #     name="RAG_agent",
-    #     model=llm,
-    #     tools=tool,
-    #     system_prompt=prompt,
-    # )
-
-    global _checkpointer, _graph
-    if _graph is not None:
-        return _graph
-        
-    _checkpointer = PostgresCheckpointSaver(postgres_url=DB_URL)
-    # _checkpointer = JSONCheckpointSaver(sessions_folder="sessions")
-    
+    rag_agent = create_agent(
+        name="RAG_agent",
+        model=llm,
+        tools=tool,
+        system_prompt=prompt,
+    )
+
     # Build graph with direct RAG agent call
     def call_rag_agent(state: MessagesState):
         """Call RAG agent directly without nesting."""
@@ -228,13 +278,7 @@ def get_graph(source: bool, model: int):
             return {"messages": []}
         
         # Call the RAG agent directly
-        # response = rag_agent.invoke({"messages": messages})
-        response = create_agent(
-            name="RAG_agent",
-            model=llm,
-            tools=tool,
-            system_prompt=prompt,
-        ).invoke({"messages": messages})
+        response = rag_agent.invoke({"messages": messages})
         return {"messages": response["messages"]}
     
     # Build graph
@@ -242,15 +286,13 @@ def get_graph(source: bool, model: int):
     builder.add_node("call_rag_agent", call_rag_agent)
     builder.add_edge(START, "call_rag_agent")
     
-    _graph = builder.compile(checkpointer=_checkpointer)
-    
-    return _graph
+    return builder.compile(checkpointer=_get_checkpointer())
 
 
 def RAG_agent(user_message: str, thread_id: str, source: bool, model: int, user_id="1"):
     print("ai agent\n" * 3)
     print("Using persistent Postgres-backed graph")
-    graph = get_graph(source, model)  # ← This returns the same live graph every time
+    graph = get_graph(source, model)  # ← cached per (source, model, prompt version)
 
     config = {
         "configurable": {
@@ -20,7 +20,7 @@ from psycopg_pool import ConnectionPool
 
 from utils.json_checkpointer import JSONCheckpointSaver
 from utils.pgsql_checkpointer import PostgresCheckpointSaver
-from utils.vector import retrive
+from utils.vector import search
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -159,7 +159,7 @@ def data_retriever(user_request: str):
     print("user_request:\n", user_request)
     print()
     try:
-        existing_content = retrive(user_request, collection_name=collection_name)
+        existing_content = search(user_request, collection_name=collection_name)
         try:
             print(existing_content[0])
             print(existing_content[0][1])
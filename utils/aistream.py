@@ -6,10 +6,13 @@ from langgraph.graph import MessagesState, START, StateGraph
 from langgraph.checkpoint.postgres import PostgresSaver
 from langgraph.store.postgres import PostgresStore
 from langgraph.store.base import BaseStore
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.store.postgres.aio import AsyncPostgresStore
 
-from utils.vector import retrive
+from utils.vector import search
 import uuid
 import os
+from contextlib import AsyncExitStack
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -97,7 +100,7 @@ def data_retriever(user_request: str):
     print("user_request:\n", user_request)
     print()
     try:
-        existing_content = retrive(user_request, collection_name=collection_name)
+        existing_content = search(user_request, collection_name=collection_name)
         return existing_content
     
     except:
@@ -169,6 +172,80 @@ graph = builder.compile(
     checkpointer=checkpointer,
 )
 
+################################################################################
+# ------------------------- ASYNC STREAMING GRAPH ------------------------------
+################################################################################
+# Same node, but awaited end to end so /chat/stream can emit LLM tokens
+# (stream_mode="messages") without blocking the event loop.
+
+async def acall_model(
+    state: MessagesState,
+    config,
+    *,
+    store: BaseStore,
+):
+    user_id = config["configurable"]["user_id"]
+    namespace = ("memories", user_id)
+
+    last_user_msg = state["messages"][-1].content
+
+    # ---------------- Load memories -----------------------
+    memories = await store.asearch(namespace, query=last_user_msg)
+    memory_text = "\n".join([m.value["data"] for m in memories])
+    sys_msg = f"USER_MEMORIES:\n{memory_text}"
+
+    # ---------------- Store new memory ---------------------
+    if "remember" in last_user_msg.lower():
+        memory_value = last_user_msg.replace("remember", "").strip()
+        if memory_value:
+            await store.aput(namespace, str(uuid.uuid4()), {"data": memory_value})
+
+    # ---------------- Call agent ----------------------------
+    # Passing config through is what lets the graph surface the agent's
+    # LLM tokens in stream_mode="messages"
+    final_messages = [{"role": "system", "content": sys_msg}] + state["messages"]
+    response = await rag_agent.ainvoke({"messages": final_messages}, config)
+
+    return {"messages": response["messages"]}
+
+
+_async_stack = None
+_async_graph = None
+
+
+async def open_async_graph():
+    """
+    Opens the async Postgres store/checkpointer and compiles the streaming graph.
+    Call once from the FastAPI startup hook; close_async_graph() on shutdown.
+    """
+    global _async_stack, _async_graph
+    if _async_graph is not None:
+        return _async_graph
+
+    stack = AsyncExitStack()
+    astore = await stack.enter_async_context(AsyncPostgresStore.from_conn_string(DB_URI))
+    acheckpointer = await stack.enter_async_context(AsyncPostgresSaver.from_conn_string(DB_URI))
+
+    abuilder = StateGraph(MessagesState)
+    abuilder.add_node("call_model", acall_model)
+    abuilder.add_edge(START, "call_model")
+
+    _async_stack = stack
+    _async_graph = abuilder.compile(
+        store=astore,
+        checkpointer=acheckpointer,
+    )
+    return _async_graph
+
+
+async def close_async_graph():
+    global _async_stack, _async_graph
+    if _async_stack is not None:
+        await _async_stack.aclose()
+    _async_stack = None
+    _async_graph = None
+
+
 ################################################################################
 # ----------------------------- PUBLIC FUNCTION --------------------------------
 ################################################################################
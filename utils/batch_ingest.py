@@ -0,0 +1,350 @@
+import os
+import shutil
+import multiprocessing
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Dict, List, Optional, Any, Tuple
+from uuid import uuid4
+
+from utils.chunking import parse_file, file_type
+from utils.manifest import chunk_hash, load_manifest, add_entries, remove_entries, ManifestDiff
+from utils.db_pool import get_engine
+from utils.model_registry import get_model
+from utils.retrieval_cache import bump_collection_version
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Multi-file ingestion ---
+#
+# Files are parsed/chunked in a process pool, blob uploads run on a few
+# threads, and every file's chunks go through one shared embedding batcher,
+# so a set of small files still produces full EMBED_BATCH_SIZE batches.
+# A sink decides how chunks are embedded and where they are stored; it is
+# told when a document's last chunk is in (finish) and when the run ends
+# (close), to release per-document state.
+
+INGEST_PROCESSES = int(os.getenv("INGEST_PROCESSES", "0")) or None
+INGEST_UPLOAD_THREADS = int(os.getenv("INGEST_UPLOAD_THREADS", "4"))
+INGEST_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Zip bomb guard: limits on what one batch's archives may expand to
+ZIP_MAX_BYTES = int(os.getenv("ZIP_MAX_BYTES", str(1024 * 1024 * 1024)))
+ZIP_MAX_ENTRIES = int(os.getenv("ZIP_MAX_ENTRIES", "2000"))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def expand_upload(
+    path: str,
+    dest_dir: str,
+    max_bytes: int = ZIP_MAX_BYTES,
+    max_entries: int = ZIP_MAX_ENTRIES
+) -> List[str]:
+    """
+    A .zip expands to its files (flattened, no path traversal); anything else is itself.
+
+    Raises UploadTooLarge when the archive has more than max_entries files or
+    more than max_bytes uncompressed. Header sizes can lie, so the bytes
+    actually written are counted too; nothing extracted is left behind.
+    """
+    if not str(path).lower().endswith(".zip"):
+        return [str(path)]
+
+    paths = []
+    written = 0
+    try:
+        with zipfile.ZipFile(path) as archive:
+            members = [
+                info for info in archive.infolist()
+                if not (info.is_dir() or not os.path.basename(info.filename)
+                        or os.path.basename(info.filename).startswith(".") or "__MACOSX" in info.filename)
+            ]
+            if len(members) > max_entries:
+                raise UploadTooLarge(f"{os.path.basename(path)} has {len(members)} files (limit {max_entries})")
+            if sum(info.file_size for info in members) > max_bytes:
+                raise UploadTooLarge(f"{os.path.basename(path)} expands past {max_bytes} bytes")
+
+            for info in members:
+                name = os.path.basename(info.filename)
+                target = os.path.join(dest_dir, name)
+                if os.path.exists(target):
+                    stem, ext = os.path.splitext(name)
+                    target = os.path.join(dest_dir, f"{stem}-{uuid4().hex[:6]}{ext}")
+                paths.append(target)
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    while True:
+                        block = src.read(1024 * 1024)
+                        if not block:
+                            break
+                        written += len(block)
+                        if written > max_bytes:
+                            raise UploadTooLarge(f"{os.path.basename(path)} expands past {max_bytes} bytes")
+                        dst.write(block)
+    except BaseException:
+        for target in paths:
+            if os.path.exists(target):
+                os.remove(target)
+        raise
+    return paths
+
+
+def save_batch(files: List[Tuple[str, BinaryIO]], batch_dir: str) -> Tuple[List[str], int]:
+    """
+    Writes uploaded (filename, file object) pairs into batch_dir and expands
+    .zip archives. Returns (paths to ingest, bytes received). Blocking disk
+    and zip work: the endpoints run it with asyncio.to_thread.
+
+    The zip limits hold for the whole batch, not per archive; UploadTooLarge
+    when they are exceeded.
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    paths = []
+    total_bytes = 0
+    zip_bytes, zip_entries = ZIP_MAX_BYTES, ZIP_MAX_ENTRIES
+    for filename, src in files:
+        location = os.path.join(batch_dir, os.path.basename(filename))
+        if os.path.exists(location):
+            # Same name twice: keep both files; ingest_files rejects the duplicate
+            location = os.path.join(batch_dir, uuid4().hex[:8], os.path.basename(location))
+            os.makedirs(os.path.dirname(location))
+        with open(location, "wb") as buffer:
+            shutil.copyfileobj(src, buffer)
+        total_bytes += os.path.getsize(location)
+
+        expanded = expand_upload(location, batch_dir, max_bytes=zip_bytes, max_entries=zip_entries)
+        if expanded != [location]:
+            os.remove(location)
+            zip_bytes -= sum(os.path.getsize(path) for path in expanded)
+            zip_entries -= len(expanded)
+        paths.extend(expanded)
+    return paths, total_bytes
+
+
+class PGVectorSink:
+    """Stores chunks in a langchain PGVector collection (utils stack)."""
+
+    def __init__(self, collection_name: str):
+        from utils.vector import vectordb
+        self.collection_name = collection_name
+        self.vector_store = vectordb(collection=collection_name)
+        self.engine = get_engine(os.environ["PG_VECTOR"])
+        self.model = get_model()
+
+    def load_manifest(self, document_key: str):
+        return load_manifest(self.engine, self.collection_name, document_key)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_tensor=False).tolist()
+
+    def write(self, items: List[Dict[str, Any]], embeddings: List[List[float]]):
+        ids = [uuid4().hex for _ in items]
+        self.vector_store.add_embeddings(
+            texts=[item["text"] for item in items],
+            embeddings=embeddings,
+            metadatas=[item["metadata"] for item in items],
+            ids=ids
+        )
+        by_document: Dict[str, list] = {}
+        for chunk_id, item in zip(ids, items):
+            by_document.setdefault(item["document_key"], []).append((chunk_id, item["metadata"]["content_hash"]))
+        for document_key, entries in by_document.items():
+            add_entries(self.engine, self.collection_name, document_key, entries)
+        bump_collection_version(self.collection_name)
+
+    def delete(self, document_key: str, chunk_ids: List[str]):
+        self.vector_store.delete(ids=chunk_ids)
+        remove_entries(self.engine, self.collection_name, document_key, chunk_ids)
+        bump_collection_version(self.collection_name)
+
+    def finish(self, document_key: str):
+        # Chunks and manifest entries are already stored per batch
+        pass
+
+    def close(self):
+        pass
+
+
+def ingest_files(
+    paths: List[str],
+    sink,
+    statuses: Optional[Dict[str, Dict[str, Any]]] = None,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+    upload: Optional[Callable[[str], str]] = None,
+    discard: Optional[Callable[[str], Any]] = None,
+    processes: Optional[int] = INGEST_PROCESSES,
+    batch_size: int = INGEST_BATCH_SIZE
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses, uploads, embeds and stores many files.
+
+    statuses: dict filled in place with per-file status (keyed by path), so a
+              job can report it while the batch is still running.
+    upload: blob upload returning the document link (default SeaweedFS).
+    discard: deletes an uploaded blob by link, for files that fail before
+             any chunk points at it (default SeaweedFS with the default upload).
+    Files are deduplicated against the manifest by file name, like
+    document_upload_vector, so a second file with the same name in one
+    batch is rejected rather than overwriting the first one's chunks.
+    """
+    if upload is None:
+        from utils.seaweed import upload_file as upload, get_seaweed_client
+        discard = discard or (lambda url: get_seaweed_client().delete(url))
+
+    statuses = statuses if statuses is not None else {}
+    paths = [str(path) for path in paths]
+    accepted: List[str] = []
+    names = set()
+    for path in paths:
+        if path in statuses:
+            continue
+        name = os.path.basename(path)
+        statuses[path] = {"name": name, "status": "queued", "chunks_total": None, "chunks_done": 0, "error": None}
+        if name in names:
+            statuses[path]["status"], statuses[path]["error"] = "failed", "duplicate file name in this batch"
+            continue
+        names.add(name)
+        accepted.append(path)
+
+    totals = {"done": 0, "total": 0, "parsed": 0}
+    pending: List[Dict[str, Any]] = []
+    diffs: Dict[str, ManifestDiff] = {}
+    remaining: Dict[str, int] = {}
+
+    def report():
+        if on_progress:
+            # The grand total is only final once every file is parsed
+            on_progress(totals["done"], totals["total"] if totals["parsed"] == len(accepted) else None)
+
+    def finish(path: str):
+        status = statuses[path]
+        try:
+            sink.finish(status["name"])
+        except Exception as e:
+            status["status"], status["error"] = "failed", f"finishing failed: {e}"
+        # Only drop old chunks once the new version is fully stored
+        vanished = diffs[path].vanished() if status["status"] != "failed" else []
+        if vanished:
+            try:
+                sink.delete(status["name"], vanished)
+            except Exception as e:
+                status["error"] = f"cleanup failed: {e}"
+        if status["status"] != "failed":
+            status["status"] = "done"
+        status["unchanged"] = diffs[path].kept
+        status["deleted"] = len(vanished)
+
+    def discard_blob(path: str):
+        # Blobs are uploaded while the file parses; one for a file that
+        # won't be stored is referenced by nothing
+        future = uploads.get(path)
+        if future is None or discard is None:
+            return
+
+        def delete(future):
+            if future.exception() is not None:
+                return
+            try:
+                discard(future.result())
+            except Exception as e:
+                print(f"⚠️ Could not delete blob of {statuses[path]['name']}: {e}")
+
+        future.add_done_callback(delete)
+
+    def flush():
+        batch = pending[:batch_size]
+        del pending[:batch_size]
+        try:
+            sink.write(batch, sink.embed([item["text"] for item in batch]))
+            failed = None
+        except Exception as e:
+            failed = str(e)
+            print(f"❌ Batch of {len(batch)} chunks failed: {e}")
+
+        for item in batch:
+            path = item["path"]
+            status = statuses[path]
+            if failed:
+                status["status"], status["error"] = "failed", failed
+            else:
+                status["chunks_done"] += 1
+            remaining[path] -= 1
+            if remaining[path] == 0:
+                finish(path)
+        totals["done"] += len(batch)
+        report()
+
+    try:
+        # spawn, not fork: this runs on a job thread of a process holding model
+        # weights, connection pools and other threads, whose locks a forked
+        # child would inherit in whatever state they were in
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as parsers, \
+                ThreadPoolExecutor(max_workers=INGEST_UPLOAD_THREADS, thread_name_prefix="blob") as uploaders:
+            uploads = {
+                path: uploaders.submit(upload, path.replace("\\", "/"))
+                for path in accepted if file_type(path) != "Unknown"
+            }
+            parsed = [parsers.submit(parse_file, path) for path in accepted]
+
+            for future in as_completed(parsed):
+                doc = future.result()
+                path, name = doc["path"], doc["name"]
+                status = statuses[path]
+                status["file_type"] = doc["file_type"]
+                totals["parsed"] += 1
+
+                if doc["error"]:
+                    status["status"], status["error"] = "failed", doc["error"]
+                    discard_blob(path)
+                    report()
+                    continue
+
+                try:
+                    file_url = uploads[doc["path"]].result()
+                except Exception as e:
+                    status["status"], status["error"] = "failed", f"blob upload failed: {e}"
+                    report()
+                    continue
+
+                try:
+                    diff = ManifestDiff(sink.load_manifest(name))
+                except Exception as e:
+                    status["status"], status["error"] = "failed", f"manifest lookup failed: {e}"
+                    discard_blob(path)
+                    report()
+                    continue
+                diffs[path] = diff
+                new_items = []
+                for text, metadata in zip(doc["texts"], doc["metadatas"]):
+                    content_hash = chunk_hash(text)
+                    if diff.keep(content_hash) is not None:
+                        continue
+                    new_items.append({
+                        "path": path,
+                        "document_key": name,
+                        "text": text,
+                        "metadata": {**metadata, "document_link": file_url, "document_key": name, "content_hash": content_hash},
+                    })
+
+                status["status"] = "embedding"
+                status["chunks_total"] = len(new_items)
+                totals["total"] += len(new_items)
+                remaining[path] = len(new_items)
+                if not new_items:
+                    finish(path)
+                pending.extend(new_items)
+
+                while len(pending) >= batch_size:
+                    flush()
+                report()
+
+        while pending:
+            flush()
+    finally:
+        # Releases what a sink holds for documents that never finished
+        sink.close()
+
+    done = sum(1 for status in statuses.values() if status["status"] == "done")
+    print(f"✅ Batch ingest completed → {done}/{len(statuses)} files, {totals['done']} chunks")
+    return statuses
@@ -0,0 +1,190 @@
+import os
+from typing import Dict, Any, Iterable, Iterator, List
+
+from docx import Document
+from docx.oxml.table import CT_Tbl
+from docx.oxml.text.paragraph import CT_P
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from utils.excel_text import iter_excel_chunks
+
+# --- File parsing / chunking ---
+#
+# Kept free of model, vector store and DB imports so it can run in worker
+# processes (batch uploads parse files in a process pool).
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 70
+
+# Streaming splitter: characters read per block / buffered before splitting
+STREAM_BLOCK_CHARS = int(os.getenv("STREAM_BLOCK_CHARS", str(256 * 1024)))
+STREAM_WINDOW_CHARS = int(os.getenv("STREAM_WINDOW_CHARS", str(1024 * 1024)))
+
+FILE_TYPES = {"xlsx": "Excel", "xls": "Excel", "txt": "Text", "md": "Markdown", "docx": "Word"}
+
+
+def file_type(path: str) -> str:
+    return FILE_TYPES.get(str(path).split(".")[-1].lower(), "Unknown")
+
+
+def _splitter(chunk_size: int, chunk_overlap: int, add_start_index: bool = False) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+        add_start_index=add_start_index,
+    )
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    return [doc.page_content for doc in _splitter(chunk_size, chunk_overlap).create_documents([text])]
+
+
+def iter_split_blocks(
+    blocks: Iterable[str],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    window: int = STREAM_WINDOW_CHARS
+) -> Iterator[str]:
+    """
+    Streaming split_text: consumes text blocks and yields chunks as soon as
+    `window` characters are buffered. The last chunk of every window is held
+    back and re-split with the following text (via its start_index), so
+    chunks never end at an arbitrary block boundary and keep the same
+    size/overlap limits as split_text(). Chunk edges can differ slightly
+    from a one-shot split near window boundaries. Memory is bounded by
+    `window`.
+    """
+    splitter = _splitter(chunk_size, chunk_overlap, add_start_index=True)
+    buffer = ""
+    for block in blocks:
+        buffer += block
+        if len(buffer) < window:
+            continue
+
+        docs = splitter.create_documents([buffer])
+        if not docs:
+            # Whitespace only
+            buffer = ""
+            continue
+        if len(docs) < 2:
+            continue
+        for doc in docs[:-1]:
+            yield doc.page_content
+        buffer = buffer[docs[-1].metadata["start_index"]:]
+
+    if buffer:
+        for doc in splitter.create_documents([buffer]):
+            yield doc.page_content
+
+
+def iter_file_blocks(path: str, block_size: int = STREAM_BLOCK_CHARS) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+
+def iter_split_file(path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """Chunks of a text/markdown file, read in blocks rather than whole."""
+    return iter_split_blocks(iter_file_blocks(path), chunk_size, chunk_overlap)
+
+
+def _heading_level(paragraph) -> int:
+    style = paragraph.style.name if paragraph.style is not None else ""
+    if style == "Title":
+        return 1
+    if style.startswith("Heading "):
+        try:
+            return int(style.split(" ", 1)[1])
+        except ValueError:
+            return 0
+    return 0
+
+
+def _table_rows(table) -> Iterator[str]:
+    for row in table.rows:
+        cells = []
+        for cell in row.cells:
+            text = " ".join(cell.text.split())
+            # Merged cells come back once per grid column
+            if not cells or cells[-1] != text:
+                cells.append(text)
+        if any(cells):
+            yield " | ".join(cells)
+
+
+def iter_docx_blocks(source) -> Iterator[str]:
+    """
+    Yields a Word document's text in body order, straight from memory:
+    paragraphs, headings as markdown ("## Scope") and tables one row per
+    line ("cell | cell"). `source` is a path or a binary file object.
+    """
+    doc = Document(source)
+    for child in doc.element.body.iterchildren():
+        if isinstance(child, CT_P):
+            paragraph = Paragraph(child, doc)
+            level = _heading_level(paragraph)
+            if level and paragraph.text.strip():
+                yield "#" * level + " " + paragraph.text
+            else:
+                yield paragraph.text
+        elif isinstance(child, CT_Tbl):
+            yield from _table_rows(Table(child, doc))
+
+
+def docx_text(source) -> str:
+    """Whole document as text (see iter_docx_blocks); nothing is written to disk."""
+    return "".join(block + "\n" for block in iter_docx_blocks(source))
+
+
+def parse_file(path: str) -> Dict[str, Any]:
+    """
+    Reads and chunks one file.
+
+    Returns {"name", "path", "file_type", "texts", "metadatas", "error"}; the
+    metadatas hold per-chunk fields (sheet, page, ...) without document_link,
+    which is only known after the blob upload.
+    """
+    path = str(path)
+    result: Dict[str, Any] = {
+        "name": os.path.basename(path),
+        "path": path,
+        "file_type": file_type(path),
+        "texts": [],
+        "metadatas": [],
+        "error": None,
+    }
+
+    try:
+        if result["file_type"] == "Excel":
+            for page_index, sheet_name, title, chunk_index, chunk in iter_excel_chunks(
+                path, CHUNK_SIZE, CHUNK_OVERLAP
+            ):
+                result["texts"].append(chunk)
+                result["metadatas"].append({
+                    "sheet_name": sheet_name,
+                    "page": page_index,
+                    "chunk": chunk_index,
+                    "title": title
+                })
+
+        elif result["file_type"] in ("Text", "Markdown", "Word"):
+            if result["file_type"] == "Word":
+                result["texts"] = list(iter_split_blocks(block + "\n" for block in iter_docx_blocks(path)))
+            else:
+                result["texts"] = list(iter_split_file(path))
+            result["metadatas"] = [{"chunk": index} for index in range(len(result["texts"]))]
+
+        else:
+            result["error"] = "file not supported"
+
+    except Exception as e:
+        result["error"] = str(e)
+
+    return result
@@ -0,0 +1,162 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Shared connection pools ---
+#
+# One pooled engine per database URL for the whole process. The checkpointer,
+# session API and vector stores all borrow from it instead of each opening
+# their own engine (and their own set of Postgres connections).
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Query timeout only; schema/maintenance DDL uses maintenance_connection()
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+_engines: Dict[str, Engine] = {}
+_sessionmakers: Dict[str, sessionmaker] = {}
+_counters: Dict[str, Dict[str, int]] = {}
+_lock = threading.Lock()
+
+
+def _track(url: str, engine: Engine):
+    counters = _counters.setdefault(url, {"connects": 0, "checkouts": 0, "checkins": 0, "peak_checked_out": 0})
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        counters["connects"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        counters["checkouts"] += 1
+        counters["peak_checked_out"] = max(counters["peak_checked_out"], engine.pool.checkedout())
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        counters["checkins"] += 1
+
+
+def get_engine(url: str, **overrides) -> Engine:
+    """
+    Returns the process-wide pooled engine for `url`, creating it on first use.
+
+    Pool sizing, pre-ping and the per-statement timeout come from the DB_*
+    environment variables; keyword overrides only apply on first creation.
+    """
+    if not url:
+        raise ValueError("Database URL is not set.")
+
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        engine = _engines.get(url)
+        if engine is not None:
+            return engine
+
+        options = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+        if DB_STATEMENT_TIMEOUT_MS:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+        options.update(overrides)
+
+        engine = create_engine(url, **options)
+        _track(url, engine)
+        _engines[url] = engine
+
+    print(f"🔌 Connection pool ready: {engine.url.render_as_string(hide_password=True)[-40:]}")
+    return engine
+
+
+def get_sessionmaker(url: str) -> sessionmaker:
+    """Shared sessionmaker bound to get_engine(url)."""
+    maker = _sessionmakers.get(url)
+    if maker is None:
+        maker = sessionmaker(autocommit=False, autoflush=False, bind=get_engine(url))
+        _sessionmakers[url] = maker
+    return maker
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Pool usage per database (password hidden)."""
+    stats = {}
+    for url, engine in list(_engines.items()):
+        pool = engine.pool
+        stats[engine.url.render_as_string(hide_password=True)] = {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "max_overflow": DB_MAX_OVERFLOW,
+            **_counters.get(url, {}),
+        }
+    return stats
+
+
+def dispose_all(url: Optional[str] = None):
+    """Closes pooled connections (all pools, or just `url`'s)."""
+    with _lock:
+        urls = [url] if url else list(_engines)
+        for key in urls:
+            engine = _engines.pop(key, None)
+            _sessionmakers.pop(key, None)
+            if engine is not None:
+                engine.dispose()
+
+
+@contextmanager
+def maintenance_connection(engine: Engine):
+    """
+    Autocommit connection with statement_timeout lifted, for schema and
+    maintenance DDL: CREATE TABLE, migrations, CREATE/REINDEX ... CONCURRENTLY
+    (which can't run in a transaction block). DB_STATEMENT_TIMEOUT_MS is
+    meant for queries; DDL that waits on locks or scans a large table would
+    be cancelled by it. The timeout is reset before the connection goes
+    back to the pool.
+    """
+    conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        conn.execute(text("SET statement_timeout = 0"))
+        yield conn
+    finally:
+        try:
+            # Back to the connection's startup value (the pool's -c option)
+            conn.execute(text("RESET statement_timeout"))
+        finally:
+            conn.close()
+
+
+def index_is_valid(conn, index_name: str) -> Optional[bool]:
+    """pg_index.indisvalid for `index_name`, or None if there is no such index."""
+    return conn.execute(text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name"
+    ), {"name": index_name}).scalar()
+
+
+def drop_invalid_index(conn, index_name: str) -> bool:
+    """
+    Drops `index_name` if a cancelled CONCURRENTLY build left it INVALID, so
+    CREATE INDEX IF NOT EXISTS doesn't skip it forever. True if dropped.
+    """
+    if index_is_valid(conn, index_name) is not False:
+        return False
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+    print(f"🗑️ Dropped invalid index {index_name}")
+    return True
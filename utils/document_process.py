@@ -1,22 +1,10 @@
 import os
-from docx import Document
 
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 
-from utils.vector import vector_upload, excel_upload
-from utils.seaweed import upload_file
-
-def docx_to_txt(docx_path):
-    base_path, _ = os.path.splitext(docx_path)
-    txt_path = base_path + ".txt"
-    doc = Document(docx_path)
-
-    with open(txt_path, "w", encoding="utf-8") as f:
-        for para in doc.paragraphs:
-            f.write(para.text + "\n")
-
-    print ("📃Word file Processing")
-    return txt_path
+from utils.vector import vector_upload, vector_upload_batch, vector_upload_stream, excel_upload
+from utils.seaweed import upload_file_async, blob_url, get_seaweed_client
+from utils.chunking import iter_split_blocks, iter_split_file, iter_docx_blocks
 
 def percentage(current, total):
     if total == 0:
@@ -25,60 +13,95 @@ def percentage(current, total):
     return int(percentage)
 
 def content_spliter(doc):
-    with open(doc) as f:
-        state_of_the_union = f.read()
-    
-    # print("book \n"*3, state_of_the_union)
-    print("book\n")
-
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=70,
-        length_function=len,
-        is_separator_regex=False,
-    )
-    
-    return text_splitter.create_documents([state_of_the_union])
+    """Chunks of a text file as Documents, read in blocks (see utils.chunking)."""
+    return [Document(page_content=chunk) for chunk in iter_split_file(doc)]
 
 
-def document_upload_vector(doc_location: str, doc_name: str, collection_name: str):
+def document_upload_vector(doc_location: str, doc_name: str, collection_name: str, on_progress=None,
+                           file_url: str = None, upload=None):
+    """
+    on_progress: optional on_progress(chunks_done, chunks_total) callback,
+                 used by the background ingestion jobs.
+    file_url, upload: blob URL and its pending upload Future when the file
+                      was already streamed to SeaweedFS (utils.upload_tee);
+                      otherwise the upload is started here.
+    """
 
     doc_for_upload = str(doc_location).replace("\\", "/")
-    file_url = upload_file(doc_for_upload)
     file_type = {"xlsx":"Excel","xls":"Excel","txt":"Text","md":"Markdown","docx":"Word"}.get(doc_for_upload.split('.')[-1].lower(), "Unknown")
     print(file_type)
+    if file_type == "Unknown":
+        if upload is not None:
+            # Already streamed by the caller: don't leave an orphaned blob
+            try:
+                get_seaweed_client().delete(upload.result())
+            except Exception as e:
+                print(f"⚠️ Could not remove blob of unsupported file {doc_name}: {e}")
+        # print("file not supported")
+        return "file not supported"
+
+    # The blob upload runs while the file is chunked and embedded; its URL is
+    # known up front, and the upload is awaited before reporting success
+    if upload is None:
+        file_url = blob_url(doc_for_upload)
+        upload = upload_file_async(doc_for_upload)
+    try:
+        # Old chunks are only replaced once the blob they link to is stored;
+        # if the upload failed, the chunks stored by this run are removed
+        result = _ingest(doc_location, doc_name, collection_name, file_type, file_url, on_progress,
+                         before_cleanup=upload.result)
+    finally:
+        upload_error = upload.exception()
+    if upload_error is not None:
+        raise RuntimeError(f"blob upload failed: {upload_error}") from upload_error
+    print("✅ Upload success")
+    print("File URL:", file_url)
+    return result
 
+
+def _ingest(doc_location, doc_name, collection_name, file_type, file_url, on_progress=None, before_cleanup=None):
     if file_type == "Excel":
         x = excel_upload(
             excel_path=doc_location,
             collection_name=collection_name,
             document_link=file_url,
+            on_progress=on_progress,
+            document_key=doc_name,
+            before_cleanup=before_cleanup
         )
+        failed = sum(1 for r in x if r["status"] == "failed")
+        if failed:
+            # Fails the ingestion job instead of reporting success
+            raise RuntimeError(f"{failed} of {len(x)} chunks failed to store")
         return 1
 
     elif file_type == "Text" or file_type == "Markdown" or file_type == "Word":
+        # Chunks are produced lazily and embedded batch by batch while the
+        # file is still being read, so memory stays bounded for huge files
         if file_type == "Word":
-            doc_location = docx_to_txt(doc_location)
-        texts = content_spliter(doc_location)
-        docs_len = len(texts)
-        print(docs_len)
-        for i in range(docs_len):
-            metadata = {
-                "document_link": file_url, 
-            }
+            # Paragraphs, headings and tables straight from the .docx, no .txt copy
+            print("📃Word file Processing")
+            texts = iter_split_blocks(block + "\n" for block in iter_docx_blocks(doc_location))
+        else:
+            texts = iter_split_file(doc_location)
+
+        def report(done, total):
+            if total:
+                print(f"completed {percentage(done, total)}%")
+            else:
+                print(f"completed {done} chunks")
+            if on_progress:
+                on_progress(done, total)
 
-            vector_upload(
-                data=texts[i].page_content,
-                metadata=metadata,
-                collection_name=collection_name
-            )
-            x = percentage(i+1, docs_len)
-            print(f"completed {x}%")
-        print(docs_len)
+        result = vector_upload_stream(
+            ((text, {"document_link": file_url}) for text in texts),
+            collection_name=collection_name,
+            on_progress=report,
+            document_key=doc_name,
+            before_cleanup=before_cleanup
+        )
+        print(result["total"])
+        if result["failed"]:
+            raise RuntimeError(f"{result['failed']} of {result['total']} chunks failed to store")
         return 1
-    
-    else: 
-        # print("file not supported")
-        return "file not supported"
-        
 
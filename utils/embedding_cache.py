@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from typing import Callable, List, Optional, Dict, Any
+
+from sqlalchemy import text
+
+from utils.lru import LRUCache
+from utils.db_pool import get_engine, maintenance_connection
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Query embedding cache ---
+#
+# The agent may retrieve up to 3 times per question and users repeat the same
+# policy questions, so query text -> vector is cached per embedding model.
+# In-process LRU+TTL first, then an optional shared tier (SQLite file or a
+# Postgres table) that other workers/restarts can reuse.
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+# "" (memory only) | "sqlite:<path>" | "postgres" | "postgres:<url>"
+QUERY_CACHE_TIER = os.getenv("QUERY_CACHE_TIER", "")
+
+
+def normalise_query(query: str) -> str:
+    """Case/whitespace/unicode-insensitive form used as the cache key."""
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def cache_key(model_name: str, query: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalise_query(query)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteTier:
+    """Shared on-disk tier; fine for several workers on one box."""
+
+    def __init__(self, path: str, ttl: float = QUERY_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embedding_cache ("
+                "key TEXT PRIMARY KEY, model TEXT, embedding TEXT, created_at REAL)"
+            )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[List[float]]:
+        row = self._conn().execute(
+            "SELECT embedding, created_at FROM query_embedding_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or (self.ttl and row[1] + self.ttl < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, model_name: str, embedding: List[float]):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embedding_cache VALUES (?, ?, ?, ?)",
+                (key, model_name, json.dumps(embedding), time.time())
+            )
+
+
+class PostgresTier:
+    """Shared tier in Postgres, visible to every worker and host."""
+
+    def __init__(self, url: str, ttl: float = QUERY_CACHE_TTL):
+        self.engine = get_engine(url)
+        self.ttl = ttl
+        # Waits on table locks; not subject to the pool's statement_timeout
+        with maintenance_connection(self.engine) as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS query_embedding_cache ("
+                "key VARCHAR(64) PRIMARY KEY, model TEXT, embedding DOUBLE PRECISION[], "
+                "created_at TIMESTAMPTZ DEFAULT now())"
+            ))
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self.engine.connect() as conn:
+            row = conn.execute(text(
+                "SELECT embedding FROM query_embedding_cache WHERE key = :key "
+                "AND (CAST(:ttl AS DOUBLE PRECISION) = 0 "
+                "OR created_at > now() - make_interval(secs => CAST(:ttl AS DOUBLE PRECISION)))"
+            ), {"key": key, "ttl": self.ttl or 0}).first()
+        return list(row[0]) if row else None
+
+    def set(self, key: str, model_name: str, embedding: List[float]):
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO query_embedding_cache (key, model, embedding) VALUES (:key, :model, :embedding) "
+                "ON CONFLICT (key) DO UPDATE SET embedding = EXCLUDED.embedding, created_at = now()"
+            ), {"key": key, "model": model_name, "embedding": list(embedding)})
+
+
+class QueryEmbeddingCache:
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL, tier=None):
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.tier = tier
+        self.tier_hits = 0
+        self.tier_errors = 0
+        self.embed_calls = 0
+
+    def get_or_embed(self, model_name: str, query: str, embed: Callable[[str], Any]) -> Optional[List[float]]:
+        """
+        Cached embedding of `query` for `model_name`; calls embed(query) on a miss.
+        A None result (failed embedding) is returned but never cached.
+        """
+        key = cache_key(model_name, query)
+
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            return embedding
+
+        if self.tier is not None:
+            try:
+                embedding = self.tier.get(key)
+            except Exception as e:
+                self.tier_errors += 1
+                print(f"⚠️ Query cache tier read failed: {e}")
+            if embedding is not None:
+                self.tier_hits += 1
+                self.memory.set(key, embedding)
+                return embedding
+
+        self.embed_calls += 1
+        embedding = embed(query)
+        if embedding is None:
+            return None
+        if hasattr(embedding, "tolist"):
+            embedding = embedding.tolist()
+
+        self.memory.set(key, embedding)
+        if self.tier is not None:
+            try:
+                self.tier.set(key, model_name, embedding)
+            except Exception as e:
+                self.tier_errors += 1
+                print(f"⚠️ Query cache tier write failed: {e}")
+        return embedding
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "tier": type(self.tier).__name__ if self.tier else None,
+            "tier_hits": self.tier_hits,
+            "tier_errors": self.tier_errors,
+            "embed_calls": self.embed_calls,
+        }
+
+
+_cache: Optional[QueryEmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def _tier_from_env():
+    spec = QUERY_CACHE_TIER.strip()
+    if not spec:
+        return None
+    if spec.startswith("sqlite:"):
+        return SQLiteTier(spec[len("sqlite:"):] or "query_cache.sqlite3")
+    if spec == "postgres":
+        return PostgresTier(os.getenv("PG_VECTOR"))
+    if spec.startswith("postgres:"):
+        return PostgresTier(spec[len("postgres:"):])
+    raise ValueError(f"Unknown QUERY_CACHE_TIER: {spec!r}")
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Process-wide query embedding cache configured from QUERY_CACHE_* env vars."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QueryEmbeddingCache(tier=_tier_from_env())
+    return _cache
@@ -0,0 +1,222 @@
+import datetime
+import numpy as np
+import pandas as pd
+from itertools import chain, islice
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+# --- Excel → text helpers shared by the PGVector, documents-table and Qdrant uploaders ---
+
+ROW_SEPARATOR = " | "
+
+
+def format_cell(value: Any) -> Optional[str]:
+    """
+    Text of one cell, None if it is empty. Both readers go through here, so a
+    workbook gives the same chunk text (and content hashes) whichever reader
+    its size picks: pandas upcasts an int column with gaps to float, so
+    integral numbers always print as ints ("5", never "5.0"), and dates
+    always print like a pandas Timestamp.
+    """
+    if value is None or (not isinstance(value, (str, bytes)) and pd.isna(value)):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value))
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        # Past 2**53 a float isn't an exact integer any more
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return str(int(value))
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, np.datetime64)):
+        return str(pd.Timestamp(value))
+    return str(value)
+
+
+_format_cells = np.frompyfunc(format_cell, 1, 1)
+
+
+def _format_column(column: pd.Series) -> np.ndarray:
+    """format_cell() over a column; float columns take a vectorised path."""
+    if column.dtype.kind != "f":
+        return _format_cells(column.to_numpy(dtype=object))
+
+    values = column.to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        integral = np.isfinite(values) & (values == np.trunc(values)) & (np.abs(values) < 2 ** 53)
+    cells = values.astype(str).astype(object)
+    cells[integral] = values[integral].astype(np.int64).astype(str)
+    cells[np.isnan(values)] = None
+    return cells
+
+
+def detect_title_and_header(df: pd.DataFrame) -> Tuple[Optional[str], Optional[int]]:
+    title = None
+    header_row = None
+
+    for i in range(min(5, len(df))):
+        row = df.iloc[i].map(format_cell).dropna()
+
+        if len(row) <= 2 and row.str.len().mean() > 20:
+            title = " ".join(row.tolist())
+            continue
+
+        if len(row) >= 3 and row.str.len().mean() < 25:
+            header_row = i
+            break
+
+    return title, header_row
+
+
+def rows_to_text(df: pd.DataFrame) -> List[str]:
+    """
+    Serialises every row as "a | b | c", skipping empty cells and blank rows.
+
+    Cells are rendered by format_cell(), like the streaming reader's rows;
+    the rows are then joined column by column with array operations, so
+    cost grows with the number of columns rather than a loop per row.
+    """
+    if df.size == 0:
+        return []
+
+    cells = np.column_stack([_format_column(column) for _, column in df.items()])
+    present = pd.notna(cells)
+
+    n_rows = cells.shape[0]
+    joined = np.full(n_rows, "", dtype=object)
+    started = np.zeros(n_rows, dtype=bool)
+
+    for j in range(cells.shape[1]):
+        col_present = present[:, j]
+        separator = np.where(col_present & started, ROW_SEPARATOR, "").astype(object)
+        cell = np.where(col_present, cells[:, j], "").astype(object)
+        joined = joined + separator + cell
+        started |= col_present
+
+    joined = pd.Series(joined, dtype=object)
+    return joined[joined.str.strip() != ""].tolist()
+
+
+def sheet_to_text(df: pd.DataFrame, title: Optional[str], header_row: Optional[int]) -> str:
+    blocks = []
+
+    if title:
+        blocks.append(f"TITLE: {title}")
+
+    if header_row is not None:
+        df = df.iloc[header_row + 1:]
+
+    blocks.extend(rows_to_text(df))
+
+    return "\n".join(blocks)
+
+
+def chunk_text(text: str, size: int = 1000, overlap: int = 70) -> List[str]:
+    chunks = []
+    start = 0
+    length = len(text)
+
+    while start < length:
+        end = start + size
+        chunks.append(text[start:end])
+        start = end - overlap
+
+    return chunks
+
+
+# --- Streaming reader ---
+
+
+def _stream_chunks(blocks: Iterable[str], size: int, overlap: int) -> Iterator[str]:
+    """
+    chunk_text() over "\n".join(blocks) without ever holding the joined text.
+    Yields exactly the same chunks; the buffer never grows past one chunk plus one row.
+    """
+    buf = ""
+    started = False
+
+    for block in blocks:
+        buf = buf + "\n" + block if started else block
+        started = True
+
+        while len(buf) >= size:
+            yield buf[:size]
+            buf = buf[size - overlap:]
+
+    if started:
+        yield from chunk_text(buf, size, overlap)
+
+
+def _row_text(row: tuple) -> str:
+    return ROW_SEPARATOR.join(text for text in map(format_cell, row) if text is not None)
+
+
+def iter_sheet_rows(excel_path: str) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """
+    Yields (sheet_name, rows) with rows read lazily in openpyxl read-only mode.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            # Read-only sheets can carry stale dimensions; pandas does the same reset
+            ws.reset_dimensions()
+            yield ws.title, ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def iter_excel_chunks(
+    excel_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 70,
+    detect_header: bool = True,
+    streaming: bool = True
+) -> Iterator[Tuple[int, str, Optional[str], int, str]]:
+    """
+    Yields (page_index, sheet_name, title, chunk_index, chunk) for every sheet.
+
+    streaming=True reads rows incrementally and chunks them as they arrive, so
+    memory is bounded by chunk size rather than workbook size. Title/header
+    detection runs on the first 5 rows only, exactly as detect_title_and_header
+    does on a full DataFrame. streaming=False parses each sheet with pandas.
+    """
+    if not streaming:
+        xls = pd.ExcelFile(excel_path, engine="openpyxl")
+        print(f"📄 Excel sheets detected: {xls.sheet_names}")
+
+        for page_index, sheet_name in enumerate(xls.sheet_names):
+            df = xls.parse(sheet_name, header=None)
+
+            title, header_row = detect_title_and_header(df) if detect_header else (None, None)
+            full_text = sheet_to_text(df, title, header_row)
+
+            if not full_text.strip():
+                continue
+
+            for chunk_index, chunk in enumerate(chunk_text(full_text, chunk_size, chunk_overlap)):
+                yield page_index, sheet_name, title, chunk_index, chunk
+        return
+
+    for page_index, (sheet_name, rows) in enumerate(iter_sheet_rows(excel_path)):
+        print(f"📄 Streaming sheet: {sheet_name}")
+
+        head = list(islice(rows, 5))
+        title, header_row = None, None
+        if detect_header and head:
+            title, header_row = detect_title_and_header(pd.DataFrame(head))
+
+        def blocks():
+            if title:
+                yield f"TITLE: {title}"
+
+            body = head[header_row + 1:] if header_row is not None else head
+            for row in chain(body, rows):
+                text = _row_text(row)
+                if text.strip():
+                    yield text
+
+        for chunk_index, chunk in enumerate(_stream_chunks(blocks(), chunk_size, chunk_overlap)):
+            yield page_index, sheet_name, title, chunk_index, chunk
@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from utils.db_pool import maintenance_connection, index_is_valid, drop_invalid_index
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Hybrid (keyword + vector) retrieval ---
+#
+# Exact terms such as policy IDs, acronyms and clause numbers are matched
+# poorly by CLIP/ada embeddings. Postgres full-text search over the chunk
+# text (websearch_to_tsquery + a GIN expression index) finds them, and
+# reciprocal rank fusion merges that ranking with the vector ranking, so the
+# first retrieval call already carries both kinds of hit.
+
+# vector | hybrid — what the data_retriever tools use
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+
+# Candidates taken from each ranking before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "30"))
+# RRF constant; 60 is the value from the original paper
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# Relative weight of the keyword ranking (vector ranking = 1.0)
+HYBRID_KEYWORD_WEIGHT = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+# Text search configuration; must match the one the GIN index was built with
+HYBRID_TS_CONFIG = os.getenv("HYBRID_TS_CONFIG", "english")
+
+# Seconds before re-checking an index that wasn't there / valid yet
+HYBRID_INDEX_RECHECK = float(os.getenv("HYBRID_INDEX_RECHECK", "60"))
+
+_ready: Set[Tuple[str, str]] = set()
+_checked: Dict[Tuple[str, str], float] = {}
+_ready_lock = threading.Lock()
+
+
+def rrf_fuse(
+    rankings: Sequence[Iterable[Hashable]],
+    k: int = HYBRID_RRF_K,
+    weights: Optional[Sequence[float]] = None
+) -> List[Tuple[Hashable, float]]:
+    """
+    Reciprocal rank fusion: every id scores sum(weight / (k + rank)) over the
+    rankings it appears in (rank from 1). Best first; ties keep the order of
+    first appearance.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
+
+
+def tsvector_sql(column: str, config: str = HYBRID_TS_CONFIG) -> str:
+    # Same expression in the index and the queries, or the index isn't used
+    return f"to_tsvector('{config}', coalesce({column}, ''))"
+
+
+def create_fts_index(engine: Engine, table: str, column: str, index_name: str, config: str = HYBRID_TS_CONFIG):
+    """
+    Builds the GIN full-text index on table(column). Meant for startup or an
+    admin path, never a query: CONCURRENTLY so inserts keep flowing, on a
+    connection without the pool's statement_timeout, and an INVALID index
+    left by a cancelled build is dropped first.
+    """
+    st = time.perf_counter()
+    with maintenance_connection(engine) as conn:
+        drop_invalid_index(conn, index_name)
+        conn.execute(text(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} USING gin ({tsvector_sql(column, config)})"
+        ))
+    with _ready_lock:
+        _ready.add((engine.url.render_as_string(hide_password=False), index_name))
+    print(f"✅ Full-text index ready: {index_name} in {time.perf_counter() - st:.1f}s")
+
+
+def create_fts_index_background(engine: Engine, table: str, column: str, index_name: str):
+    """create_fts_index on a daemon thread, so startup doesn't wait for the build."""
+    def build():
+        try:
+            create_fts_index(engine, table, column, index_name)
+        except Exception as e:
+            print(f"❌ Full-text index {index_name} failed: {e}")
+
+    threading.Thread(target=build, name=f"fts-{index_name}", daemon=True).start()
+
+
+def fts_index_ready(engine: Engine, index_name: str) -> bool:
+    """
+    True once index_name exists and is valid. Cheap on the query path: a
+    positive answer is kept, a negative one is re-checked at most every
+    HYBRID_INDEX_RECHECK seconds. Without the index, full-text search would
+    be a sequential scan, so hybrid retrieval uses vectors only until then.
+    """
+    key = (engine.url.render_as_string(hide_password=False), index_name)
+    if key in _ready:
+        return True
+    if time.time() - _checked.get(key, 0) < HYBRID_INDEX_RECHECK:
+        return False
+    _checked[key] = time.time()
+    with engine.connect() as conn:
+        valid = index_is_valid(conn, index_name)
+    if valid:
+        with _ready_lock:
+            _ready.add(key)
+        return True
+    print(f"⚠️ Full-text index {index_name} not ready; hybrid retrieval uses vectors only")
+    return False
+
+
+def keyword_search(
+    engine: Engine,
+    table: str,
+    id_column: str,
+    text_column: str,
+    query: str,
+    limit: int = HYBRID_CANDIDATES,
+    embedding: Optional[Sequence[float]] = None,
+    where: str = "",
+    params: Optional[Dict[str, Any]] = None,
+    config: str = HYBRID_TS_CONFIG
+) -> List[Dict[str, Any]]:
+    """
+    Full-text matches for `query` (web-search syntax: quotes, OR, -term),
+    best ts_rank_cd first: [{"id", "rank", "distance"}]. With `embedding`,
+    each hit also carries its cosine distance to it, so keyword-only hits get
+    the same score as vector hits.
+    """
+    tsvector = tsvector_sql(text_column, config)
+    distance = "embedding <=> CAST(:embedding AS vector)" if embedding is not None else "NULL"
+    sql = (
+        f"SELECT {id_column} AS id, ts_rank_cd({tsvector}, q) AS rank, {distance} AS distance "
+        f"FROM {table}, websearch_to_tsquery('{config}', :query) AS q "
+        f"WHERE {tsvector} @@ q {'AND ' + where + ' ' if where else ''}"
+        f"ORDER BY rank DESC LIMIT :limit"
+    )
+    values = {**(params or {}), "query": query, "limit": limit}
+    if embedding is not None:
+        values["embedding"] = "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql), values).mappings().all()
+    return [
+        {"id": row["id"], "rank": float(row["rank"]), "distance": None if row["distance"] is None else float(row["distance"])}
+        for row in rows
+    ]
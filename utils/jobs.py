@@ -0,0 +1,182 @@
+import os
+import time
+import queue
+import threading
+import traceback
+from uuid import uuid4
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.lru import LRUCache
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Background ingestion jobs ---
+#
+# /uploadfile/ saves the file, submits a job and returns its id straight away;
+# a small pool of worker threads drains a local queue and runs the ingestion.
+# Threads rather than processes: the embedding model, HTTP sessions and DB
+# pools are per process and the heavy work (encode, network, COPY) releases
+# the GIL anyway.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Finished jobs kept for /jobs/{id}
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name: str, bytes_total: Optional[int] = None):
+        self.id = uuid4().hex
+        self.name = name
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.bytes_total = bytes_total
+        self.chunks_done = 0
+        self.chunks_total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Extra live status, e.g. per-file progress of a batch upload
+        self.details: Optional[Dict[str, Any]] = None
+
+    def progress(self, done: int, total: Optional[int] = None):
+        """Progress callback handed to the ingestion function."""
+        self.chunks_done = done
+        if total is not None:
+            self.chunks_total = total
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        percent = None
+        if self.status == SUCCEEDED:
+            percent = 100
+        elif self.chunks_total:
+            percent = int(self.chunks_done / self.chunks_total * 100)
+
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "percent": percent,
+            "bytes_total": self.bytes_total,
+            "chunks_per_second": round(self.chunks_done / elapsed, 2) if elapsed else 0.0,
+            "bytes_per_second": round(self.bytes_total / elapsed, 2) if elapsed and self.bytes_total and self.finished_at else None,
+            "queued_seconds": round((self.started_at or time.time()) - self.created_at, 3),
+            "elapsed_seconds": round(elapsed, 3),
+            "result": self.result,
+            "error": self.error,
+            "details": self.details,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, history: int = JOB_HISTORY):
+        self.workers = max(1, workers)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._jobs = LRUCache(maxsize=history)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.running = 0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        print(f"🧵 Ingestion workers started: {self.workers}")
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            job, fn, args, kwargs = item
+            job.status = RUNNING
+            job.started_at = time.time()
+            with self._lock:
+                self.running += 1
+            try:
+                result = fn(*args, on_progress=job.progress, **kwargs)
+                # document_upload_vector reports unsupported files as a string
+                if isinstance(result, str):
+                    job.status, job.error = FAILED, result
+                else:
+                    job.status, job.result = SUCCEEDED, result
+                    if job.chunks_total is None:
+                        job.chunks_total = job.chunks_done
+            except Exception as e:
+                job.status, job.error = FAILED, str(e)
+                print(f"❌ Job {job.id} ({job.name}) failed: {e}")
+                traceback.print_exc()
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self.running -= 1
+                self._queue.task_done()
+                print(f"📦 Job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s")
+
+    def submit(self, fn: Callable, *args, name: str = "", bytes_total: Optional[int] = None, **kwargs) -> Job:
+        """
+        Queues fn(*args, on_progress=..., **kwargs) and returns its Job at once.
+        Raises JobQueueFull when JOB_QUEUE_SIZE jobs are already waiting.
+        """
+        self._start()
+        job = Job(name=name, bytes_total=bytes_total)
+        try:
+            self._queue.put_nowait((job, fn, args, kwargs))
+        except queue.Full:
+            raise JobQueueFull(f"{self._queue.qsize()} jobs already queued")
+        self._jobs.set(job.id, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "tracked_jobs": len(self._jobs),
+        }
+
+    def shutdown(self, wait: bool = True):
+        """Lets queued jobs finish, then stops the workers."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide job manager configured from JOB_* env vars."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
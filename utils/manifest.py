@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Iterable, Tuple, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from utils.db_pool import maintenance_connection
+
+# --- Per-document chunk manifest ---
+#
+# Records which stored chunk (vector id / row id) holds which content hash
+# for every (collection, document). Re-ingesting a document then only embeds
+# chunks whose text is new, keeps the rest untouched and deletes the ones
+# that disappeared, instead of piling up duplicate vectors.
+
+_ready: Set[str] = set()
+_ready_lock = threading.Lock()
+
+
+def chunk_hash(text_: str) -> str:
+    """Content hash stored in chunk metadata and in the manifest."""
+    return hashlib.sha256(text_.encode("utf-8")).hexdigest()
+
+
+def ensure_manifest(engine: Engine):
+    key = engine.url.render_as_string(hide_password=False)
+    if key in _ready:
+        return
+    with _ready_lock:
+        if key in _ready:
+            return
+        # Waits on table locks; not subject to the pool's statement_timeout
+        with maintenance_connection(engine) as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS document_manifest ("
+                "collection TEXT NOT NULL, "
+                "document_key TEXT NOT NULL, "
+                "chunk_id TEXT NOT NULL, "
+                "content_hash VARCHAR(64) NOT NULL, "
+                "updated_at TIMESTAMPTZ DEFAULT now(), "
+                "PRIMARY KEY (collection, document_key, chunk_id))"
+            ))
+        _ready.add(key)
+
+
+def load_manifest(engine: Engine, collection: str, document_key: str) -> Dict[str, List[str]]:
+    """content_hash -> [chunk_id, ...] currently stored for the document."""
+    ensure_manifest(engine)
+    existing: Dict[str, List[str]] = defaultdict(list)
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT content_hash, chunk_id FROM document_manifest "
+            "WHERE collection = :collection AND document_key = :document_key"
+        ), {"collection": collection, "document_key": document_key})
+        for content_hash, chunk_id in rows:
+            existing[content_hash].append(chunk_id)
+    return dict(existing)
+
+
+def add_entries(engine: Engine, collection: str, document_key: str, entries: Iterable[Tuple[str, str]]):
+    """Records (chunk_id, content_hash) pairs for newly stored chunks."""
+    params = [
+        {"collection": collection, "document_key": document_key, "chunk_id": str(chunk_id), "content_hash": content_hash}
+        for chunk_id, content_hash in entries
+    ]
+    if not params:
+        return
+    ensure_manifest(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO document_manifest (collection, document_key, chunk_id, content_hash) "
+            "VALUES (:collection, :document_key, :chunk_id, :content_hash) "
+            "ON CONFLICT (collection, document_key, chunk_id) "
+            "DO UPDATE SET content_hash = EXCLUDED.content_hash, updated_at = now()"
+        ), params)
+
+
+def remove_entries(engine: Engine, collection: str, document_key: str, chunk_ids: Iterable[str]):
+    chunk_ids = [str(chunk_id) for chunk_id in chunk_ids]
+    if not chunk_ids:
+        return
+    ensure_manifest(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "DELETE FROM document_manifest "
+            "WHERE collection = :collection AND document_key = :document_key "
+            "AND chunk_id = ANY(:chunk_ids)"
+        ), {"collection": collection, "document_key": document_key, "chunk_ids": chunk_ids})
+
+
+class ManifestDiff:
+    """
+    Matches a re-ingested document's chunks against its manifest, in a single
+    streaming pass. Duplicate texts are counted, so a chunk that appears
+    twice needs two stored copies to be fully "unchanged".
+
+        diff = ManifestDiff(load_manifest(...))
+        for chunk in chunks:
+            if diff.keep(chunk_hash(chunk)) is None:
+                ...embed and store it...
+        delete(diff.vanished())
+    """
+
+    def __init__(self, existing: Optional[Dict[str, List[str]]] = None):
+        self._unmatched = {content_hash: list(ids) for content_hash, ids in (existing or {}).items()}
+        self.kept = 0
+        self.new = 0
+
+    def keep(self, content_hash: str) -> Optional[str]:
+        """Id of an already stored chunk with this content, or None if it must be embedded."""
+        ids = self._unmatched.get(content_hash)
+        if ids:
+            self.kept += 1
+            return ids.pop()
+        self.new += 1
+        return None
+
+    def vanished(self) -> List[str]:
+        """Stored chunk ids no longer present in the document."""
+        return [chunk_id for ids in self._unmatched.values() for chunk_id in ids]
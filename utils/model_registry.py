@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+from typing import Dict, Any, Optional
+
+from sentence_transformers import SentenceTransformer
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Process-wide model registry ---
+#
+# Loading SentenceTransformer weights is the expensive part of every upload
+# and retrieval, so each model is loaded once per process and shared.
+
+DEFAULT_MODEL = os.getenv("EMBEDDING_MODEL", "clip-ViT-B-32")
+
+_models: Dict[str, Any] = {}
+_stats: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_load_locks: Dict[str, threading.Lock] = {}
+
+
+def _new_stats() -> Dict[str, Any]:
+    return {"loads": 0, "load_seconds": 0.0, "reuse": 0, "loaded_at": None}
+
+
+def get_model(model_name: Optional[str] = None, loader=SentenceTransformer):
+    """
+    Returns the shared model instance for `model_name`, loading it on first use.
+
+    Only one thread loads a given model; concurrent callers wait for it
+    instead of loading their own copy.
+    """
+    model_name = model_name or DEFAULT_MODEL
+
+    model = _models.get(model_name)
+    if model is not None:
+        with _lock:
+            _stats[model_name]["reuse"] += 1
+        return model
+
+    with _lock:
+        load_lock = _load_locks.setdefault(model_name, threading.Lock())
+        _stats.setdefault(model_name, _new_stats())
+
+    with load_lock:
+        # Another thread may have finished loading while we waited
+        model = _models.get(model_name)
+        if model is not None:
+            with _lock:
+                _stats[model_name]["reuse"] += 1
+            return model
+
+        st = time.perf_counter()
+        model = loader(model_name)
+        elapsed = time.perf_counter() - st
+
+        with _lock:
+            _models[model_name] = model
+            stats = _stats[model_name]
+            stats["loads"] += 1
+            stats["load_seconds"] += elapsed
+            stats["loaded_at"] = time.time()
+
+    print(f"🧠 Loaded model '{model_name}' in {elapsed:.2f}s")
+    return model
+
+
+def warm_up(*model_names: str):
+    """
+    Loads the given models (or the default one) ahead of the first request.
+    Meant to be called from the FastAPI startup hook.
+    """
+    for name in (model_names or (DEFAULT_MODEL,)):
+        get_model(name)
+
+
+def model_stats() -> Dict[str, Dict[str, Any]]:
+    """Load time and reuse counters per model."""
+    with _lock:
+        return {
+            name: {**stats, "loaded": name in _models}
+            for name, stats in _stats.items()
+        }
+
+
+def unload(model_name: Optional[str] = None):
+    """Drops a model (or all of them) from the registry; counters are kept."""
+    with _lock:
+        if model_name is None:
+            _models.clear()
+        else:
+            _models.pop(model_name, None)
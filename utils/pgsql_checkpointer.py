@@ -8,6 +8,8 @@ from sqlalchemy import create_engine, Column, String, Text, Integer, ForeignKey,
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from sqlalchemy.sql import func
 
+from utils.db_pool import get_engine, maintenance_connection
+
 # LangChain/LangGraph Imports
 from langgraph.checkpoint.base import BaseCheckpointSaver, Checkpoint, CheckpointTuple
 from langchain_core.runnables import RunnableConfig
@@ -90,8 +92,11 @@ class PostgresCheckpointSaver(BaseCheckpointSaver):
     """
     
     def __init__(self, postgres_url: str):
-        self.engine = create_engine(postgres_url)
-        Base.metadata.create_all(self.engine)
+        # Shared pool: the session API and vector store use the same engine
+        self.engine = get_engine(postgres_url)
+        # DDL on a maintenance connection: no query timeout on schema work
+        with maintenance_connection(self.engine) as conn:
+            Base.metadata.create_all(conn)
         self.Session = sessionmaker(bind=self.engine)
 
     def _serialize_message(self, msg: Any) -> Optional[Dict]:
@@ -5,6 +5,8 @@ from typing import List
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams, PointStruct
 
+from utils.excel_text import detect_title_and_header, sheet_to_text, chunk_text
+
 
 # =========================================================
 # CONFIG
@@ -54,55 +56,8 @@ def data_embedding(text: str) -> List[float]:
 # =========================================================
 # EXCEL HELPERS
 # =========================================================
-def detect_title_and_header(df: pd.DataFrame):
-    title = None
-    header_row = None
-
-    for i in range(min(5, len(df))):
-        row = df.iloc[i].dropna().astype(str)
-
-        if len(row) <= 2 and row.str.len().mean() > 20:
-            title = " ".join(row.tolist())
-            continue
-
-        if len(row) >= 3 and row.str.len().mean() < 25:
-            header_row = i
-            break
-
-    return title, header_row
-
-
-def sheet_to_text(df: pd.DataFrame, title: str | None, header_row: int | None):
-    blocks = []
-
-    if title:
-        blocks.append(f"TITLE: {title}")
-
-    if header_row is not None:
-        df.columns = df.iloc[header_row]
-        df = df.iloc[header_row + 1:]
-
-    for _, row in df.iterrows():
-        row_text = " | ".join(
-            [str(v) for v in row if pd.notna(v)]
-        )
-        if row_text.strip():
-            blocks.append(row_text)
-
-    return "\n".join(blocks)
-
-
-def chunk_text(text: str, size: int = 600, overlap: int = 100):
-    chunks = []
-    start = 0
-    length = len(text)
-
-    while start < length:
-        end = start + size
-        chunks.append(text[start:end])
-        start = end - overlap
-
-    return chunks
+# detect_title_and_header / sheet_to_text / chunk_text live in utils.excel_text
+# so all three uploaders flatten sheets the same (vectorised) way.
 
 
 # =========================================================
@@ -0,0 +1,56 @@
+import os
+from typing import Any, List, Tuple
+
+from sentence_transformers import CrossEncoder
+
+from utils.model_registry import get_model
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Cross-encoder re-ranking ---
+#
+# Optional second stage for data_retriever: over-fetch RERANK_CANDIDATES
+# chunks, score every (query, chunk) pair with a small local cross-encoder
+# in one batched pass, and hand only the best RERANK_TOP_N to the LLM.
+# Fewer, better chunks per tool call means a smaller prompt per turn.
+
+RERANK_ENABLED = os.getenv("RERANK", "false").lower() in ("1", "true", "yes", "on")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))
+# Characters of each chunk scored; the model only reads ~512 tokens anyway
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "2000"))
+
+
+def get_reranker() -> CrossEncoder:
+    """Shared cross-encoder, loaded once through the model registry."""
+    return get_model(RERANK_MODEL, loader=CrossEncoder)
+
+
+def rerank(
+    user_query: str,
+    results: List[Tuple[Any, float]],
+    top_n: int = RERANK_TOP_N
+) -> List[Tuple[Any, float]]:
+    """
+    Re-orders retrive()-style (doc, distance) pairs by cross-encoder
+    relevance and keeps the best `top_n`. The pairs keep their original
+    distance; the cross-encoder score goes to doc.metadata["rerank_score"].
+    """
+    if len(results) <= 1:
+        return results[:top_n]
+
+    model = get_reranker()
+    scores = model.predict(
+        [(user_query, doc.page_content[:RERANK_MAX_CHARS]) for doc, _ in results],
+        batch_size=len(results),
+        show_progress_bar=False,
+        convert_to_numpy=True
+    )
+
+    ranked = sorted(zip(results, scores), key=lambda pair: float(pair[1]), reverse=True)[:top_n]
+    for (doc, _), score in ranked:
+        doc.metadata["rerank_score"] = float(score)
+    return [pair for pair, _ in ranked]
+
@@ -0,0 +1,175 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple, Any, Hashable
+
+import numpy as np
+
+from sqlalchemy import text
+
+from utils.lru import LRUCache
+from utils.db_pool import get_engine, maintenance_connection
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Retrieval result cache ---
+#
+# Caches top-k (doc id, score) per (collection, query embedding, k, extra).
+# Every write to a collection bumps its version counter, and the version is
+# part of the key, so results from before an upload are never served again;
+# stale entries simply age out of the LRU. The counters live in a Postgres
+# row shared by every worker, so an upload handled by one worker also
+# invalidates the others' caches (within RETRIEVAL_VERSION_POLL seconds).
+
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "4096"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))
+# "" (per process, one worker only) | "postgres" | "postgres:<url>"
+RETRIEVAL_VERSION_STORE = os.getenv("RETRIEVAL_VERSION_STORE", "postgres" if os.getenv("PG_VECTOR") else "")
+# Seconds a worker trusts its last read of a collection's version
+RETRIEVAL_VERSION_POLL = float(os.getenv("RETRIEVAL_VERSION_POLL", "1"))
+
+_versions: Dict[str, int] = {}
+_checked: Dict[str, float] = {}
+_versions_lock = threading.Lock()
+_version_errors = 0
+
+
+class PostgresVersions:
+    """Collection version counters in a table every worker reads."""
+
+    def __init__(self, url: str):
+        self.engine = get_engine(url)
+        with maintenance_connection(self.engine) as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS retrieval_collection_versions ("
+                "collection TEXT PRIMARY KEY, version BIGINT NOT NULL)"
+            ))
+
+    def get(self, collection: str) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT version FROM retrieval_collection_versions WHERE collection = :collection"
+            ), {"collection": collection}).scalar() or 0
+
+    def bump(self, collection: str) -> int:
+        with self.engine.begin() as conn:
+            return conn.execute(text(
+                "INSERT INTO retrieval_collection_versions (collection, version) VALUES (:collection, 1) "
+                "ON CONFLICT (collection) DO UPDATE SET version = retrieval_collection_versions.version + 1 "
+                "RETURNING version"
+            ), {"collection": collection}).scalar()
+
+
+_store: Optional[PostgresVersions] = None
+_store_lock = threading.Lock()
+
+
+def _version_store() -> Optional[PostgresVersions]:
+    global _store
+    spec = RETRIEVAL_VERSION_STORE.strip()
+    if not spec:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if spec == "postgres":
+                    _store = PostgresVersions(os.getenv("PG_VECTOR"))
+                elif spec.startswith("postgres:"):
+                    _store = PostgresVersions(spec[len("postgres:"):])
+                else:
+                    raise ValueError(f"Unknown RETRIEVAL_VERSION_STORE: {spec!r}")
+    return _store
+
+
+def collection_version(collection: str) -> Optional[int]:
+    """
+    Current version of `collection`, re-read from the shared store at most
+    every RETRIEVAL_VERSION_POLL seconds. None if the store can't be read:
+    another worker may have written, so the cache is bypassed.
+    """
+    global _version_errors
+    store = _version_store()
+    if store is not None and time.monotonic() - _checked.get(collection, float("-inf")) >= RETRIEVAL_VERSION_POLL:
+        try:
+            version = store.get(collection)
+        except Exception as e:
+            _version_errors += 1
+            print(f"⚠️ Collection version read failed, skipping retrieval cache: {e}")
+            return None
+        with _versions_lock:
+            _versions[collection] = version
+            _checked[collection] = time.monotonic()
+    return _versions.get(collection, 0)
+
+
+def bump_collection_version(collection: str) -> int:
+    """Call after any write to `collection`; invalidates its cached results in every worker."""
+    global _version_errors
+    store = _version_store()
+    if store is not None:
+        try:
+            version = store.bump(collection)
+            with _versions_lock:
+                _versions[collection] = version
+                _checked[collection] = time.monotonic()
+            return version
+        except Exception as e:
+            _version_errors += 1
+            print(f"⚠️ Collection version bump failed: {e}")
+            # The shared counter didn't move; at least drop this worker's entries
+            if _cache is not None:
+                _cache.cache.invalidate(lambda key: key[0] == collection)
+            return _versions.get(collection, 0)
+
+    with _versions_lock:
+        _versions[collection] = _versions.get(collection, 0) + 1
+        return _versions[collection]
+
+
+def embedding_hash(embedding) -> str:
+    """Stable digest of a query vector (float32 bytes)."""
+    data = np.asarray(embedding, dtype=np.float32).tobytes()
+    return hashlib.sha1(data).hexdigest()
+
+
+class RetrievalCache:
+    def __init__(self, maxsize: int = RETRIEVAL_CACHE_SIZE, ttl: float = RETRIEVAL_CACHE_TTL):
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def _key(self, collection: str, embedding, k: int, extra: Hashable) -> tuple:
+        return (collection, collection_version(collection), embedding_hash(embedding), k, extra)
+
+    def get(self, collection: str, embedding, k: int, extra: Hashable = None) -> Optional[List[Tuple[Any, float]]]:
+        """Cached [(doc_id, score), ...] or None."""
+        key = self._key(collection, embedding, k, extra)
+        if key[1] is None:
+            return None
+        return self.cache.get(key)
+
+    def set(self, collection: str, embedding, k: int, hits: List[Tuple[Any, float]], extra: Hashable = None):
+        key = self._key(collection, embedding, k, extra)
+        if key[1] is not None:
+            self.cache.set(key, list(hits))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache.stats(),
+            "collection_versions": dict(_versions),
+            "version_store": RETRIEVAL_VERSION_STORE.split(":", 1)[0] or "process",
+            "version_errors": _version_errors,
+        }
+
+
+_cache: Optional[RetrievalCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RetrievalCache()
+    return _cache
@@ -1,13 +1,518 @@
 from uuid import uuid4
 import requests
 import os
+import io
+import time
+import random
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
 
-from bs4 import BeautifulSoup
-from urllib.parse import unquote
+from urllib.parse import quote, unquote
+from requests.adapters import HTTPAdapter
+
+from dotenv import load_dotenv
+load_dotenv()
 
 # from . import get_new_name
 
-image_db = os.getenv("RAILWAY_SEAWEED_DB")
+# SEAWEED_URL overrides the Railway URL, e.g. benchmarks/stub_seaweed_server.py
+image_db = (os.getenv("SEAWEED_URL") or os.getenv("RAILWAY_SEAWEED_DB") or "").rstrip("/")
+
+# --- SeaweedFS client ---
+#
+# One pooled session per process (keep-alive instead of a new TCP/TLS
+# connection per file), multipart bodies streamed from disk rather than
+# buffered, retries with backoff, and a small thread pool so an upload can
+# run while the file is chunked and embedded.
+
+SEAWEED_POOL_SIZE = int(os.getenv("SEAWEED_POOL_SIZE", "16"))
+SEAWEED_UPLOAD_THREADS = int(os.getenv("SEAWEED_UPLOAD_THREADS", "4"))
+SEAWEED_MAX_RETRIES = int(os.getenv("SEAWEED_MAX_RETRIES", "3"))
+SEAWEED_TIMEOUT = float(os.getenv("SEAWEED_TIMEOUT", "300"))
+# Blocks a streamed upload may buffer before the writer waits for the network
+SEAWEED_STREAM_BLOCKS = int(os.getenv("SEAWEED_STREAM_BLOCKS", "16"))
+# Filer listing: entries per page, and how long a folder's index is trusted
+SEAWEED_LIST_PAGE = int(os.getenv("SEAWEED_LIST_PAGE", "1000"))
+SEAWEED_INDEX_TTL = float(os.getenv("SEAWEED_INDEX_TTL", "300"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class MultipartFileStream:
+    """
+    multipart/form-data body for one file, read from disk block by block.
+    len() is the exact body size, so requests sends a Content-Length
+    instead of loading the file or falling back to chunked encoding.
+    """
+
+    def __init__(self, path: str, filename: Optional[str] = None, field: str = "file",
+                 content_type: str = "application/octet-stream"):
+        filename = (filename or os.path.basename(path)).replace('"', "%22")
+        self.boundary = uuid4().hex
+        head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode("utf-8")
+        tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+        self._file = open(path, "rb")
+        self._size = len(head) + os.fstat(self._file.fileno()).st_size + len(tail)
+        self._parts = [io.BytesIO(head), self._file, io.BytesIO(tail)]
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._size
+
+    def read(self, size: int = -1) -> bytes:
+        out = b""
+        while self._parts and (size < 0 or len(out) < size):
+            block = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if block:
+                out += block
+            else:
+                self._parts.pop(0)
+        return out
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class BlobStream:
+    """
+    Upload fed block by block while the bytes arrive (chunked transfer), so
+    a file can go to SeaweedFS in the same pass that saves it locally.
+
+        stream = client.open_stream("uploaded_files/report.xlsx")
+        for block in blocks:
+            stream.write(block)
+        future = stream.close()  # .result() -> URL
+
+    A streamed body can't be replayed, so if it fails the upload is retried
+    from `fallback_path` (the local copy) once writing is done.
+    """
+
+    _DONE = object()
+    _ABORT = object()
+
+    def __init__(self, client: "SeaweedClient", file_path: str, fallback_path: Optional[str] = None,
+                 max_blocks: int = SEAWEED_STREAM_BLOCKS):
+        self.client = client
+        self.file_path = file_path
+        self.fallback_path = fallback_path or file_path
+        self.url = client.url_for(file_path)
+        self.size = 0
+        self._blocks: "queue.Queue" = queue.Queue(maxsize=max(1, max_blocks))
+        self._sent: Future = Future()
+        self._result: Future = Future()
+        self.boundary = uuid4().hex
+        threading.Thread(target=self._send, name="seaweed-stream", daemon=True).start()
+
+    def _body(self):
+        filename = os.path.basename(self.file_path).replace('"', "%22")
+        yield (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        while True:
+            block = self._blocks.get()
+            if block is self._DONE:
+                break
+            if block is self._ABORT:
+                raise IOError("upload aborted by writer")
+            yield block
+        yield f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+    def _send(self):
+        try:
+            response = self.client.session.post(
+                self.url,
+                data=self._body(),
+                headers={"Content-Type": f"multipart/form-data; boundary={self.boundary}"},
+                timeout=self.client.timeout
+            )
+            response.raise_for_status()
+            self._sent.set_result(response)
+        except Exception as e:
+            self._sent.set_exception(e)
+
+    def _put(self, item):
+        # Once the request has failed nobody drains the queue
+        while not self._sent.done():
+            try:
+                self._blocks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, block: bytes):
+        if block:
+            self.size += len(block)
+            self._put(block)
+
+    def close(self) -> Future:
+        """Ends the body; the returned Future resolves once the blob is stored."""
+        self._put(self._DONE)
+        self._sent.add_done_callback(self._finish)
+        return self._result
+
+    def abort(self, reason: str = "aborted"):
+        """Drops the request (the server never sees a complete body); no retry."""
+        self._put(self._ABORT)
+        self._sent.add_done_callback(
+            lambda _: self._result.done() or self._result.set_exception(IOError(f"Upload of {self.file_path} {reason}"))
+        )
+        return self._result
+
+    def _finish(self, sent: Future):
+        if sent.exception() is None:
+            with self.client._lock:
+                self.client.uploads += 1
+                self.client.bytes_sent += self.size
+            self.client.index.record(self.file_path, self.size, sent.result())
+            self._result.set_result(self.url)
+            return
+
+        print(f"⏳ SeaweedFS streamed upload of {self.file_path} failed ({sent.exception()}), retrying from disk")
+        retry = self.client._executor.submit(self.client.upload, self.fallback_path, self.file_path)
+        retry.add_done_callback(
+            lambda f: self._result.set_exception(f.exception()) if f.exception() else self._result.set_result(f.result())
+        )
+
+
+def _parent(path: str) -> str:
+    return path.strip("/").rpartition("/")[0]
+
+
+class FilerIndex:
+    """
+    Local index of stored files (path -> name, size, etag, mtime), so
+    existence and duplicate checks are dict lookups instead of listing the
+    bucket.
+
+    A folder is loaded from the filer's paged JSON listing on first use and
+    re-listed in the background once SEAWEED_INDEX_TTL has passed, while
+    lookups keep answering from the current copy. Uploads and deletes made
+    through this client update it immediately (write-through).
+    """
+
+    def __init__(self, client: "SeaweedClient", ttl: float = SEAWEED_INDEX_TTL, page_size: int = SEAWEED_LIST_PAGE):
+        self.client = client
+        self.ttl = ttl
+        self.page_size = page_size
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._by_etag: Dict[str, set] = {}
+        self._loaded: Dict[str, float] = {}
+        # folder -> Event set when its in-flight listing finishes
+        self._refreshing: Dict[str, threading.Event] = {}
+        # Writes seen while a folder was being re-listed win over the listing
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.listings = 0
+        self.pages = 0
+
+    # --- filer listing ---
+
+    def iter_listing(self, folder: str) -> Iterator[Dict[str, Any]]:
+        """Files directly under `folder`, page by page via the lastFileName cursor."""
+        folder = folder.strip("/")
+        url = self.client.url_for(quote(folder) + "/")
+        last = ""
+        while True:
+            response = self.client.request(
+                "GET", url,
+                params={"limit": self.page_size, "lastFileName": last},
+                headers={"Accept": "application/json"}
+            )
+            response.raise_for_status()
+            page = response.json()
+            self.pages += 1
+            entries = page.get("Entries") or []
+            for entry in entries:
+                # os.ModeDir bit
+                if int(entry.get("Mode") or 0) & (1 << 31):
+                    continue
+                name = entry["FullPath"].rstrip("/").rsplit("/", 1)[-1]
+                chunks = entry.get("chunks") or []
+                yield {
+                    "name": name,
+                    "path": f"{folder}/{name}" if folder else name,
+                    "size": entry.get("FileSize", sum(int(c.get("size", 0)) for c in chunks)),
+                    "etag": entry.get("Md5") or (chunks[0].get("e_tag") if len(chunks) == 1 else None),
+                    "mtime": entry.get("Mtime"),
+                }
+            last = page.get("LastFileName") or (entries[-1]["FullPath"].rsplit("/", 1)[-1] if entries else "")
+            if not entries or not page.get("ShouldDisplayLoadMore") or not last:
+                return
+
+    def refresh(self, folder: str):
+        """Re-lists `folder` and swaps it into the index."""
+        folder = folder.strip("/")
+        started = time.time()
+        listed = {entry["path"]: entry for entry in self.iter_listing(folder)}
+        with self._lock:
+            for path in [p for p in self._entries if _parent(p) == folder and p not in listed]:
+                if self._touched.get(path, 0) < started:
+                    self._drop(path)
+            for path, entry in listed.items():
+                if self._touched.get(path, 0) < started:
+                    self._put(entry)
+            self._loaded[folder] = time.time()
+            # Only this folder's markers are settled by this listing
+            self._touched = {p: t for p, t in self._touched.items() if _parent(p) != folder or t >= started}
+            self.listings += 1
+
+    def _background_refresh(self, folder: str):
+        try:
+            self.refresh(folder)
+        except Exception as e:
+            print(f"❌ SeaweedFS listing of {folder} failed: {e}")
+        finally:
+            self._done_refreshing(folder)
+
+    def _start_refreshing(self, folder: str) -> Optional[threading.Event]:
+        """Claims the folder's listing; returns the running one's Event if already claimed."""
+        with self._lock:
+            running = self._refreshing.get(folder)
+            if running is None:
+                self._refreshing[folder] = threading.Event()
+            return running
+
+    def _done_refreshing(self, folder: str):
+        with self._lock:
+            event = self._refreshing.pop(folder, None)
+        if event is not None:
+            event.set()
+
+    def ensure(self, folder: str):
+        """Loads `folder` on first use; afterwards refreshes stale folders in the background."""
+        folder = folder.strip("/")
+        while self._loaded.get(folder) is None:
+            running = self._start_refreshing(folder)
+            if running is not None:
+                # Someone else is listing it; use their result (or retry if it failed)
+                running.wait()
+                continue
+            try:
+                self.refresh(folder)
+            finally:
+                self._done_refreshing(folder)
+            return
+
+        if time.time() - self._loaded[folder] < self.ttl:
+            return
+        if self._start_refreshing(folder) is None:
+            self.client._executor.submit(self._background_refresh, folder)
+
+    # --- lookups ---
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        path = path.strip("/")
+        self.ensure(_parent(path))
+        return self._entries.get(path)
+
+    def exists(self, path: str) -> bool:
+        return self.get(path) is not None
+
+    def with_etag(self, etag: str) -> List[str]:
+        """Paths already holding content with this etag (duplicate check)."""
+        return sorted(self._by_etag.get(etag, ()))
+
+    def list(self, folder: str) -> List[Dict[str, Any]]:
+        folder = folder.strip("/")
+        self.ensure(folder)
+        with self._lock:
+            return sorted((e for p, e in self._entries.items() if _parent(p) == folder), key=lambda e: e["name"])
+
+    # --- write-through ---
+
+    def _put(self, entry: Dict[str, Any]):
+        self._drop(entry["path"])
+        self._entries[entry["path"]] = entry
+        if entry.get("etag"):
+            self._by_etag.setdefault(entry["etag"], set()).add(entry["path"])
+
+    def _drop(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry and entry.get("etag"):
+            paths = self._by_etag.get(entry["etag"], set())
+            paths.discard(path)
+            if not paths:
+                self._by_etag.pop(entry["etag"], None)
+
+    def record(self, path: str, size: int, response: Optional[requests.Response] = None):
+        """Adds a file this process just uploaded."""
+        path = path.strip("/")
+        etag = None
+        if response is not None:
+            try:
+                etag = (response.json() or {}).get("eTag")
+            except ValueError:
+                pass
+            etag = etag or response.headers.get("ETag", "").strip('"') or None
+        with self._lock:
+            self._put({
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "size": size,
+                "etag": etag,
+                "mtime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            })
+            self._touched[path] = time.time()
+
+    def forget(self, path: str):
+        path = path.strip("/")
+        with self._lock:
+            self._drop(path)
+            self._touched[path] = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "folders": len(self._loaded),
+            "listings": self.listings,
+            "pages": self.pages,
+        }
+
+
+class SeaweedClient:
+    def __init__(
+        self,
+        base_url: str = image_db,
+        pool_size: int = SEAWEED_POOL_SIZE,
+        upload_threads: int = SEAWEED_UPLOAD_THREADS,
+        max_retries: int = SEAWEED_MAX_RETRIES,
+        timeout: float = SEAWEED_TIMEOUT
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, upload_threads), thread_name_prefix="seaweed")
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.index = FilerIndex(self)
+
+    def url_for(self, file_path: str) -> str:
+        """Where file_path ends up; known before the upload finishes."""
+        return f"{self.base_url}/{file_path.lstrip('/')}"
+
+    def request(self, method: str, url: str, body_factory=None, **kwargs) -> requests.Response:
+        """
+        Session request with retries on connection errors and 429/5xx.
+        body_factory builds a fresh body per attempt (a stream can't be rewound
+        once partly sent).
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        headers = kwargs.pop("headers", None) or {}
+        for attempt in range(self.max_retries + 1):
+            body = body_factory() if body_factory else None
+            try:
+                if body is not None:
+                    response = self.session.request(
+                        method, url, data=body, headers={**headers, "Content-Type": body.content_type}, **kwargs
+                    )
+                else:
+                    response = self.session.request(method, url, headers=headers, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                error = str(e)
+            finally:
+                if body is not None:
+                    body.close()
+
+            delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+            with self._lock:
+                self.retries += 1
+            print(f"⏳ SeaweedFS {method} {url} failed ({error}), retry in {delay:.1f}s")
+            time.sleep(delay)
+
+    def upload(self, file_path: str, remote_path: Optional[str] = None) -> str:
+        """Uploads file_path to remote_path (default: the same path) and returns its URL."""
+        upload_url = self.url_for(remote_path or file_path)
+        response = self.request("POST", upload_url, body_factory=lambda: MultipartFileStream(file_path))
+        response.raise_for_status()
+        size = os.path.getsize(file_path)
+        with self._lock:
+            self.uploads += 1
+            self.bytes_sent += size
+        self.index.record(remote_path or file_path, size, response)
+        return upload_url
+
+    def path_of(self, url: str) -> str:
+        """Inverse of url_for: the stored path of one of our URLs."""
+        if url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        return unquote(url.split("?", 1)[0]).strip("/")
+
+    def delete(self, url: str) -> requests.Response:
+        response = self.request("DELETE", url)
+        if response.ok or response.status_code == 404:
+            self.index.forget(self.path_of(url))
+        return response
+
+    def upload_async(self, file_path: str) -> Future:
+        """Starts the upload on the client's pool; .result() returns the URL."""
+        return self._executor.submit(self.upload, file_path)
+
+    def open_stream(self, file_path: str, fallback_path: Optional[str] = None) -> BlobStream:
+        """Upload to url_for(file_path) fed with write(); see BlobStream."""
+        return BlobStream(self, file_path, fallback_path)
+
+    async def aupload(self, file_path: str) -> str:
+        return await asyncio.wrap_future(self.upload_async(file_path))
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "uploads": self.uploads,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "index": self.index.stats(),
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client: Optional[SeaweedClient] = None
+_client_lock = threading.Lock()
+
+
+def get_seaweed_client() -> SeaweedClient:
+    """Process-wide SeaweedFS client configured from SEAWEED_* env vars."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SeaweedClient()
+    return _client
 
 
 # # def image_uplode(image_path: str, title: str, foulder: str):
@@ -31,21 +536,27 @@ image_db = os.getenv("RAILWAY_SEAWEED_DB")
 
 
 def upload_file(file_path: str):
-    filename = file_path.split("/")[-1]
-
-    upload_url = f"{image_db}/{file_path}"
-
-    with open(file_path, "rb") as f:
-        files = {"file": (filename, f)}
-        resp = requests.post(upload_url, files=files)
-
-    resp.raise_for_status()
+    upload_url = get_seaweed_client().upload(file_path)
 
     print("✅ Upload success")
     print("File URL:", upload_url)
     return upload_url
 
 
+def upload_file_async(file_path: str) -> Future:
+    """upload_file in the background; the URL is blob_url(file_path) either way."""
+    return get_seaweed_client().upload_async(file_path)
+
+
+def blob_url(file_path: str) -> str:
+    return get_seaweed_client().url_for(file_path)
+
+
+def blob_exists(file_path: str) -> bool:
+    """O(1) existence check against the cached filer index."""
+    return get_seaweed_client().index.exists(file_path)
+
+
 def image_download(image_url: str):
 
     # data = requests.get(image_url).content
@@ -53,7 +564,7 @@ def image_download(image_url: str):
     #     f.write(data)
     # return data
 
-    download = requests.get(image_url)
+    download = get_seaweed_client().request("GET", image_url)
     open('downloaded.jpg', 'wb').write(download.content)
     print("✅ File downloaded from SeaweedFS")
     return download
@@ -61,7 +572,7 @@ def image_download(image_url: str):
 
 def image_delete(image_url: str):
 
-    delete = requests.delete(image_url)
+    delete = get_seaweed_client().delete(image_url)
     print("✅ File deleted from SeaweedFS")
     return delete
 
@@ -71,19 +582,8 @@ def get_all_images():
     '''
     This function return all files in that foulder
     '''
-    url = f"{image_db}/mybucket/?list"
-
-    response = requests.get(url)
-    response.raise_for_status()
-
-    soup = BeautifulSoup(response.text, "html.parser")
-
-    files = []
-    for link in soup.find_all("a", href=True):
-        href = link["href"]
-        if href.startswith("/mybucket/") and not href.endswith("/"):
-            filename = unquote(href.split("/")[-1])  # decode %20 etc.
-            files.append(filename)
+    # Served from the cached filer index (JSON listing, paged)
+    files = [entry["name"] for entry in get_seaweed_client().index.list("mybucket")]
 
     print("✅ Files in folder:")
     # print(files)
@@ -0,0 +1,72 @@
+import os
+import hashlib
+from concurrent.futures import Future
+from typing import Any, BinaryIO, Dict, Optional
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- Single-pass upload ---
+#
+# /uploadfile/ used to copy the request body to disk, then upload_file read
+# the copy again for SeaweedFS, then the parser read it a third time. Here
+# the body is read once, block by block, and every block goes to the local
+# copy (which the parser reads, still in page cache) and a sha256 hasher.
+#
+# The streamed SeaweedFS upload (blob=True) is opt-in: its queue is bounded,
+# so for larger files the request would wait on the filer. The upload
+# endpoints leave it off and let the ingestion job upload the saved copy.
+
+UPLOAD_BLOCK_SIZE = int(os.getenv("UPLOAD_BLOCK_SIZE", str(1024 * 1024)))
+
+
+def tee_upload(
+    src: BinaryIO,
+    dest_path: str,
+    blob: bool = False,
+    block_size: int = UPLOAD_BLOCK_SIZE
+) -> Dict[str, Any]:
+    """
+    Copies `src` to `dest_path` while hashing it and, if `blob`, streaming it
+    to SeaweedFS under the same path.
+
+    Returns {"path", "size", "sha256", "file_url", "upload"}; "upload" is a
+    Future resolving to file_url once the blob is stored (None without blob),
+    so ingestion can start before the blob store has acknowledged it.
+    """
+    dest_path = str(dest_path).replace("\\", "/")
+    hasher = hashlib.sha256()
+    stream = None
+    if blob:
+        from utils.seaweed import get_seaweed_client
+        stream = get_seaweed_client().open_stream(dest_path)
+
+    size = 0
+    upload: Optional[Future] = None
+    try:
+        with open(dest_path, "wb") as dest:
+            while True:
+                block = src.read(block_size)
+                if not block:
+                    break
+                dest.write(block)
+                hasher.update(block)
+                if stream is not None:
+                    stream.write(block)
+                size += len(block)
+    except BaseException:
+        # Never let a truncated body reach SeaweedFS as a complete file
+        if stream is not None:
+            stream.abort("cancelled: local save failed")
+        raise
+
+    if stream is not None:
+        upload = stream.close()
+
+    return {
+        "path": dest_path,
+        "size": size,
+        "sha256": hasher.hexdigest(),
+        "file_url": stream.url if stream is not None else None,
+        "upload": upload,
+    }
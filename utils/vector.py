@@ -3,23 +3,38 @@ from langchain_core.documents import Document
 from langchain_postgres import PGVector
 
 import os
+import threading
 import requests
 from io import BytesIO
 from PIL import Image
-from sentence_transformers import SentenceTransformer
+
+from utils.model_registry import get_model, DEFAULT_MODEL
+from utils.excel_text import iter_excel_chunks
+from utils.db_pool import get_engine
+from utils.embedding_cache import get_query_cache
+from utils.retrieval_cache import get_retrieval_cache, bump_collection_version
+from utils.manifest import chunk_hash, load_manifest, add_entries, remove_entries, ManifestDiff
+from utils.rerank import RERANK_ENABLED, RERANK_CANDIDATES, RERANK_TOP_N, rerank
+from utils.hybrid import RETRIEVAL_MODE, HYBRID_CANDIDATES, HYBRID_KEYWORD_WEIGHT, rrf_fuse, create_fts_index_background, fts_index_ready, keyword_search
 
 from uuid import uuid4
-from typing import Optional
+from typing import Optional, List, Callable, Iterable, Tuple
 import pandas as pd
 
 from dotenv import load_dotenv
 load_dotenv()
 
+# Chunks per encode() call / add_embeddings() round-trip on the batched path
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+# Workbooks at least this large are read row by row instead of via pandas
+EXCEL_STREAMING_BYTES = int(float(os.getenv("EXCEL_STREAMING_MB", "25")) * 1024 * 1024)
+
 
 class CLIPEmbeddings(Embeddings):
-    def __init__(self, model_name="clip-ViT-B-32"):
-        from sentence_transformers import SentenceTransformer
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name=DEFAULT_MODEL):
+        # Shared instance from the registry, not a fresh load per store
+        self.model = get_model(model_name)
 
     def embed_documents(self, texts):
         return self.model.encode(texts, convert_to_tensor=False).tolist()
@@ -27,17 +42,32 @@ class CLIPEmbeddings(Embeddings):
     def embed_query(self, text):
         return self.model.encode(text, convert_to_tensor=False).tolist()
 
+# One PGVector per collection, all on the shared pooled engine. Creating a
+# store runs extension/collection setup queries, so it isn't done per call.
+_vector_stores = {}
+_vector_stores_lock = threading.Lock()
+
+
 def vectordb(collection: str):
-    return PGVector(
-        embeddings=CLIPEmbeddings(),
-        collection_name=collection,
-        connection=os.environ["PG_VECTOR"],
-        use_jsonb=True,
-    )
+    store = _vector_stores.get(collection)
+    if store is not None:
+        return store
+
+    with _vector_stores_lock:
+        store = _vector_stores.get(collection)
+        if store is None:
+            store = PGVector(
+                embeddings=CLIPEmbeddings(),
+                collection_name=collection,
+                connection=get_engine(os.environ["PG_VECTOR"]),
+                use_jsonb=True,
+            )
+            _vector_stores[collection] = store
+    return store
 
 def data_embedding(data: str):
-    
-    model = SentenceTransformer('clip-ViT-B-32')
+
+    model = get_model()
     try:
         if data.startswith("http://") or data.startswith("https://"):
             response = requests.get(data)
@@ -83,6 +113,7 @@ def vector_upload(
             embeddings=[embeddings],
             metadatas=[metadata]
         )
+        bump_collection_version(collection_name)
         print("✅ upload completed")
 
         return {"context": data, "collection_id": collection_name, "metadata": metadata}
@@ -93,6 +124,177 @@ def vector_upload(
         return {"context": data, "collection_id": collection_name, "metadata": metadata}
 
 
+def _confirm_or_discard(before_cleanup: Callable[[], object], collection_name: str,
+                        document_key: Optional[str], new_ids: List[str]):
+    """Runs before_cleanup; if it fails, deletes the chunks this run stored."""
+    try:
+        before_cleanup()
+    except Exception:
+        if new_ids:
+            vectordb(collection=collection_name).delete(ids=new_ids)
+            if document_key:
+                remove_entries(get_engine(os.environ["PG_VECTOR"]), collection_name, document_key, new_ids)
+            bump_collection_version(collection_name)
+            print(f"↩️ Removed {len(new_ids)} new chunks of {document_key or collection_name}")
+        raise
+
+
+def vector_upload_batch(
+    texts: List[str],
+    metadatas: List[dict],
+    collection_name: str,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    document_key: Optional[str] = None
+):
+    """
+    Batched counterpart of vector_upload for text chunks.
+
+    texts: chunk texts, in upload order.
+    metadatas: one metadata dict per chunk.
+    batch_size: chunks per encode() call and per add_embeddings() INSERT
+                (defaults to EMBED_BATCH_SIZE).
+    on_progress: called as on_progress(done, total) after every batch.
+    document_key: stable name of the source document. When given, chunks
+                  already stored for it (same content hash) are kept as-is,
+                  only new ones are embedded and vanished ones are deleted.
+    """
+    if len(texts) != len(metadatas):
+        raise ValueError("texts and metadatas must have the same length")
+
+    return vector_upload_stream(
+        zip(texts, metadatas),
+        collection_name=collection_name,
+        batch_size=batch_size,
+        on_progress=on_progress,
+        document_key=document_key,
+        total=len(texts)
+    )
+
+
+def vector_upload_stream(
+    chunks: Iterable[Tuple[str, dict]],
+    collection_name: str,
+    batch_size: Optional[int] = None,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+    document_key: Optional[str] = None,
+    total: Optional[int] = None,
+    before_cleanup: Optional[Callable[[], object]] = None
+):
+    """
+    Streaming form of vector_upload_batch: `chunks` is any iterable of
+    (text, metadata) pairs, consumed batch by batch, so embedding starts on
+    the first chunks while the source is still being read.
+
+    total: chunk count if known up front; only used for progress.
+    before_cleanup: called once every chunk is stored, before vanished chunks
+                    are deleted (e.g. waiting for the blob the chunks link
+                    to). If it raises, this run's new chunks are deleted
+                    again, the old ones are kept, and the error propagates.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    vector_store = vectordb(collection=collection_name)
+    model = get_model()
+
+    diff = None
+    if document_key:
+        engine = get_engine(os.environ["PG_VECTOR"])
+        diff = ManifestDiff(load_manifest(engine, collection_name, document_key))
+
+    seen = 0
+    stored = 0
+    failed = []
+    new_ids = []
+    batch = []
+
+    def flush():
+        nonlocal stored
+        positions = [position for position, _, _ in batch]
+        batch_texts = [text for _, text, _ in batch]
+        batch_metadatas = [metadata for _, _, metadata in batch]
+        ids = [uuid4().hex for _ in batch]
+
+        try:
+            embeddings = model.encode(
+                batch_texts,
+                batch_size=batch_size,
+                convert_to_tensor=False
+            ).tolist()
+
+            vector_store.add_embeddings(
+                texts=batch_texts,
+                embeddings=embeddings,
+                metadatas=batch_metadatas,
+                ids=ids
+            )
+            if diff is not None:
+                add_entries(engine, collection_name, document_key,
+                            zip(ids, (metadata["content_hash"] for metadata in batch_metadatas)))
+            stored += len(batch_texts)
+            new_ids.extend(ids)
+            bump_collection_version(collection_name)
+
+        except Exception as e:
+            print(f"❌ Batch upload failed (chunks {positions[0]}-{positions[-1]}): {e}")
+            failed.append({"start": positions[0], "size": len(batch_texts), "error": str(e)})
+
+        batch.clear()
+        if on_progress:
+            on_progress(seen, total)
+
+    for text, metadata in chunks:
+        position = seen
+        seen += 1
+        content_hash = chunk_hash(text)
+        if diff is not None and diff.keep(content_hash) is not None:
+            continue
+
+        metadata = {**metadata, "content_hash": content_hash}
+        if document_key:
+            metadata["document_key"] = document_key
+        batch.append((position, text, metadata))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    if before_cleanup is not None:
+        _confirm_or_discard(before_cleanup, collection_name, document_key, new_ids)
+
+    deleted = 0
+    # Only drop old chunks once the new version is fully stored
+    if diff is not None and not failed:
+        vanished = diff.vanished()
+        if vanished:
+            vector_store.delete(ids=vanished)
+            remove_entries(engine, collection_name, document_key, vanished)
+            bump_collection_version(collection_name)
+            deleted = len(vanished)
+        print(f"♻️ {document_key}: {diff.kept} chunks unchanged, {diff.new} embedded, {deleted} removed")
+
+    if on_progress:
+        on_progress(seen, seen)
+
+    print(f"✅ batch upload completed → {stored}/{seen} chunks stored")
+    return {
+        "collection_id": collection_name,
+        "stored": stored,
+        "total": seen,
+        "unchanged": diff.kept if diff else 0,
+        "deleted": deleted,
+        "failed": failed
+    }
+
+
+def _query_embedding(user_query: str):
+    return get_query_cache().get_or_embed(
+        DEFAULT_MODEL,
+        user_query,
+        lambda text: get_model().encode(text, convert_to_tensor=False)
+    )
+
+
 def retrive(
     user_query: str,
     collection_name: str,
@@ -106,84 +308,149 @@ def retrive(
     #     query=user_query,
     #     k=k
     # )
-    return vector_store.similarity_search_with_score(
-        query=user_query,
+    # Repeated / retried queries skip the encode() call entirely
+    query_embedding = _query_embedding(user_query)
+    if query_embedding is None:
+        return []
+
+    # Same query + same corpus version → reuse the top-k ids and scores
+    cache = get_retrieval_cache()
+    hits = cache.get(collection_name, query_embedding, k)
+    if hits is not None:
+        docs = {doc.id: doc for doc in vector_store.get_by_ids([doc_id for doc_id, _ in hits])}
+        if len(docs) == len(hits):
+            return [(docs[doc_id], score) for doc_id, score in hits]
+
+    results = vector_store.similarity_search_with_score_by_vector(
+        embedding=query_embedding,
         k=k
     )
+    if all(doc.id for doc, _ in results):
+        cache.set(collection_name, query_embedding, k, [(doc.id, score) for doc, score in results])
+    return results
 
 
-def excel_upload(
-    excel_path: str,
-    collection_name: str,
-    document_link: str,
-    chunk_size: int = 1000,
-    chunk_overlap: int = 70
-):
+FTS_INDEX = "ix_langchain_pg_embedding_fts"
+
+
+def build_hybrid_index():
     """
-    Excel → PGVector upload (DROP-IN REPLACEMENT)
+    Starts the full-text index build for hybrid_retrive in the background.
+    Called at startup; retrieval only checks that the index is ready.
+    """
+    create_fts_index_background(get_engine(os.environ["PG_VECTOR"]), "langchain_pg_embedding", "document", FTS_INDEX)
 
-    Uses:
-    - vectordb()
-    - data_embedding()
-    - PGVector.add_embeddings()
 
-    Metadata format:
-    {"document_link": "<document_link>"}
+def hybrid_retrive(
+    user_query: str,
+    collection_name: str,
+    k: Optional[int] = 10,
+    candidates: int = HYBRID_CANDIDATES
+):
+    """
+    retrive() fused with Postgres full-text search over the chunk text
+    (reciprocal rank fusion, see utils.hybrid). Same return shape: (doc,
+    cosine distance) pairs, best first.
     """
+    query_embedding = _query_embedding(user_query)
+    if query_embedding is None:
+        return []
 
-    import os
-    import pandas as pd
+    vector_store = vectordb(collection=collection_name)
+    cache = get_retrieval_cache()
+    hits = cache.get(collection_name, query_embedding, k, extra=("hybrid", user_query, candidates))
+    if hits is not None:
+        docs = {doc.id: doc for doc in vector_store.get_by_ids([doc_id for doc_id, _ in hits])}
+        if len(docs) == len(hits):
+            return [(docs[doc_id], score) for doc_id, score in hits]
 
-    # -------------------------
-    # Helpers (LOCAL)
-    # -------------------------
-    def detect_title_and_header(df):
-        title = None
-        header_row = None
+    vector_hits = retrive(user_query, collection_name=collection_name, k=candidates)
 
-        for i in range(min(5, len(df))):
-            row = df.iloc[i].dropna().astype(str)
+    engine = get_engine(os.environ["PG_VECTOR"])
+    # A keyword or fusion failure still leaves the vector ranking
+    try:
+        if not fts_index_ready(engine, FTS_INDEX):
+            return vector_hits[:k]
+        keyword_hits = keyword_search(
+            engine, "langchain_pg_embedding", "id", "document", user_query,
+            limit=candidates,
+            embedding=query_embedding,
+            where="collection_id = (SELECT uuid FROM langchain_pg_collection WHERE name = :collection)",
+            params={"collection": collection_name}
+        )
 
-            if len(row) <= 2 and row.str.len().mean() > 20:
-                title = " ".join(row.tolist())
-                continue
+        fused = rrf_fuse(
+            [[doc.id for doc, _ in vector_hits], [hit["id"] for hit in keyword_hits]],
+            weights=[1.0, HYBRID_KEYWORD_WEIGHT]
+        )[:k]
 
-            if len(row) >= 3 and row.str.len().mean() < 25:
-                header_row = i
-                break
+        docs = {doc.id: doc for doc, _ in vector_hits}
+        distances = {doc.id: score for doc, score in vector_hits}
+        distances.update({hit["id"]: hit["distance"] for hit in keyword_hits if hit["id"] not in distances})
+        missing = [doc_id for doc_id, _ in fused if doc_id not in docs]
+        if missing:
+            docs.update({doc.id: doc for doc in vector_store.get_by_ids(missing)})
 
-        return title, header_row
+        results = [(docs[doc_id], distances[doc_id]) for doc_id, _ in fused if doc_id in docs]
+    except Exception as e:
+        print(f"⚠️ Keyword search failed, using vector hits only: {e}")
+        return vector_hits[:k]
 
-    def sheet_to_text(df, title, header_row):
-        blocks = []
+    cache.set(
+        collection_name, query_embedding, k,
+        [(doc.id, score) for doc, score in results],
+        extra=("hybrid", user_query, candidates)
+    )
+    return results
 
-        if title:
-            blocks.append(f"TITLE: {title}")
 
-        if header_row is not None:
-            df.columns = df.iloc[header_row]
-            df = df.iloc[header_row + 1:]
+def search(user_query: str, collection_name: str, k: Optional[int] = None):
+    """
+    What the data_retriever tools call: retrive() or hybrid_retrive() per
+    RETRIEVAL_MODE, re-ranked when RERANK is on. Same (doc, distance) pairs;
+    k defaults to the retriever's own k, or RERANK_TOP_N when re-ranking.
+    """
+    # RETRIEVAL_MODE=hybrid adds full-text matches (exact IDs, acronyms)
+    retrieve = hybrid_retrive if RETRIEVAL_MODE == "hybrid" else retrive
+    if RERANK_ENABLED:
+        # Over-fetch, then keep the few chunks the cross-encoder rates best
+        candidates = retrieve(user_query, collection_name=collection_name, k=RERANK_CANDIDATES)
+        return rerank(user_query, candidates, top_n=k or RERANK_TOP_N)
+    if k is None:
+        return retrieve(user_query, collection_name=collection_name)
+    return retrieve(user_query, collection_name=collection_name, k=k)
 
-        for _, row in df.iterrows():
-            row_text = " | ".join(
-                [str(v) for v in row if pd.notna(v)]
-            )
-            if row_text.strip():
-                blocks.append(row_text)
 
-        return "\n".join(blocks)
+def excel_upload(
+    excel_path: str,
+    collection_name: str,
+    document_link: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 70,
+    streaming: Optional[bool] = None,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+    document_key: Optional[str] = None,
+    before_cleanup: Optional[Callable[[], object]] = None
+):
+    """
+    Excel → PGVector upload (DROP-IN REPLACEMENT)
 
-    def chunk_text(text):
-        chunks = []
-        start = 0
-        length = len(text)
+    Uses:
+    - vectordb()
+    - shared embedding model (encode in EMBED_BATCH_SIZE batches)
+    - PGVector.add_embeddings()
 
-        while start < length:
-            end = start + chunk_size
-            chunks.append(text[start:end])
-            start = end - chunk_overlap
+    streaming: read rows incrementally (openpyxl read-only) and embed chunks
+               as they arrive. None = stream workbooks >= EXCEL_STREAMING_MB.
+    on_progress: called as on_progress(done, None) after every batch; the
+                 total isn't known until the last sheet is read.
+    document_key: stable name of the workbook; re-uploads then only embed
+                  new/changed chunks and delete vanished ones.
+    before_cleanup: see vector_upload_stream.
 
-        return chunks
+    Metadata format:
+    {"document_link": "<document_link>"}
+    """
 
     # -------------------------
     # Validation
@@ -192,61 +459,97 @@ def excel_upload(
     if not os.path.exists(excel_path):
         raise FileNotFoundError(f"Excel file not found: {excel_path}")
 
+    if streaming is None:
+        streaming = os.path.getsize(excel_path) >= EXCEL_STREAMING_BYTES
+
     vector_store = vectordb(collection=collection_name)
-    xls = pd.ExcelFile(excel_path, engine="openpyxl")
+    model = get_model()
 
     results = []
-
-    print(f"📄 Excel sheets detected: {xls.sheet_names}")
+    new_ids = []
+    batch = []
+
+    diff = None
+    if document_key:
+        engine = get_engine(os.environ["PG_VECTOR"])
+        diff = ManifestDiff(load_manifest(engine, collection_name, document_key))
+
+    def flush():
+        texts = [chunk for chunk, _ in batch]
+        metadatas = [metadata for _, metadata in batch]
+        ids = [uuid4().hex for _ in batch]
+        try:
+            embeddings = model.encode(texts, batch_size=len(texts), convert_to_tensor=False).tolist()
+            vector_store.add_embeddings(
+                texts=texts,
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=ids
+            )
+            if diff is not None:
+                add_entries(engine, collection_name, document_key,
+                            zip(ids, (metadata["content_hash"] for metadata in metadatas)))
+            bump_collection_version(collection_name)
+            new_ids.extend(ids)
+            results.extend({
+                "status": "success",
+                "sheet": metadata["sheet_name"],
+                "chunk": metadata["chunk"]
+            } for metadata in metadatas)
+
+        except Exception as e:
+            print(f"❌ Upload failed (sheet={metadatas[0]['sheet_name']}, chunks={metadatas[0]['chunk']}-{metadatas[-1]['chunk']}): {e}")
+            results.extend({
+                "status": "failed",
+                "sheet": metadata["sheet_name"],
+                "chunk": metadata["chunk"],
+                "error": str(e)
+            } for metadata in metadatas)
+        batch.clear()
+        if on_progress:
+            on_progress(len(results), None)
 
     # -------------------------
     # Processing
     # -------------------------
-    for page_index, sheet_name in enumerate(xls.sheet_names):
-        df = xls.parse(sheet_name, header=None)
-
-        title, header_row = detect_title_and_header(df)
-        full_text = sheet_to_text(df, title, header_row)
-
-        if not full_text.strip():
-            continue
-
-        chunks = chunk_text(full_text)
-
-        for chunk_index, chunk in enumerate(chunks):
-            embedding = data_embedding(chunk)
-            if embedding is None:
+    for page_index, sheet_name, title, chunk_index, chunk in iter_excel_chunks(
+        excel_path, chunk_size, chunk_overlap, streaming=streaming
+    ):
+        metadata = {
+            "document_link": document_link,
+            "sheet_name": sheet_name,
+            "page": page_index,
+            "chunk": chunk_index,
+            "title": title,
+            "content_hash": chunk_hash(chunk)
+        }
+        if diff is not None:
+            metadata["document_key"] = document_key
+            if diff.keep(metadata["content_hash"]) is not None:
+                results.append({"status": "unchanged", "sheet": sheet_name, "chunk": chunk_index})
                 continue
-
-            metadata = {
-                "document_link": document_link,
-                "sheet_name": sheet_name,
-                "page": page_index,
-                "chunk": chunk_index,
-                "title": title
-            }
-
-            try:
-                vector_store.add_embeddings(
-                    texts=[chunk],
-                    embeddings=[embedding],
-                    metadatas=[metadata]
-                )
-
-                results.append({
-                    "status": "success",
-                    "sheet": sheet_name,
-                    "chunk": chunk_index
-                })
-
-            except Exception as e:
-                print(f"❌ Upload failed (sheet={sheet_name}, chunk={chunk_index}): {e}")
-                results.append({
-                    "status": "failed",
-                    "sheet": sheet_name,
-                    "chunk": chunk_index,
-                    "error": str(e)
-                })
+        batch.append((chunk, metadata))
+
+        if len(batch) >= EMBED_BATCH_SIZE:
+            flush()
+
+    if batch:
+        flush()
+
+    failed = sum(1 for result in results if result["status"] == "failed")
+    if before_cleanup is not None:
+        _confirm_or_discard(before_cleanup, collection_name, document_key, new_ids)
+
+    if diff is not None and not failed:
+        vanished = diff.vanished()
+        if vanished:
+            vector_store.delete(ids=vanished)
+            remove_entries(engine, collection_name, document_key, vanished)
+            bump_collection_version(collection_name)
+        print(f"♻️ {document_key}: {diff.kept} chunks unchanged, {diff.new} embedded, {len(vanished)} removed")
+    elif diff is not None:
+        # Keep the old version's chunks until the new one is fully stored
+        print(f"⚠️ {document_key}: {failed} chunks failed, old chunks kept")
 
     print(f"✅ Excel upload completed → {len(results)} chunks stored")
     return results